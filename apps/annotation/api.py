@@ -3,18 +3,55 @@ apps/annotation/api.py
 
 JSON API endpoints consumed by the annotation canvas JS component.
 All endpoints require login and return JSON.
+
+Read endpoints are async views on the async ORM, so under an ASGI server
+(see docker/compose.yaml) slow searches and exports wait on the database
+without holding a worker thread. Endpoints that write go through
+transactional model hooks and services, which the async ORM can't run; they
+stay sync and Django runs them in its thread pool.
 """
 
 import json
+import uuid
+from collections import defaultdict
+from datetime import date
 
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
-from django.shortcuts import get_object_or_404
+from django.core.exceptions import ValidationError
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.utils.dateparse import parse_datetime
+from django.utils.text import slugify
 from django.views.decorators.http import require_http_methods
 
-from apps.library.models import Page
+from apps.library.models import Document, Page
 from apps.projects.models import Project, EntityType, Entity
+from apps.projects.services.bulk_edit import bulk_change_type, bulk_set_metadata
+from apps.projects.services.entity_dates import TIMELINE_BINS, date_fields, timeline
+from apps.projects.services.entity_locations import (
+    clusters,
+    location_fields,
+    nearest,
+    parse_bbox,
+)
+from apps.projects.services.entity_query import (
+    EntityQueryError,
+    filter_entities,
+    next_cursor,
+    sort_entities,
+)
+from apps.projects.services.metadata_patch import StaleEntity, patch_metadata
+from networkAnnotation.live import document_channel, get_broker, project_channel
 from .models import Annotation
+from .serializers import (
+    aserialize_entity_types,
+    page_annotations,
+    serialize_annotation,
+    serialize_entity,
+    serialize_page,
+)
 
 
 def json_error(message, status=400):
@@ -31,17 +68,231 @@ def json_unauthorized():
 
 @login_required
 @require_http_methods(["GET"])
-def entity_types(request, project_id):
+async def entity_types(request, project_id):
     """
     Return all active entity types for a project.
     Used to populate the entity type picker toolbar in the canvas.
     """
-    project = get_object_or_404(Project, pk=project_id)
+    project = await aget_object_or_404(Project, pk=project_id, pending_delete=False)
+    return JsonResponse({"entity_types": await aserialize_entity_types(project)})
+
+
+# ---- ENTITY QUERY ----
+
+ENTITY_LIST_DEFAULT_LIMIT = 50
+ENTITY_LIST_MAX_LIMIT = 500
+
+
+@login_required
+@require_http_methods(["GET"])
+async def entity_list(request, project_id, entity_type_id):
+    """
+    List the entities of a type, filtered and sorted on their schema fields.
+
+    Query params:
+        filters -- (optional) JSON list, e.g. [{"field": "born", "op": "gte", "value": 1700}]
+                   ops: eq, ne, lt, lte, gt, gte, in, contains, startswith, isnull;
+                   overlaps, within on date fields ([start, end]);
+                   within_bbox on latlong fields ([west, south, east, north])
+        sort    -- (optional) field name, "-" prefix for descending
+        after   -- (optional) the `next` cursor of the previous page
+        limit   -- (optional) page size, default 50, max 500
+    Returns: { "entities": [...], "next": cursor or null }
+    """
+    entity_type = await aget_object_or_404(
+        EntityType, pk=entity_type_id, project_id=project_id, project__pending_delete=False
+    )
+
+    try:
+        filters = json.loads(request.GET.get("filters") or "[]")
+        limit = int(request.GET.get("limit", ENTITY_LIST_DEFAULT_LIMIT))
+    except ValueError:
+        return json_error("'filters' must be JSON and 'limit' an integer.")
+    if not isinstance(filters, list):
+        return json_error("'filters' must be a list.")
+    limit = max(1, min(limit, ENTITY_LIST_MAX_LIMIT))
+
+    qs = Entity.objects.filter(entity_type=entity_type).select_related("entity_type")
+    try:
+        qs = filter_entities(qs, entity_type, filters)
+        qs = sort_entities(
+            qs, entity_type, request.GET.get("sort"), request.GET.get("after")
+        )
+        # One extra row tells whether there is a next page
+        entities = [entity async for entity in qs[: limit + 1]]
+    except (EntityQueryError, ValidationError) as e:
+        return json_error(str(e))
+
+    has_more = len(entities) > limit
+    entities = entities[:limit]
+    return JsonResponse(
+        {
+            "entities": [serialize_entity(entity) for entity in entities],
+            "next": next_cursor(entities[-1]) if has_more else None,
+        }
+    )
+
+
+@login_required
+@require_http_methods(["GET"])
+async def entity_timeline(request, project_id, entity_type_id):
+    """
+    Histogram of the entities of a type over time, by one of its date fields.
+
+    Query params:
+        field -- the date field
+        bin   -- (optional) year, decade (default) or century
+        start -- (optional) ISO date; only count dates overlapping [start, end]
+        end   -- (optional) ISO date
+    Returns: { "bin": "...", "buckets": [{"year": 1750, "count": 12}, ...] }
+    """
+    entity_type = await aget_object_or_404(
+        EntityType, pk=entity_type_id, project_id=project_id, project__pending_delete=False
+    )
+
+    field = request.GET.get("field")
+    if field not in date_fields(entity_type.schema):
+        return json_error("'field' must be a date field of this entity type.")
+    bin_name = request.GET.get("bin", "decade")
+    if bin_name not in TIMELINE_BINS:
+        return json_error(f"'bin' must be one of {', '.join(TIMELINE_BINS)}.")
+    try:
+        start, end = (
+            date.fromisoformat(request.GET[key]) if request.GET.get(key) else None
+            for key in ("start", "end")
+        )
+    except ValueError:
+        return json_error("'start' and 'end' must be ISO dates.")
+
+    buckets = await sync_to_async(timeline)(entity_type.pk, field, bin_name, start, end)
+    return JsonResponse(
+        {
+            "bin": bin_name,
+            "buckets": [{"year": year, "count": count} for year, count in buckets],
+        }
+    )
+
+
+MAP_MAX_ZOOM = 22
+
+
+@login_required
+@require_http_methods(["GET"])
+async def entity_map(request, project_id, entity_type_id):
+    """
+    The entities of a type on a map viewport, clustered server-side.
+
+    Query params:
+        field -- the latlong field
+        bbox  -- the viewport as "west,south,east,north"
+        zoom  -- the map zoom level, 0-22; sets the cluster size
+    Returns: { "clusters": [{"geohash", "lat", "long", "count", "entity_id"}, ...] }
+             with the mean position of each cluster, and entity_id (else null)
+             when it is a single entity.
+    """
+    entity_type = await aget_object_or_404(
+        EntityType, pk=entity_type_id, project_id=project_id, project__pending_delete=False
+    )
+
+    field = request.GET.get("field")
+    if field not in location_fields(entity_type.schema):
+        return json_error("'field' must be a latlong field of this entity type.")
+    try:
+        bbox = parse_bbox(request.GET.get("bbox", ""))
+        zoom = int(request.GET.get("zoom", 0))
+    except ValueError as e:
+        return json_error(f"'bbox' and 'zoom' are invalid: {e}")
+    zoom = max(0, min(zoom, MAP_MAX_ZOOM))
+
+    return JsonResponse(
+        {
+            "clusters": [
+                {
+                    "geohash": cell,
+                    "lat": lat,
+                    "long": long,
+                    "count": count,
+                    "entity_id": entity_id,
+                }
+                for cell, count, lat, long, entity_id in await sync_to_async(
+                    clusters
+                )(entity_type.pk, field, bbox, zoom)
+            ]
+        }
+    )
+
+
+@login_required
+@require_http_methods(["GET"])
+async def entity_nearest(request, project_id, entity_type_id):
+    """
+    The entities of a type closest to a point.
+
+    Query params:
+        field -- the latlong field
+        lat   -- latitude of the point
+        long  -- longitude of the point
+        k     -- (optional) how many, default 10, max 100
+    Returns: { "entities": [{...entity, "distance_km": 1.2}, ...] } nearest first
+    """
+    entity_type = await aget_object_or_404(
+        EntityType, pk=entity_type_id, project_id=project_id, project__pending_delete=False
+    )
+
+    field = request.GET.get("field")
+    if field not in location_fields(entity_type.schema):
+        return json_error("'field' must be a latlong field of this entity type.")
+    try:
+        lat = float(request.GET["lat"])
+        long = float(request.GET["long"])
+        k = int(request.GET.get("k", 10))
+    except (KeyError, ValueError):
+        return json_error("'lat' and 'long' must be numbers and 'k' an integer.")
+    if not (-90 <= lat <= 90 and -180 <= long <= 180):
+        return json_error("'lat' and 'long' are out of range.")
+
+    rows = await sync_to_async(nearest)(entity_type.pk, field, lat, long, k)
+    entities = await Entity.objects.select_related("entity_type").ain_bulk(
+        [row[0] for row in rows]
+    )
+    return JsonResponse(
+        {
+            "entities": [
+                {**serialize_entity(entities[entity_id]), "distance_km": distance}
+                for entity_id, _, _, distance in rows
+                if entity_id in entities
+            ]
+        }
+    )
+
+
+EXPORT_CHUNK_SIZE = 2000
 
-    types = project.entity_types.filter(is_active=True).values(
-        "id", "name", "color", "schema"
+
+@login_required
+@require_http_methods(["GET"])
+async def entity_export(request, project_id, entity_type_id):
+    """
+    Stream all entities of a type as newline-delimited JSON, one entity (as
+    in entity_list) per line, fetched in chunks as the client reads.
+    """
+    entity_type = await aget_object_or_404(
+        EntityType, pk=entity_type_id, project_id=project_id, project__pending_delete=False
+    )
+    entities = (
+        Entity.objects.filter(entity_type=entity_type)
+        .select_related("entity_type")
+        .order_by("pk")
     )
-    return JsonResponse({"entity_types": list(types)})
+
+    async def lines():
+        async for entity in entities.aiterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield json.dumps(serialize_entity(entity)) + "\n"
+
+    response = StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+    filename = slugify(entity_type.name) or "entities"
+    response["Content-Disposition"] = f'attachment; filename="{filename}.ndjson"'
+    return response
 
 
 # ---- ENTITY SEARCH ----
@@ -49,7 +300,7 @@ def entity_types(request, project_id):
 
 @login_required
 @require_http_methods(["GET"])
-def entity_search(request, project_id):
+async def entity_search(request, project_id):
     """
     Type-ahead search of entities within a project.
 
@@ -57,7 +308,7 @@ def entity_search(request, project_id):
         q        -- search string (matched against display_name in metadata)
         type_id  -- (optional) filter by entity type UUID
     """
-    project = get_object_or_404(Project, pk=project_id)
+    project = await aget_object_or_404(Project, pk=project_id, pending_delete=False)
 
     q = request.GET.get("q", "").strip()
     type_id = request.GET.get("type_id")
@@ -73,19 +324,10 @@ def entity_search(request, project_id):
     # Search against display_name in the metadata JSON field
     # Uses PostgreSQL JSON containment -- works for exact prefix matches
     # For fuzzier matching this could be replaced with a trigram search later
-    qs = qs.filter(metadata__display_name__icontains=q)[:20]  # limit to 20 results
+    qs = qs.filter(metadata__display_name__icontains=q)
+    qs = qs.select_related("entity_type")[:20]  # limit to 20 results
 
-    results = [
-        {
-            "id": str(entity.id),
-            "display_name": entity.display_name,
-            "entity_type_id": str(entity.entity_type_id),
-            "entity_type_name": entity.entity_type.name,
-            "entity_type_color": entity.entity_type.color,
-            "metadata": entity.metadata,
-        }
-        for entity in qs
-    ]
+    results = [serialize_entity(entity) async for entity in qs]
 
     return JsonResponse({"entities": results})
 
@@ -95,87 +337,124 @@ def entity_search(request, project_id):
 
 @login_required
 @require_http_methods(["GET", "POST"])
-def annotations(request, page_id):
+async def annotations(request, page_id):
     """
     GET  -- return all annotations for a page (used on canvas load)
+            Optional `start` / `end` query params restrict the result to
+            annotations intersecting that window of the text.
     POST -- create a new annotation
     """
-    page = get_object_or_404(Page, pk=page_id)
+    if request.method == "POST":
+        return await sync_to_async(_create_annotation)(request, page_id)
 
-    if request.method == "GET":
-        annotations = page.annotations.select_related(
-            "entity", "entity__entity_type"
-        ).all()
+    # Reading annotations doesn't need the (potentially very long) page text
+    page = await aget_object_or_404(
+        Page.objects.defer("text"), pk=page_id, document__pending_delete=False
+    )
+    annotations = page_annotations(page)
 
-        results = [
-            {
-                "id": str(a.id),
-                "start_offset": a.start_offset,
-                "end_offset": a.end_offset,
-                "annotated_text": a.annotated_text,
-                "entity_id": str(a.entity_id),
-                "entity_display_name": a.entity.display_name,
-                "entity_type_id": str(a.entity.entity_type_id),
-                "entity_type_name": a.entity.entity_type.name,
-                "entity_type_color": a.entity.entity_type.color,
-                "entity_metadata": a.entity.metadata,
-            }
-            for a in annotations
-        ]
-
-        return JsonResponse({"annotations": results})
-
-    elif request.method == "POST":
+    if "start" in request.GET or "end" in request.GET:
         try:
-            data = json.loads(request.body)
-        except json.JSONDecodeError:
-            return json_error("Invalid JSON")
-
-        entity_id = data.get("entity_id")
-        start_offset = data.get("start_offset")
-        end_offset = data.get("end_offset")
-
-        # Validate required fields
-        if not all([entity_id, start_offset is not None, end_offset is not None]):
-            return json_error("entity_id, start_offset, and end_offset are required.")
-
-        entity = get_object_or_404(Entity, pk=entity_id)
-
-        # Snapshot the annotated text from the page
-        annotated_text = page.text[start_offset:end_offset]
-        if not annotated_text:
-            return json_error("No text found at the given offsets.")
-
-        annotation = Annotation(
-            page=page,
-            entity=entity,
-            start_offset=start_offset,
-            end_offset=end_offset,
-            annotated_text=annotated_text,
-        )
+            start = int(request.GET.get("start", 0))
+            end = int(request.GET["end"]) if "end" in request.GET else None
+        except ValueError:
+            return json_error("start and end must be integers.")
+        annotations = annotations.overlapping(start, end)
 
-        try:
-            annotation.full_clean()
-        except Exception as e:
-            return json_error(str(e))
+    results = [serialize_annotation(a) async for a in annotations]
 
-        annotation.save()
+    return JsonResponse({"annotations": results})
 
-        return JsonResponse(
-            {
-                "id": str(annotation.id),
-                "start_offset": annotation.start_offset,
-                "end_offset": annotation.end_offset,
-                "annotated_text": annotation.annotated_text,
-                "entity_id": str(annotation.entity_id),
-                "entity_display_name": annotation.entity.display_name,
-                "entity_type_id": str(annotation.entity.entity_type_id),
-                "entity_type_name": annotation.entity.entity_type.name,
-                "entity_type_color": annotation.entity.entity_type.color,
-                "entity_metadata": annotation.entity.metadata,
-            },
-            status=201,
-        )
+
+def _create_annotation(request, page_id):
+    page = get_object_or_404(Page, pk=page_id, document__pending_delete=False)
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return json_error("Invalid JSON")
+
+    entity_id = data.get("entity_id")
+    start_offset = data.get("start_offset")
+    end_offset = data.get("end_offset")
+
+    # Validate required fields
+    if not all([entity_id, start_offset is not None, end_offset is not None]):
+        return json_error("entity_id, start_offset, and end_offset are required.")
+
+    entity = get_object_or_404(Entity, pk=entity_id, project__pending_delete=False)
+
+    # Snapshot the annotated text from the page
+    annotated_text = page.text[start_offset:end_offset]
+    if not annotated_text:
+        return json_error("No text found at the given offsets.")
+
+    annotation = Annotation(
+        page=page,
+        entity=entity,
+        start_offset=start_offset,
+        end_offset=end_offset,
+        annotated_text=annotated_text,
+    )
+
+    try:
+        annotation.full_clean()
+    except Exception as e:
+        return json_error(str(e))
+
+    annotation.save()
+
+    return JsonResponse(serialize_annotation(annotation), status=201)
+
+
+@login_required
+@require_http_methods(["GET"])
+async def page_window(request, page_id):
+    """
+    GET -- return a window [start, end) of the page text, plus only the
+    annotations that intersect it. Used by the canvas to load long pages
+    incrementally while scrolling.
+
+    Query params:
+        start -- window start offset (default 0)
+        end   -- window end offset (default start + Page.TEXT_WINDOW_SIZE)
+
+    Returns: { "start": n, "end": n, "length": n, "text": "...", "annotations": [...] }
+    The returned `end` is clamped to the page length.
+    """
+    try:
+        start = int(request.GET.get("start", 0))
+        end = int(request.GET.get("end", start + Page.TEXT_WINDOW_SIZE))
+    except ValueError:
+        return json_error("start and end must be integers.")
+
+    if start < 0 or end <= start:
+        return json_error("Window must satisfy 0 <= start < end.")
+    # Don't let a single request pull an arbitrarily large slice
+    end = min(end, start + Page.TEXT_WINDOW_SIZE * 10)
+
+    page = await aget_object_or_404(
+        Page.objects.with_text_window(start, end),
+        pk=page_id,
+        document__pending_delete=False,
+    )
+    end = min(end, page.text_length)
+
+    window_annotations = page_annotations(page)
+    if start < end:
+        window_annotations = window_annotations.overlapping(start, end)
+    else:
+        # Past the end of the text: an empty window, and no range to build
+        window_annotations = window_annotations.none()
+
+    return JsonResponse(
+        {
+            "start": start,
+            "end": max(end, start),
+            "length": page.text_length,
+            "text": page.text_window,
+            "annotations": [serialize_annotation(a) async for a in window_annotations],
+        }
+    )
 
 
 @login_required
@@ -188,7 +467,7 @@ def annotations_bulk_update(request, page_id):
     Accepts: { "annotations": [{"id": "...", "start_offset": n, "end_offset": n, "annotated_text": "..."}, ...] }
     Returns: { "updated": n }
     """
-    page = get_object_or_404(Page, pk=page_id)
+    page = get_object_or_404(Page, pk=page_id, document__pending_delete=False)
 
     try:
         data = json.loads(request.body)
@@ -205,9 +484,13 @@ def annotations_bulk_update(request, page_id):
         if not ann_id:
             continue
         try:
-            ann = Annotation.objects.get(pk=ann_id, page=page)
+            # The entity goes into the live update event
+            ann = Annotation.objects.select_related("entity__entity_type").get(
+                pk=ann_id, page=page
+            )
         except Annotation.DoesNotExist:
             continue
+        ann.page = page
         ann.start_offset = item["start_offset"]
         ann.end_offset = item["end_offset"]
         ann.annotated_text = item["annotated_text"]
@@ -224,7 +507,9 @@ def annotation_detail(request, annotation_id):
     DELETE -- remove an annotation.
     Does not delete the underlying entity, just the span.
     """
-    annotation = get_object_or_404(Annotation, pk=annotation_id)
+    annotation = get_object_or_404(
+        Annotation, pk=annotation_id, page__document__pending_delete=False
+    )
     annotation.delete()
     return JsonResponse({"deleted": True})
 
@@ -246,7 +531,7 @@ def page_text(request, page_id):
     and returned to the client for the warning UI -- but NOT automatically deleted.
     The client decides what to do with them.
     """
-    page = get_object_or_404(Page, pk=page_id)
+    page = get_object_or_404(Page, pk=page_id, document__pending_delete=False)
 
     try:
         data = json.loads(request.body)
@@ -285,6 +570,148 @@ def page_text(request, page_id):
     )
 
 
+# ---- DOCUMENT PAGES ----
+
+# Upper bound on the `radius` param of document_pages
+DOCUMENT_PAGES_MAX_RADIUS = 5
+
+
+@login_required
+@require_http_methods(["GET"])
+async def document_pages(request, document_id):
+    """
+    GET -- return a run of consecutive pages from a document, each with its first
+    text window and the annotations within it. Used by the canvas to prefetch
+    neighbouring pages and switch between them without a full reload.
+
+    Query params:
+        around -- UUID of the page to centre the run on
+        radius -- number of pages to include either side (default 1, max 5)
+
+    Returns: { "pages": [{ "id", "title", "text", "length", "annotations",
+               "prev_page_id", "next_page_id", "url", "urls", ... }, ...] }
+    in document order. prev/next ids are filled in for every returned page,
+    including the ones at the edges of the run.
+    """
+    document = await aget_object_or_404(
+        Document, pk=document_id, pending_delete=False
+    )
+
+    around = request.GET.get("around", "")
+    try:
+        around = uuid.UUID(around)
+        radius = int(request.GET.get("radius", 1))
+    except ValueError:
+        return json_error("'around' must be a page UUID and 'radius' an integer.")
+    radius = max(0, min(radius, DOCUMENT_PAGES_MAX_RADIUS))
+
+    current = await aget_object_or_404(
+        document.pages.only("id", "document_id", "order"), pk=around
+    )
+
+    # One extra id either side, so the edge pages know their own neighbours
+    before_ids = [
+        page_id
+        async for page_id in document.pages.before(current).values_list(
+            "id", flat=True
+        )[: radius + 1]
+    ]
+    after_ids = [
+        page_id
+        async for page_id in document.pages.after(current).values_list(
+            "id", flat=True
+        )[: radius + 1]
+    ]
+    chain = before_ids[::-1] + [current.id] + after_ids
+    lo = 1 if len(before_ids) > radius else 0
+    hi = len(chain) - (1 if len(after_ids) > radius else 0)
+    page_ids = chain[lo:hi]
+
+    window = (0, Page.TEXT_WINDOW_SIZE)
+    pages = await Page.objects.with_text_window(*window).ain_bulk(page_ids)
+
+    annotations_by_page = defaultdict(list)
+    async for a in (
+        Annotation.objects.filter(page_id__in=page_ids)
+        .select_related("entity", "entity__entity_type")
+        .overlapping(*window)
+    ):
+        annotations_by_page[a.page_id].append(serialize_annotation(a))
+
+    # The labels need the page numbers: one count for the first, the rest follow
+    first_position = (
+        await document.pages.filter(order__lt=pages[chain[lo]].order).acount() + 1
+    )
+    for i in range(lo, hi):
+        pages[chain[i]].position = first_position + i - lo
+
+    results = [
+        serialize_page(
+            pages[chain[i]],
+            document.project_id,
+            annotations_by_page[chain[i]],
+            prev_page_id=chain[i - 1] if i > 0 else None,
+            next_page_id=chain[i + 1] if i + 1 < len(chain) else None,
+        )
+        for i in range(lo, hi)
+    ]
+
+    return JsonResponse({"pages": results})
+
+
+# ---- LIVE UPDATES ----
+
+# Seconds between keep-alive comments on an idle event stream
+LIVE_HEARTBEAT_SECONDS = 15
+
+
+@login_required
+@require_http_methods(["GET"])
+async def document_events(request, document_id):
+    """
+    Server-sent event stream of the changes to a document as they commit, so
+    open canvases can apply other people's edits without reloading. Needs an
+    ASGI server.
+
+    Events (each `data` is the JSON event):
+        annotation.saved   -- annotation_id, page_id, annotation
+        annotation.deleted -- annotation_id, page_id
+        page.updated       -- page_id; its text changed
+        entity.updated     -- entity_id, entity (any entity of the project)
+        entities.changed   -- many entities of the project changed at once
+        resync             -- events were lost; reload what is shown
+    An event with "truncated": true was too large to send in full and only
+    carries its ids.
+
+    Under WSGI the stream would hold a worker for as long as the page is
+    open, so it answers 204 right away, which also stops EventSource from
+    reconnecting.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    document = await aget_object_or_404(
+        Document, pk=document_id, pending_delete=False
+    )
+    channels = [document_channel(document.pk), project_channel(document.project_id)]
+
+    async def stream():
+        async with get_broker().subscribe(channels) as subscription:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await subscription.get(timeout=LIVE_HEARTBEAT_SECONDS)
+                except TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Don't let a proxy hold events back
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
 # ---- ENTITY CREATE ----
 
 
@@ -297,7 +724,7 @@ def entity_create(request, project_id):
     Accepts: { "entity_type_id": "...", "metadata": { "display_name": "...", ... } }
     Returns: the created entity
     """
-    project = get_object_or_404(Project, pk=project_id)
+    project = get_object_or_404(Project, pk=project_id, pending_delete=False)
 
     try:
         data = json.loads(request.body)
@@ -325,33 +752,29 @@ def entity_create(request, project_id):
 
     entity.save()
 
-    return JsonResponse(
-        {
-            "id": str(entity.id),
-            "display_name": entity.display_name,
-            "entity_type_id": str(entity.entity_type_id),
-            "entity_type_name": entity.entity_type.name,
-            "entity_type_color": entity.entity_type.color,
-            "metadata": entity.metadata,
-        },
-        status=201,
-    )
+    return JsonResponse(serialize_entity(entity), status=201)
 
 
 # ---- ENTITY UPDATE ----
 
 
+def _entity_etag(entity):
+    return f'"{entity.updated_at.isoformat()}"'
+
+
 @login_required
 @require_http_methods(["PATCH"])
 def entity_update(request, entity_id):
     """
     PATCH -- update an entity's metadata inline from the annotation canvas.
 
-    Accepts: { "metadata": { "display_name": "...", ... } }
+    Accepts: { "metadata": { "population": 1200, "notes": null } }
+    The metadata is a JSON merge patch (RFC 7386): only the fields it names
+    are validated and written, and null removes a field. Send the entity's
+    ETag in If-Match to make the update conditional; if the entity changed
+    in the meantime the response is 412 with the current entity.
     Returns: the updated entity
     """
-    entity = get_object_or_404(Entity, pk=entity_id)
-
     try:
         data = json.loads(request.body)
     except json.JSONDecodeError:
@@ -361,22 +784,112 @@ def entity_update(request, entity_id):
     if metadata is None:
         return json_error("'metadata' is required.")
 
-    entity.metadata = metadata
+    expected_updated_at = None
+    if_match = request.headers.get("If-Match", "").removeprefix("W/").strip('"')
+    if if_match and if_match != "*":
+        expected_updated_at = parse_datetime(if_match)
+        if expected_updated_at is None:
+            return json_error("Malformed If-Match header.")
 
     try:
-        entity.full_clean()
-    except Exception as e:
+        entity = patch_metadata(entity_id, metadata, expected_updated_at)
+    except Entity.DoesNotExist:
+        return json_error("Entity not found.", status=404)
+    except StaleEntity:
+        current = get_object_or_404(
+            Entity.objects.select_related("entity_type"),
+            pk=entity_id,
+            project__pending_delete=False,
+        )
+        response = JsonResponse(
+            {
+                "error": "This entity was changed by someone else.",
+                "entity": serialize_entity(current),
+            },
+            status=412,
+        )
+        response["ETag"] = _entity_etag(current)
+        return response
+    except ValidationError as e:
         return json_error(str(e))
 
-    entity.save()
+    response = JsonResponse(serialize_entity(entity))
+    response["ETag"] = _entity_etag(entity)
+    return response
 
-    return JsonResponse(
-        {
-            "id": str(entity.id),
-            "display_name": entity.display_name,
-            "entity_type_id": str(entity.entity_type_id),
-            "entity_type_name": entity.entity_type.name,
-            "entity_type_color": entity.entity_type.color,
-            "metadata": entity.metadata,
-        }
-    )
+
+# ---- ENTITY BULK EDIT ----
+
+
+def _bulk_selection(project, data):
+    """
+    The entities a bulk edit applies to: an explicit `ids` list, or a `filter`
+    with any of `entity_type_id`, `q` (display_name substring) and `metadata`
+    (exact field values). Returns None if neither is given.
+    """
+    qs = Entity.objects.filter(project=project)
+    if "ids" in data:
+        if not isinstance(data["ids"], list):
+            raise ValueError("'ids' must be a list.")
+        return qs.filter(pk__in=data["ids"])
+
+    filters = data.get("filter")
+    if not isinstance(filters, dict) or not filters:
+        return None
+    if filters.get("entity_type_id"):
+        qs = qs.filter(entity_type_id=filters["entity_type_id"])
+    if filters.get("q"):
+        qs = qs.filter(metadata__display_name__icontains=filters["q"])
+    if filters.get("metadata"):
+        qs = qs.filter(metadata__contains=filters["metadata"])
+    return qs
+
+
+@login_required
+@require_http_methods(["POST"])
+def entities_bulk_edit(request, project_id):
+    """
+    POST -- edit many entities of a project at once.
+
+    Accepts either a selection of { "ids": [...] } or
+    { "filter": { "entity_type_id": "...", "q": "...", "metadata": {...} } },
+    plus one operation:
+        { "set": { "region": "North", ... } }
+            -- merge into each entity's metadata; null removes a field
+        { "move_to_type_id": "...", "field_map": { "old_field": "new_field" } }
+            -- change the entity type; unmapped fields are dropped
+    Returns: { "updated": n, "errors": { "<entity or type id>": {field: message} } }
+    """
+    project = get_object_or_404(Project, pk=project_id, pending_delete=False)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return json_error("Invalid JSON")
+    if not isinstance(data, dict):
+        return json_error("Expected a JSON object.")
+
+    try:
+        queryset = _bulk_selection(project, data)
+    except (ValueError, ValidationError):
+        return json_error("Invalid entity id.")
+    if queryset is None:
+        return json_error("Either 'ids' or 'filter' is required.")
+
+    try:
+        if isinstance(data.get("set"), dict):
+            updated, errors = bulk_set_metadata(queryset, data["set"])
+        elif data.get("move_to_type_id"):
+            target_type = get_object_or_404(
+                EntityType, pk=data["move_to_type_id"], project=project
+            )
+            field_map = data.get("field_map") or {}
+            if not isinstance(field_map, dict):
+                return json_error("'field_map' must be an object.")
+            updated, errors = bulk_change_type(queryset, target_type, field_map)
+        else:
+            return json_error("Either 'set' or 'move_to_type_id' is required.")
+    except ValidationError as e:
+        return json_error(e.message_dict if hasattr(e, "error_dict") else e.messages)
+
+    return JsonResponse({"updated": updated, "errors": errors})
@@ -0,0 +1,91 @@
+"""
+apps/annotation/live_events.py
+
+The change events pushed to open annotation canvases (see api.document_events
+and networkAnnotation/live.py). Annotation and page events go to the channel
+of their document, entity events to the channel of their project. Ids are
+top-level keys, so an event too large for the broker still says what changed.
+"""
+
+from apps.library.models import Page
+from apps.projects.models import Entity
+from networkAnnotation.live import document_channel, project_channel, publish
+
+from .serializers import serialize_annotation, serialize_entity
+
+# Changes to more entities than this at once are announced as one
+# "entities.changed" event per project instead of one event per entity
+ENTITY_EVENT_LIMIT = 50
+
+
+def _document_id(annotation):
+    if type(annotation).page.is_cached(annotation):
+        return annotation.page.document_id
+    return (
+        Page.objects.filter(pk=annotation.page_id)
+        .values_list("document_id", flat=True)
+        .first()
+    )
+
+
+def annotation_saved(annotation):
+    publish(
+        document_channel(_document_id(annotation)),
+        {
+            "type": "annotation.saved",
+            "annotation_id": str(annotation.pk),
+            "page_id": str(annotation.page_id),
+            "annotation": serialize_annotation(annotation),
+        },
+    )
+
+
+def annotation_deleted(annotation_id, page_id, document_id):
+    publish(
+        document_channel(document_id),
+        {
+            "type": "annotation.deleted",
+            "annotation_id": str(annotation_id),
+            "page_id": str(page_id),
+        },
+    )
+
+
+def page_updated(page):
+    publish(
+        document_channel(page.document_id),
+        {"type": "page.updated", "page_id": str(page.pk)},
+    )
+
+
+def entity_updated(entity):
+    """`entity` must have its entity_type loaded."""
+    publish(
+        project_channel(entity.project_id),
+        {
+            "type": "entity.updated",
+            "entity_id": str(entity.pk),
+            "entity": serialize_entity(entity),
+        },
+    )
+
+
+def entities_updated(entity_ids):
+    entity_ids = list(entity_ids)
+    if len(entity_ids) <= ENTITY_EVENT_LIMIT:
+        for entity in Entity.objects.filter(pk__in=entity_ids).select_related(
+            "entity_type"
+        ):
+            entity_updated(entity)
+        return
+    project_ids = (
+        Entity.objects.filter(pk__in=entity_ids)
+        .order_by()
+        .values_list("project_id", flat=True)
+        .distinct()
+    )
+    for project_id in project_ids:
+        publish(
+            project_channel(project_id),
+            {"type": "entities.changed", "project_id": str(project_id)},
+        )
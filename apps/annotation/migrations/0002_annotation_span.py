@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:02
+
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('annotation', '0001_initial'),
+        ('library', '0001_initial'),
+        ('projects', '0002_alter_entity_options'),
+    ]
+
+    operations = [
+        # Needed to put the page_id uuid column in a GiST index
+        BtreeGistExtension(),
+        migrations.AddField(
+            model_name='annotation',
+            name='span',
+            field=models.GeneratedField(db_persist=True, expression=models.Func('start_offset', 'end_offset', function='int4range', output_field=django.contrib.postgres.fields.ranges.IntegerRangeField()), output_field=django.contrib.postgres.fields.ranges.IntegerRangeField()),
+        ),
+        migrations.AddIndex(
+            model_name='annotation',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['page', 'span'], name='annotation_page_span_gist'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:02
+
+import django.contrib.postgres.constraints
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Kept separate from 0002 so that a database which already holds duplicate
+    spans keeps the index when this step fails. Remove the duplicates (the
+    same entity on the same page and offsets) and migrate again: the model
+    validates against the constraint and later migrations expect it.
+    """
+
+    dependencies = [
+        ('annotation', '0002_annotation_span'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='annotation',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(expressions=[('page', '='), ('entity', '='), ('span', '=')], name='annotation_unique_entity_span', violation_error_message='This entity is already annotated on this exact span.'),
+        ),
+    ]
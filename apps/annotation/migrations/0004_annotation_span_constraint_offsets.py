@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-19 04:17
+
+import django.contrib.postgres.constraints
+import django.contrib.postgres.fields.ranges
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('annotation', '0003_annotation_unique_entity_span'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='annotation',
+            name='annotation_unique_entity_span',
+        ),
+        migrations.AddConstraint(
+            model_name='annotation',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(expressions=[('page', '='), ('entity', '='), (models.Func('start_offset', 'end_offset', function='int4range', output_field=django.contrib.postgres.fields.ranges.IntegerRangeField()), '=')], name='annotation_unique_entity_span', violation_error_message='This entity is already annotated on this exact span.'),
+        ),
+    ]
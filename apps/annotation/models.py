@@ -1,7 +1,49 @@
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import IntegerRangeField, RangeOperators
+from django.contrib.postgres.indexes import GistIndex
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.backends.postgresql.psycopg_any import NumericRange
 import uuid
-from apps.library.models import Page
+from apps.library.models import Document, Page
+from apps.projects.models import EntityTypeStats, ProjectStats
+
+from . import live_events
+
+
+class AnnotationQuerySet(models.QuerySet):
+    """
+    Offset queries against the GiST-indexed `span` column.
+    Ranges are half-open, [start, end), like the offsets themselves.
+    Pass None for an unbounded side.
+    """
+
+    def overlapping(self, start, end):
+        """Annotations sharing at least one character with [start, end)."""
+        return self.filter(span__overlap=NumericRange(start, end))
+
+    def covering(self, offset):
+        """Annotations that include the character at `offset`."""
+        return self.filter(span__contains=offset)
+
+    def containing(self, start, end):
+        """Annotations that fully contain [start, end)."""
+        return self.filter(span__contains=NumericRange(start, end))
+
+    def within(self, start, end):
+        """Annotations that lie entirely inside [start, end)."""
+        return self.filter(span__contained_by=NumericRange(start, end))
+
+    def adjacent_to(self, start, end):
+        """Annotations that end exactly at `start` or start exactly at `end`."""
+        return self.filter(span__adjacent_to=NumericRange(start, end))
+
+    def overlapping_others(self):
+        """Annotations that overlap (or nest with) another annotation on the same page."""
+        others = Annotation.objects.filter(
+            page=models.OuterRef("page"), span__overlap=models.OuterRef("span")
+        ).exclude(pk=models.OuterRef("pk"))
+        return self.filter(models.Exists(others))
 
 
 class Annotation(models.Model):
@@ -13,15 +55,91 @@ class Annotation(models.Model):
     start_offset = models.PositiveIntegerField()
     end_offset = models.PositiveIntegerField()
     annotated_text = models.CharField(max_length=1000)
+    # int4range(start_offset, end_offset), maintained by Postgres for range queries
+    span = models.GeneratedField(
+        expression=models.Func(
+            "start_offset",
+            "end_offset",
+            function="int4range",
+            output_field=IntegerRangeField(),
+        ),
+        output_field=IntegerRangeField(),
+        db_persist=True,
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = AnnotationQuerySet.as_manager()
+
     class Meta:
         ordering = ["start_offset"]
+        indexes = [
+            GistIndex(fields=["page", "span"], name="annotation_page_span_gist"),
+        ]
+        constraints = [
+            ExclusionConstraint(
+                name="annotation_unique_entity_span",
+                # The range is spelled out rather than read from `span`: a
+                # generated column has no value on an unsaved instance, so
+                # full_clean() would match every span of the entity
+                expressions=[
+                    ("page", RangeOperators.EQUAL),
+                    ("entity", RangeOperators.EQUAL),
+                    (
+                        models.Func(
+                            "start_offset",
+                            "end_offset",
+                            function="int4range",
+                            output_field=IntegerRangeField(),
+                        ),
+                        RangeOperators.EQUAL,
+                    ),
+                ],
+                violation_error_message="This entity is already annotated on this exact span.",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.annotated_text} → {self.entity.display_name}"
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                self._record_count_change(1, self.pk)
+            else:
+                Page.objects.filter(pk=self.page_id).touch()
+            live_events.annotation_saved(self)
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        with transaction.atomic():
+            document_id = self.page.document_id
+            result = super().delete(*args, **kwargs)
+            self._record_count_change(-1, pk)
+            live_events.annotation_deleted(pk, self.page_id, document_id)
+        return result
+
+    def _record_count_change(self, delta, pk):
+        """Apply an added (+1) or removed (-1) annotation to every counter that includes it."""
+        # Keep the page's denormalized counters in step
+        Page.objects.filter(pk=self.page_id).touch(annotation_delta=delta)
+        Document.objects.filter(pages=self.page_id).bump(annotation_count=delta)
+
+        # The page turns from empty to annotated (or back) if this is its only annotation
+        only_one = (
+            not Annotation.objects.filter(page_id=self.page_id).exclude(pk=pk).exists()
+        )
+        # The page's project, as reconcile_stats counts it: the entity may
+        # belong to another project
+        ProjectStats.objects.filter(project__documents__pages=self.page_id).bump(
+            annotation_count=delta, empty_page_count=-delta if only_one else 0
+        )
+        EntityTypeStats.objects.filter(entity_type_id=self.entity.entity_type_id).bump(
+            annotation_count=delta
+        )
+
     def clean(self):
         super().clean()
         if self.end_offset <= self.start_offset:
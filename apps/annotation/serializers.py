@@ -0,0 +1,104 @@
+"""
+apps/annotation/serializers.py
+
+Shapes the annotation canvas works with. Shared by the JSON API and by
+library.views.page_detail, which embeds the same payloads in the page so the
+canvas can render without waiting on the API.
+"""
+
+from django.urls import reverse
+
+
+def _active_entity_types(project):
+    return project.entity_types.filter(is_active=True).values(
+        "id", "name", "color", "schema"
+    )
+
+
+def serialize_entity_types(project):
+    """
+    Return all active entity types for a project, as used by the
+    entity type picker toolbar in the canvas. One query.
+    """
+    return list(_active_entity_types(project))
+
+
+async def aserialize_entity_types(project):
+    """serialize_entity_types() for async views."""
+    return [t async for t in _active_entity_types(project)]
+
+
+def page_annotations(page):
+    """Annotations on a page, with everything serialize_annotation needs."""
+    return page.annotations.select_related("entity", "entity__entity_type")
+
+
+def serialize_entity(entity):
+    """Shape an entity for the canvas. Callers should select_related("entity_type")."""
+    return {
+        "id": str(entity.id),
+        "display_name": entity.display_name,
+        "entity_type_id": str(entity.entity_type_id),
+        "entity_type_name": entity.entity_type.name,
+        "entity_type_color": entity.entity_type.color,
+        "metadata": entity.metadata,
+        "updated_at": entity.updated_at.isoformat(),
+    }
+
+
+def serialize_annotation(a):
+    """
+    Shape an annotation for the canvas.
+    Callers should select_related("entity", "entity__entity_type").
+    """
+    return {
+        "id": str(a.id),
+        "start_offset": a.start_offset,
+        "end_offset": a.end_offset,
+        "annotated_text": a.annotated_text,
+        "entity_id": str(a.entity_id),
+        "entity_display_name": a.entity.display_name,
+        "entity_type_id": str(a.entity.entity_type_id),
+        "entity_type_name": a.entity.entity_type.name,
+        "entity_type_color": a.entity.entity_type.color,
+        "entity_metadata": a.entity.metadata,
+        "entity_updated_at": a.entity.updated_at.isoformat(),
+    }
+
+
+def serialize_page(page, project_id, annotations, prev_page_id, next_page_id):
+    """
+    Everything the canvas needs to switch to a page without reloading.
+    `page` must come from Page.objects.with_text_window(), with its `position`
+    assigned when called from async code; `annotations` are the
+    already-serialized annotations within that window.
+    """
+    return {
+        "id": str(page.id),
+        "order": page.order,
+        "title": page.title,
+        "label": str(page),
+        "text": page.text_window,
+        "length": page.text_length,
+        "annotations": annotations,
+        "prev_page_id": str(prev_page_id) if prev_page_id else None,
+        "next_page_id": str(next_page_id) if next_page_id else None,
+        "url": reverse(
+            "library:page_detail",
+            kwargs={
+                "project_id": project_id,
+                "document_id": page.document_id,
+                "page_id": page.id,
+            },
+        ),
+        "urls": {
+            "annotations": reverse(
+                "annotation:annotations", kwargs={"page_id": page.id}
+            ),
+            "pageWindow": reverse("annotation:page_window", kwargs={"page_id": page.id}),
+            "annotationsBulkUpdate": reverse(
+                "annotation:annotations_bulk_update", kwargs={"page_id": page.id}
+            ),
+            "pageText": reverse("annotation:page_text", kwargs={"page_id": page.id}),
+        },
+    }
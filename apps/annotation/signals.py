@@ -0,0 +1,33 @@
+"""
+apps/annotation/signals.py
+
+Live events for changes made outside this app (see live_events.py).
+Annotations publish their own events from Annotation.save() and delete().
+"""
+
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from apps.library.models import Page
+from apps.projects.models import Entity
+from apps.projects.signals import entities_changed
+
+from . import live_events
+
+
+@receiver(post_save, sender=Entity)
+def entity_saved(sender, instance, created, **kwargs):
+    # A new entity isn't on any canvas until it is annotated
+    if not created:
+        live_events.entity_updated(instance)
+
+
+@receiver(entities_changed)
+def entities_saved(sender, entity_ids, **kwargs):
+    live_events.entities_updated(entity_ids)
+
+
+@receiver(post_save, sender=Page)
+def page_saved(sender, instance, created, update_fields=None, **kwargs):
+    if not created and (update_fields is None or "text" in update_fields):
+        live_events.page_updated(instance)
@@ -438,13 +438,41 @@ class ReferenceField {
 // ============================================================
 class AnnotationCanvas {
 
+    // Characters per rendered chunk -- the unit of lazy highlighting and partial re-rendering
+    static CHUNK_SIZE = 2000;
+
+    // Max number of prefetched/visited pages kept for instant prev/next switching
+    static PAGE_CACHE_SIZE = 20;
+
     constructor(config) {
         this.pageId = config.pageId;
         this.projectId = config.projectId;
         this.urls = config.urls;
+        this.documentId = config.documentId;
+        this.documentTitle = config.documentTitle;
+        this.textLength = config.textLength ?? 0;   // full length of the page text
+        this.windowSize = config.windowSize || 20000;
+
+        // The page being shown, in the shape returned by the document pages API
+        this._currentPage = {
+            id: config.pageId,
+            title: config.pageTitle,
+            label: config.pageLabel,
+            prev_page_id: config.prevPageId,
+            next_page_id: config.nextPageId,
+            url: window.location.pathname,
+            urls: {
+                annotations: config.urls.annotations,
+                pageWindow: config.urls.pageWindow,
+                annotationsBulkUpdate: config.urls.annotationsBulkUpdate,
+                pageText: config.urls.pageText,
+            },
+        };
+        this._pageCache = new Map();    // page id -> page payload, for client-side navigation
 
         // Internal state
-        this.annotations = [];          // loaded from API on init
+        this.text = "";                 // page text loaded so far, always a prefix of the full text
+        this.annotations = [];          // loaded from API on init, extended as more text loads
         this.entityTypes = [];          // loaded from API on init
         this.mode = "annotate";         // "annotate" | "bulk_tag" | "edit"
         this.bulkTagType = null;        // active EntityType in bulk tag mode
@@ -454,6 +482,14 @@ class AnnotationCanvas {
         this.container = document.getElementById("annotation-canvas");
         this.popover = null;
 
+        // Virtualized rendering: the text is split into fixed-size chunks which are
+        // highlighted only while near the viewport (see _render / _renderChunk)
+        this._textDiv = null;
+        this._chunks = [];              // [{el, start, end, dirty, visible}], sorted by start
+        this._chunkObserver = null;
+        this._sentinelObserver = null;
+        this._loadingMore = null;       // in-flight _loadMore() promise
+
         // Bind event handlers so we can remove them later if needed
         this._onMouseUp = this._onMouseUp.bind(this);
         this._onAnnotationClick = this._onAnnotationClick.bind(this);
@@ -465,14 +501,22 @@ class AnnotationCanvas {
 
     async _init() {
         try {
-            // Read page text from the json_script tag embedded in the template
-            const textEl = document.getElementById("page-text");
-            this.container.dataset.text = textEl ? JSON.parse(textEl.textContent) : "";
+            // Read the first window of page text from the json_script tag embedded in the template
+            this.text = this._readJsonScript("page-text") ?? "";
+            this.textLength = Math.max(this.textLength, this.text.length);
+
+            // Entity types and the annotations within the loaded window are normally embedded
+            // in the page too -- only fetch whatever is missing (in parallel)
+            const embeddedEntityTypes = this._readJsonScript("entity-types-data");
+            const embeddedAnnotations = this._readJsonScript("annotations-data");
 
-            // Load entity types and existing annotations in parallel
             const [entityTypesData, annotationsData] = await Promise.all([
-                this._fetch(this.urls.entityTypes),
-                this._fetch(this.urls.annotations),
+                embeddedEntityTypes
+                    ? {entity_types: embeddedEntityTypes}
+                    : this._fetch(this.urls.entityTypes),
+                embeddedAnnotations
+                    ? {annotations: embeddedAnnotations}
+                    : this._fetch(`${this.urls.annotations}?start=0&end=${this.text.length}`),
             ]);
 
             this.entityTypes = entityTypesData.entity_types;
@@ -482,6 +526,11 @@ class AnnotationCanvas {
             this.container.addEventListener("mouseup", this._onMouseUp);
             this._renderToolbar();
 
+            this._bindPageNavigation();
+            history.replaceState({pageId: this.pageId}, "", window.location.href);
+            this._prefetchAround(this.pageId).catch(err => console.error("Page prefetch failed:", err));
+            this._connectLive();
+
         } catch (err) {
             console.error("AnnotationCanvas init failed:", err);
             this.container.innerHTML = `<p class="text-red-500">Failed to load annotation canvas.</p>`;
@@ -491,19 +540,102 @@ class AnnotationCanvas {
     // ---- RENDERING ----
 
     /**
-     * Re-renders the entire canvas content.
-     * Splits the page text into segments at annotation and pending-selection boundaries,
-     * wrapping each in appropriate <span> elements.
+     * Rebuilds the canvas content from scratch.
+     * The loaded text is split into chunks of CHUNK_SIZE characters. Each chunk starts out
+     * as a plain text node and is only split into highlighted segments once it scrolls
+     * near the viewport. Annotation changes re-render just the chunks they touch
+     * (see _invalidate), so the cost of an edit doesn't grow with the page length.
      */
     _render() {
-        const text = this._getText();
+        this._chunkObserver?.disconnect();
+        this._sentinelObserver?.disconnect();
         this.container.innerHTML = "";
 
-        const segments = this._buildSegments(text);
+        const textDiv = document.createElement("div");
+        textDiv.style.whiteSpace = "pre-wrap";
+        this.container.appendChild(textDiv);
+        this._textDiv = textDiv;
+        this._chunks = [];
+
+        this._chunkObserver = new IntersectionObserver(entries => {
+            for (const entry of entries) {
+                const chunk = entry.target._chunk;
+                chunk.visible = entry.isIntersecting;
+                if (chunk.visible && chunk.dirty) this._renderChunk(chunk);
+            }
+        }, {rootMargin: "400px 0px"});
+
+        this._appendChunks(0, this.text.length);
+
+        // Sentinel after the text -- when it comes into view, load the next window
+        const sentinel = document.createElement("div");
+        sentinel.className = "h-px";
+        this.container.appendChild(sentinel);
+        this._sentinelObserver = new IntersectionObserver(entries => {
+            if (entries.some(e => e.isIntersecting)) this._loadMore();
+        }, {rootMargin: "800px 0px"});
+        this._sentinelObserver.observe(sentinel);
+    }
+
+    /**
+     * Appends chunk elements covering [start, end) of the loaded text.
+     */
+    _appendChunks(start, end) {
+        for (let pos = start; pos < end; pos += AnnotationCanvas.CHUNK_SIZE) {
+            const chunkEnd = Math.min(pos + AnnotationCanvas.CHUNK_SIZE, end);
+            const el = document.createElement("span");
+            el.className = "canvas-chunk";
+            el.dataset.start = pos;
+            el.dataset.end = chunkEnd;
+            el.textContent = this.text.slice(pos, chunkEnd);
+
+            const chunk = {el, start: pos, end: chunkEnd, dirty: true, visible: false};
+            el._chunk = chunk;
+            this._chunks.push(chunk);
+            this._textDiv.appendChild(el);
+            this._chunkObserver.observe(el);
+        }
+    }
+
+    /**
+     * Marks every chunk intersecting [start, end) as needing a re-render,
+     * re-rendering the visible ones immediately.
+     */
+    _invalidate(start, end) {
+        // Binary search for the first chunk that ends after `start`
+        let lo = 0, hi = this._chunks.length;
+        while (lo < hi) {
+            const mid = (lo + hi) >> 1;
+            if (this._chunks[mid].end <= start) lo = mid + 1;
+            else hi = mid;
+        }
+
+        for (let i = lo; i < this._chunks.length && this._chunks[i].start < end; i++) {
+            const chunk = this._chunks[i];
+            chunk.dirty = true;
+            if (chunk.visible) this._renderChunk(chunk);
+        }
+    }
+
+    /**
+     * Updates the pending selection, re-rendering only the text it covered before and after.
+     */
+    _setPendingSelection(selection) {
+        const previous = this._pendingSelection;
+        this._pendingSelection = selection;
+        if (previous) this._invalidate(previous.start, previous.end);
+        if (selection) this._invalidate(selection.start, selection.end);
+    }
+
+    /**
+     * Splits one chunk into segments at annotation and pending-selection boundaries,
+     * wrapping each in appropriate <span> elements.
+     */
+    _renderChunk(chunk) {
+        const segments = this._buildSegments(chunk.start, chunk.end);
         const fragment = document.createDocumentFragment();
 
-        for (let i = 0; i < segments.length; i++) {
-            const segment = segments[i];
+        for (const segment of segments) {
             const hasAnnotations = segment.annotations.length > 0;
             const isPending = segment.isPending;
 
@@ -536,12 +668,11 @@ class AnnotationCanvas {
                 span.style.cssText = this._buildHighlightStyle(segment.annotations);
                 span.classList.add("annotation-span", "cursor-pointer");
 
-                // Only round/pad the left edge if the previous segment shares none of our annotations
-                const annIds = new Set(segment.annotations.map(a => a.id));
-                const prevSeg = segments[i - 1];
-                const nextSeg = segments[i + 1];
-                const leftIsEdge = !prevSeg || !prevSeg.annotations.some(a => annIds.has(a.id));
-                const rightIsEdge = !nextSeg || !nextSeg.annotations.some(a => annIds.has(a.id));
+                // Only round/pad an edge if none of our annotations continue past it.
+                // Checked against offsets rather than neighbouring segments so it also
+                // holds across chunk boundaries.
+                const leftIsEdge = segment.annotations.every(a => a.start_offset >= segment.start);
+                const rightIsEdge = segment.annotations.every(a => a.end_offset <= segment.end);
 
                 if (leftIsEdge) span.classList.add("rounded-l-sm", "pl-0.5");
                 if (rightIsEdge) span.classList.add("rounded-r-sm", "pr-0.5");
@@ -561,31 +692,34 @@ class AnnotationCanvas {
             }
         }
 
-        const textDiv = document.createElement("div");
-        textDiv.style.whiteSpace = "pre-wrap";
-        textDiv.appendChild(fragment);
-        this.container.appendChild(textDiv);
-
-        this.container.dataset.text = text;
+        chunk.el.replaceChildren(fragment);
+        chunk.dirty = false;
     }
 
     /**
-     * Splits text into segments at annotation and pending-selection boundaries.
-     * Each segment knows which annotations cover it and whether it's within
-     * the current pending selection.
+     * Splits the text in [rangeStart, rangeEnd) into segments at annotation and
+     * pending-selection boundaries. Each segment knows which annotations cover it
+     * and whether it's within the current pending selection.
      */
-    _buildSegments(text) {
-        const boundarySet = new Set([0, text.length]);
+    _buildSegments(rangeStart, rangeEnd) {
+        const text = this._getText();
+        const inRange = this.annotations.filter(
+            ann => ann.start_offset < rangeEnd && ann.end_offset > rangeStart
+        );
+        const boundarySet = new Set([rangeStart, rangeEnd]);
+        const addBoundary = pos => {
+            if (pos > rangeStart && pos < rangeEnd) boundarySet.add(pos);
+        };
 
-        for (const ann of this.annotations) {
-            boundarySet.add(ann.start_offset);
-            boundarySet.add(ann.end_offset);
+        for (const ann of inRange) {
+            addBoundary(ann.start_offset);
+            addBoundary(ann.end_offset);
         }
 
         // Add pending selection boundaries so it gets its own segments
         if (this._pendingSelection) {
-            boundarySet.add(this._pendingSelection.start);
-            boundarySet.add(this._pendingSelection.end);
+            addBoundary(this._pendingSelection.start);
+            addBoundary(this._pendingSelection.end);
         }
 
         const boundaries = Array.from(boundarySet).sort((a, b) => a - b);
@@ -596,7 +730,7 @@ class AnnotationCanvas {
             const end = boundaries[i + 1];
             const segmentText = text.slice(start, end);
 
-            const covering = this.annotations.filter(
+            const covering = inRange.filter(
                 ann => ann.start_offset <= start && ann.end_offset >= end
             );
 
@@ -610,6 +744,67 @@ class AnnotationCanvas {
         return segments;
     }
 
+    // ---- WINDOWED LOADING ----
+
+    /**
+     * Fetches the next window of page text (and the annotations within it)
+     * and appends it to the canvas.
+     */
+    _loadMore() {
+        if (this._loadingMore || this.text.length >= this.textLength) {
+            return this._loadingMore;
+        }
+
+        const start = this.text.length;
+        const end = start + this.windowSize;
+        const pageId = this.pageId;
+
+        this._loadingMore = (async () => {
+            try {
+                const data = await this._fetch(`${this.urls.pageWindow}?start=${start}&end=${end}`);
+                // Ignore stale responses (e.g. the text was edited or the page switched meanwhile)
+                if (this.pageId !== pageId || this.text.length !== start) return;
+
+                this.text += data.text;
+                this.textLength = data.length;
+                this._mergeAnnotations(data.annotations);
+                if (this._textDiv && this.mode !== "edit") {
+                    this._appendChunks(start, this.text.length);
+                }
+            } catch (err) {
+                console.error("Failed to load page text:", err);
+            } finally {
+                if (this.pageId === pageId) this._loadingMore = null;
+            }
+        })();
+        return this._loadingMore;
+    }
+
+    /**
+     * Loads the rest of the page text. Needed before anything that works on the whole text,
+     * like edit mode.
+     */
+    async _loadAll() {
+        while (this.text.length < this.textLength) {
+            const loadedBefore = this.text.length;
+            await (this._loadingMore || this._loadMore());
+            if (this.text.length === loadedBefore) {
+                throw new Error("Failed to load the full page text.");
+            }
+        }
+    }
+
+    /**
+     * Adds annotations from a newly loaded window. Annotations straddling a window
+     * boundary come back in both windows, so skip ones we already have.
+     */
+    _mergeAnnotations(annotations) {
+        const known = new Set(this.annotations.map(a => a.id));
+        for (const ann of annotations) {
+            if (!known.has(ann.id)) this.annotations.push(ann);
+        }
+    }
+
     /**
      * Builds an inline CSS background-color style for an annotated span.
      * Single annotation: color at 30% opacity.
@@ -641,6 +836,133 @@ class AnnotationCanvas {
         return `background-color: rgb(${Math.round(r)}, ${Math.round(g)}, ${Math.round(b)});`;
     }
 
+    // ---- PAGE NAVIGATION ----
+
+    /**
+     * Intercepts the prev/next links and browser back/forward so page changes
+     * happen in place, from prefetched data where possible.
+     */
+    _bindPageNavigation() {
+        for (const id of ["page-prev", "page-next"]) {
+            const link = document.getElementById(id);
+            if (!link) continue;
+
+            link.addEventListener("click", (e) => {
+                const targetId = link.dataset.pageId;
+                // Leave edit mode and modified clicks (new tab etc.) to the browser
+                if (!targetId || this.mode === "edit" || e.metaKey || e.ctrlKey || e.shiftKey) return;
+                e.preventDefault();
+                this.switchPage(targetId, {fallbackUrl: link.href});
+            });
+        }
+
+        window.addEventListener("popstate", (e) => {
+            if (e.state?.pageId) {
+                this.switchPage(e.state.pageId, {push: false, fallbackUrl: window.location.href});
+            }
+        });
+    }
+
+    /**
+     * Shows another page of the same document without a full reload.
+     * Falls back to regular navigation if the page data can't be loaded.
+     */
+    async switchPage(pageId, {push = true, fallbackUrl = null} = {}) {
+        if (!pageId || pageId === this.pageId) return;
+
+        if (!this._pageCache.has(pageId)) {
+            try {
+                await this._prefetchAround(pageId);
+            } catch (err) {
+                console.error("Failed to load page:", err);
+            }
+        }
+        const page = this._pageCache.get(pageId);
+        if (!page) {
+            if (fallbackUrl) window.location.href = fallbackUrl;
+            return;
+        }
+
+        // Keep what we have for the page we're leaving, so going back is instant too
+        this._closePopover(false);
+        this._pendingSelection = null;
+        this._cachePage({
+            ...this._currentPage,
+            text: this.text,
+            length: this.textLength,
+            annotations: this.annotations,
+        });
+
+        this._currentPage = page;
+        this.pageId = page.id;
+        this.urls = {...this.urls, ...page.urls};
+        this.text = page.text;
+        this.textLength = page.length;
+        this.annotations = [...page.annotations];
+        this._loadingMore = null;
+
+        this._render();
+        this._updatePageChrome();
+        window.scrollTo({top: 0});
+        if (push) history.pushState({pageId: page.id}, "", page.url);
+
+        this._prefetchAround(page.id).catch(err => console.error("Page prefetch failed:", err));
+    }
+
+    /**
+     * Fetches the page with the given id and its immediate neighbours into the page cache.
+     */
+    async _prefetchAround(pageId) {
+        const data = await this._fetch(`${this.urls.documentPages}?around=${pageId}&radius=1`);
+
+        for (const page of data.pages) {
+            if (page.id !== this.pageId) {
+                this._cachePage(page);
+            } else {
+                // Only take the neighbour links -- local state for the current page is newer
+                this._currentPage.prev_page_id = page.prev_page_id;
+                this._currentPage.next_page_id = page.next_page_id;
+                this._updatePageChrome();
+            }
+        }
+    }
+
+    _cachePage(page) {
+        this._pageCache.delete(page.id);
+        this._pageCache.set(page.id, page);
+        // Map iterates in insertion order, so the first key is the least recently stored
+        while (this._pageCache.size > AnnotationCanvas.PAGE_CACHE_SIZE) {
+            this._pageCache.delete(this._pageCache.keys().next().value);
+        }
+    }
+
+    /**
+     * Updates the title, breadcrumb and prev/next links for the current page.
+     */
+    _updatePageChrome() {
+        const page = this._currentPage;
+
+        const heading = document.getElementById("page-title");
+        if (heading) heading.textContent = page.title || "Untitled Page";
+        document.title = `${page.title || "Page"} — ${this.documentTitle}`;
+
+        const crumb = document.querySelector(".breadcrumbs li:last-child");
+        if (crumb && page.label) crumb.textContent = page.label;
+
+        const links = [["page-prev", page.prev_page_id], ["page-next", page.next_page_id]];
+        for (const [id, targetId] of links) {
+            const link = document.getElementById(id);
+            if (!link) continue;
+            link.dataset.pageId = targetId || "";
+            link.classList.toggle("btn-disabled", !targetId);
+            if (targetId) {
+                link.href = page.url.replace(page.id, targetId);
+            } else {
+                link.removeAttribute("href");
+            }
+        }
+    }
+
     // ---- TOOLBAR ----
 
     _renderToolbar() {
@@ -723,7 +1045,17 @@ class AnnotationCanvas {
         }
     }
 
-    _enableEditing() {
+    async _enableEditing() {
+        try {
+            await this._loadAll();
+        } catch (err) {
+            console.error(err);
+            alert("Failed to load the full page text for editing. Please try again.");
+            this.setMode("annotate");
+            return;
+        }
+        if (this.mode !== "edit") return;
+
         const text = this._getText();
 
         const textarea = document.createElement("textarea");
@@ -821,7 +1153,8 @@ class AnnotationCanvas {
             // Update local state
             this.annotations = surviving;
 
-            this.container.dataset.text = newText;
+            this.text = newText;
+            this.textLength = newText.length;
             this.setMode("annotate");
             this._render();
 
@@ -1019,45 +1352,45 @@ class AnnotationCanvas {
             selection.removeAllRanges();
 
             if (this.mode === "bulk_tag" && this.bulkTagType) {
-                this._pendingSelection = {start, end};
-                this._render();
+                this._setPendingSelection({start, end});
                 this._createAnnotationForType(start, end, this.bulkTagType, rect);
             } else if (this.mode === "annotate") {
                 // Set pending selection and re-render to show highlight before popover opens
-                this._pendingSelection = {start, end};
-                this._render();
+                this._setPendingSelection({start, end});
                 this._showTypePicker(start, end, rect);
             }
         }, 10);
     }
 
     _getOffsets(range) {
-        const textDiv = this.container.querySelector("div");
+        const textDiv = this._textDiv;
         if (!textDiv || !textDiv.contains(range.commonAncestorContainer)) return null;
 
-        let charCount = 0;
-        let start = null;
-        let end = null;
-
-        const walker = document.createTreeWalker(textDiv, NodeFilter.SHOW_TEXT);
-        let node;
+        const start = this._textOffset(range.startContainer, range.startOffset);
+        const end = this._textOffset(range.endContainer, range.endOffset);
 
-        while ((node = walker.nextNode())) {
-            const nodeLength = node.textContent.length;
-
-            if (node === range.startContainer) {
-                start = charCount + range.startOffset;
-            }
-            if (node === range.endContainer) {
-                end = charCount + range.endOffset;
-                break;
-            }
+        if (start === null || end === null) return null;
+        return {start, end};
+    }
 
-            charCount += nodeLength;
+    /**
+     * Converts a DOM boundary point (node + offset, as used by Range) into an
+     * offset in the page text, using the enclosing chunk's start offset.
+     */
+    _textOffset(node, offset) {
+        if (node === this._textDiv) {
+            const child = this._textDiv.childNodes[offset];
+            return child ? child._chunk.start : this.text.length;
         }
 
-        if (start === null || end === null) return null;
-        return {start, end};
+        const el = node.nodeType === Node.ELEMENT_NODE ? node : node.parentElement;
+        const chunkEl = el?.closest(".canvas-chunk");
+        if (!chunkEl || !this._textDiv.contains(chunkEl)) return null;
+
+        const before = document.createRange();
+        before.setStart(chunkEl, 0);
+        before.setEnd(node, offset);
+        return chunkEl._chunk.start + before.toString().length;
     }
 
     // ---- TYPE PICKER POPOVER ----
@@ -1080,8 +1413,7 @@ class AnnotationCanvas {
             btn.style.borderColor = et.color;
 
             btn.addEventListener("click", () => {
-                this._pendingSelection = {start, end, entityType: et};
-                this._render();
+                this._setPendingSelection({start, end, entityType: et});
                 this._showEntitySearch(start, end, et, rect);
             });
 
@@ -1440,19 +1772,37 @@ class AnnotationCanvas {
 
         try {
             if (existingEntity) {
+                // Send only what changed, as a JSON merge patch, so other
+                // people's edits to other fields survive
+                const patch = {};
+                const before = existingEntity.metadata || {};
+                for (const [name, value] of Object.entries(metadata)) {
+                    if (JSON.stringify(value ?? null) !== JSON.stringify(before[name] ?? null)) {
+                        patch[name] = value;
+                    }
+                }
                 const url = this.urls.entityUpdate.replace("__id__", existingEntity.id);
-                const updated = await this._fetch(url, {
-                    method: "PATCH",
-                    body: JSON.stringify({metadata}),
-                });
-                this.annotations = this.annotations.map(a =>
-                    a.entity_id === updated.id
-                        ? {...a, entity_display_name: updated.display_name, entity_metadata: updated.metadata}
-                        : a
-                );
+                let updated;
+                try {
+                    updated = await this._fetch(url, {
+                        method: "PATCH",
+                        headers: existingEntity.updated_at
+                            ? {"If-Match": `"${existingEntity.updated_at}"`}
+                            : {},
+                        body: JSON.stringify({metadata: patch}),
+                    });
+                } catch (err) {
+                    if (err.status !== 412) throw err;
+                    // Someone else saved first: show their version and let the user retry
+                    this._applyEntity(err.data.entity);
+                    if (isModal) closeModal();
+                    this._closePopover();
+                    alert("This entity was changed by someone else. Their changes are now shown; please make your edit again.");
+                    return true;
+                }
+                this._applyEntity(updated);
                 if (isModal) closeModal();
                 this._closePopover();
-                this._render();
             } else {
                 const entity = await this._fetch(this.urls.entityCreate, {
                     method: "POST",
@@ -1469,6 +1819,140 @@ class AnnotationCanvas {
         }
     }
 
+    /**
+     * Update every annotation of an entity with its server-side state and re-render them.
+     * Pages in the page cache get the new state too.
+     */
+    _applyEntity(entity) {
+        const withEntity = annotations => annotations.map(a =>
+            a.entity_id === entity.id
+                ? {
+                    ...a,
+                    entity_display_name: entity.display_name,
+                    entity_metadata: entity.metadata,
+                    entity_updated_at: entity.updated_at,
+                }
+                : a
+        );
+        this.annotations = withEntity(this.annotations);
+        for (const page of this._pageCache.values()) {
+            page.annotations = withEntity(page.annotations);
+        }
+        for (const a of this.annotations) {
+            if (a.entity_id === entity.id) this._invalidate(a.start_offset, a.end_offset);
+        }
+    }
+
+    // ---- LIVE UPDATES ----
+
+    /**
+     * Follows the document's event stream, so other people's edits show up without a reload.
+     * EventSource reconnects by itself; events may have been missed meanwhile, so a
+     * reconnect (like a "resync" event) reloads the current page's annotations.
+     * Annotation and page events are ignored while editing the text -- saving the edit
+     * rewrites the page's annotations anyway.
+     */
+    _connectLive() {
+        if (!this.urls.documentEvents || typeof EventSource === "undefined") return;
+
+        const source = new EventSource(this.urls.documentEvents);
+        let connected = false;
+        source.addEventListener("open", () => {
+            if (connected) this._reloadAnnotations();
+            connected = true;
+        });
+
+        const on = (type, handler) => source.addEventListener(type, e => {
+            try {
+                handler(JSON.parse(e.data));
+            } catch (err) {
+                console.error(`Failed to apply live ${type} event:`, err);
+            }
+        });
+        on("annotation.saved", event => this._onLiveAnnotationSaved(event));
+        on("annotation.deleted", event => this._onLiveAnnotationDeleted(event));
+        on("page.updated", event => this._onLivePageUpdated(event));
+        on("entity.updated", event => event.entity ? this._applyEntity(event.entity) : this._reloadAnnotations());
+        on("entities.changed", () => this._reloadAnnotations());
+        on("resync", () => this._reloadAnnotations());
+
+        this._liveSource = source;
+    }
+
+    _onLiveAnnotationSaved(event) {
+        if (event.page_id !== this.pageId) {
+            this._pageCache.delete(event.page_id);
+            return;
+        }
+        if (this.mode === "edit") return;
+        if (event.truncated) {
+            this._reloadAnnotations();
+            return;
+        }
+
+        const annotation = event.annotation;
+        const previous = this.annotations.find(a => a.id === annotation.id);
+        this.annotations = this.annotations.filter(a => a.id !== annotation.id);
+        // Annotations beyond the loaded text arrive with the window that contains them
+        if (annotation.start_offset < this.text.length) this.annotations.push(annotation);
+        if (previous) this._invalidate(previous.start_offset, previous.end_offset);
+        this._invalidate(annotation.start_offset, annotation.end_offset);
+    }
+
+    _onLiveAnnotationDeleted(event) {
+        if (event.page_id !== this.pageId) {
+            this._pageCache.delete(event.page_id);
+            return;
+        }
+        if (this.mode === "edit") return;
+
+        const removed = this.annotations.find(a => a.id === event.annotation_id);
+        if (!removed) return;
+        this.annotations = this.annotations.filter(a => a.id !== event.annotation_id);
+        this._invalidate(removed.start_offset, removed.end_offset);
+    }
+
+    async _onLivePageUpdated(event) {
+        if (event.page_id !== this.pageId) {
+            this._pageCache.delete(event.page_id);
+            return;
+        }
+        if (this.mode === "edit") return;
+
+        const pageId = this.pageId;
+        const end = Math.max(this.text.length, this.windowSize);
+        try {
+            const data = await this._fetch(`${this.urls.pageWindow}?start=0&end=${end}`);
+            if (this.pageId !== pageId || this.mode === "edit") return;
+            this.text = data.text;
+            this.textLength = data.length;
+            this.annotations = data.annotations;
+            this._loadingMore = null;
+            this._render();
+        } catch (err) {
+            console.error("Failed to reload the page text:", err);
+        }
+    }
+
+    /**
+     * Reloads the annotations within the loaded text, e.g. after missing live events.
+     */
+    async _reloadAnnotations() {
+        this._pageCache.clear();
+        if (this.mode === "edit") return;
+
+        const pageId = this.pageId;
+        const end = this.text.length;
+        try {
+            const data = await this._fetch(`${this.urls.annotations}?start=0&end=${end}`);
+            if (this.pageId !== pageId || this.mode === "edit") return;
+            this.annotations = data.annotations;
+            this._invalidate(0, end);
+        } catch (err) {
+            console.error("Failed to reload annotations:", err);
+        }
+    }
+
     // ---- ANNOTATION CLICK ----
 
     _onAnnotationClick(e) {
@@ -1525,6 +2009,7 @@ class AnnotationCanvas {
                     const entity = {
                         id: annotation.entity_id,
                         metadata: annotation.entity_metadata,
+                        updated_at: annotation.entity_updated_at,
                     };
                     this._showEntityForm(annotation.start_offset, annotation.end_offset, entityType, rect, entity);
                 });
@@ -1559,7 +2044,7 @@ class AnnotationCanvas {
             });
 
             this.annotations.push(annotation);
-            this._render();
+            this._invalidate(annotation.start_offset, annotation.end_offset);
 
         } catch (err) {
             console.error("Failed to create annotation:", err);
@@ -1572,8 +2057,9 @@ class AnnotationCanvas {
 
         try {
             await this._fetch(this._annotationDetailUrl(annotationId), {method: "DELETE"});
+            const removed = this.annotations.find(a => a.id === annotationId);
             this.annotations = this.annotations.filter(a => a.id !== annotationId);
-            this._render();
+            if (removed) this._invalidate(removed.start_offset, removed.end_offset);
 
         } catch (err) {
             console.error("Failed to delete annotation:", err);
@@ -1630,15 +2116,23 @@ class AnnotationCanvas {
         if (existing) existing.remove();
 
         if (clearPending && this._pendingSelection) {
-            this._pendingSelection = null;
-            this._render();
+            this._setPendingSelection(null);
         }
     }
 
     // ---- UTILITIES ----
 
     _getText() {
-        return this.container.dataset.text || "";
+        return this.text;
+    }
+
+    /**
+     * Parses data embedded with Django's json_script filter.
+     * Returns null if the element is missing so callers can fall back to the API.
+     */
+    _readJsonScript(id) {
+        const el = document.getElementById(id);
+        return el ? JSON.parse(el.textContent) : null;
     }
 
     _annotationDetailUrl(annotationId) {
@@ -1652,17 +2146,20 @@ class AnnotationCanvas {
         const csrfToken = document.querySelector("[name=csrfmiddlewaretoken]")?.value;
 
         const response = await fetch(url, {
+            ...options,
             headers: {
                 "Content-Type": "application/json",
                 "X-CSRFToken": csrfToken || "",
                 ...options.headers,
             },
-            ...options,
         });
 
         if (!response.ok) {
-            const error = await response.json().catch(() => ({}));
-            throw new Error(error.error || `Request failed: ${response.status}`);
+            const data = await response.json().catch(() => ({}));
+            const error = new Error(data.error || `Request failed: ${response.status}`);
+            error.status = response.status;
+            error.data = data;
+            throw error;
         }
 
         const text = await response.text();
@@ -0,0 +1,172 @@
+import json
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+from apps.annotation.models import Annotation
+from apps.diagnostics.testing import QueryBudgetMixin
+from apps.library.models import Document, Page
+from apps.projects.models import Entity, EntityType, Project, ProjectStats
+from apps.projects.services.stats_service import reconcile_stats
+
+SCHEMA = [{"name": "display_name", "label": "Name", "type": "text"}]
+WORD = "river "
+
+
+class AnnotationQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    The canvas endpoints read every annotation of a page or a list of
+    entities; their query counts must not depend on how many there are.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("annotator", password="x")
+        cls.project = Project.objects.create(owner=cls.user, title="Budgets")
+        # Several types, so a per-row lookup of the entity type would show
+        cls.entity_types = [
+            EntityType.objects.create(project=cls.project, name=f"Type {i}", schema=SCHEMA)
+            for i in range(3)
+        ]
+        cls.document = Document.objects.create(project=cls.project, title="Letters")
+        cls.page = Page.objects.create(
+            document=cls.document, order=Page.ORDER_GAP, text=WORD * 2000
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.entity_count = 0
+        self.annotation_count = 0
+
+    def add_entities(self, n):
+        entities = Entity.objects.bulk_create(
+            Entity(
+                entity_type=self.entity_types[i % len(self.entity_types)],
+                project=self.project,
+                metadata={"display_name": f"River {i}"},
+            )
+            for i in range(self.entity_count, self.entity_count + n)
+        )
+        self.entity_count += n
+        return entities
+
+    def add_annotations(self, n):
+        entities = self.add_entities(n)
+        Annotation.objects.bulk_create(
+            Annotation(
+                page=self.page,
+                entity=entity,
+                start_offset=i * len(WORD),
+                end_offset=i * len(WORD) + len(WORD) - 1,
+                annotated_text=WORD.strip(),
+            )
+            for i, entity in enumerate(entities, self.annotation_count)
+        )
+        self.annotation_count += n
+
+    def test_annotations_get(self):
+        url = reverse("annotation:annotations", args=[self.page.pk])
+        # session, user, page, annotations with their entities and types
+        self.assertConstantQueries(4, self.add_annotations, lambda: self.client.get(url))
+
+    def test_page_text_put(self):
+        url = reverse("annotation:page_text", args=[self.page.pk])
+        body = json.dumps({"text": self.page.text})
+        # session, user, page, annotations; then the save: savepoint, page,
+        # live event, release (the same text leaves the counters alone)
+        self.assertConstantQueries(
+            8,
+            self.add_annotations,
+            lambda: self.client.put(url, body, content_type="application/json"),
+        )
+
+    def test_entity_search(self):
+        url = reverse("annotation:entity_search", args=[self.project.pk])
+        # session, user, project, entities with their types
+        self.assertConstantQueries(
+            4, self.add_entities, lambda: self.client.get(url, {"q": "river"})
+        )
+
+
+class LiveEventsTests(TestCase):
+    def test_wsgi_gets_no_stream(self):
+        user = User.objects.create_user("annotator", password="x")
+        project = Project.objects.create(owner=user, title="Live")
+        document = Document.objects.create(project=project, title="Letters")
+        page = Page.objects.create(document=document, order=Page.ORDER_GAP, text=WORD)
+        self.client.force_login(user)
+
+        response = self.client.get(reverse("annotation:document_events", args=[document.pk]))
+        self.assertEqual(response.status_code, 204)
+        response = self.client.get(
+            reverse("library:page_detail", args=[project.pk, document.pk, page.pk])
+        )
+        self.assertNotContains(response, "documentEvents")
+
+
+class AnnotationCreateTests(TestCase):
+    def test_entity_on_two_spans(self):
+        user = User.objects.create_user("annotator", password="x")
+        project = Project.objects.create(owner=user, title="Spans")
+        entity_type = EntityType.objects.create(project=project, name="Place", schema=SCHEMA)
+        entity = Entity.objects.create(
+            entity_type=entity_type, metadata={"display_name": "River"}
+        )
+        document = Document.objects.create(project=project, title="Letters")
+        page = Page.objects.create(document=document, order=Page.ORDER_GAP, text=WORD * 3)
+        self.client.force_login(user)
+
+        url = reverse("annotation:annotations", args=[page.pk])
+        statuses = [
+            self.client.post(
+                url,
+                json.dumps(
+                    {"entity_id": str(entity.pk), "start_offset": start, "end_offset": start + 5}
+                ),
+                content_type="application/json",
+            ).status_code
+            for start in (0, len(WORD), 0)
+        ]
+        self.assertEqual(statuses, [201, 201, 400])
+
+
+class AnnotationCounterTests(TestCase):
+    def test_entity_of_another_project(self):
+        user = User.objects.create_user("annotator", password="x")
+        project = Project.objects.create(owner=user, title="Letters")
+        other = Project.objects.create(owner=user, title="Gazetteer")
+        entity_type = EntityType.objects.create(project=other, name="Place", schema=SCHEMA)
+        entity = Entity.objects.create(entity_type=entity_type, metadata={"display_name": "River"})
+        document = Document.objects.create(project=project, title="Letters")
+        page = Page.objects.create(document=document, order=Page.ORDER_GAP, text=WORD)
+        Annotation.objects.create(
+            page=page, entity=entity, start_offset=0, end_offset=5, annotated_text="river"
+        )
+
+        def counts():
+            return dict(
+                ProjectStats.objects.values_list("project__title", "annotation_count")
+            )
+
+        live = counts()
+        self.assertEqual(live, {"Letters": 1, "Gazetteer": 0})
+        reconcile_stats()
+        self.assertEqual(counts(), live)
+
+
+class PageWindowTests(TestCase):
+    def test_window_past_the_end(self):
+        user = User.objects.create_user("annotator", password="x")
+        project = Project.objects.create(owner=user, title="Windows")
+        document = Document.objects.create(project=project, title="Letters")
+        page = Page.objects.create(document=document, order=Page.ORDER_GAP, text=WORD)
+        self.client.force_login(user)
+
+        response = self.client.get(
+            reverse("annotation:page_window", args=[page.pk]), {"start": 500}
+        )
+        self.assertEqual(response.status_code, 200)
+        window = response.json()
+        self.assertEqual((window["text"], window["annotations"]), ("", []))
+        self.assertEqual(window["length"], len(WORD))
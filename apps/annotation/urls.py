@@ -9,12 +9,38 @@ urlpatterns = [
         api.entity_types,
         name="entity_types",
     ),
+    path(
+        "api/projects/<uuid:project_id>/entity-types/<uuid:entity_type_id>/entities/",
+        api.entity_list,
+        name="entity_list",
+    ),
+    path(
+        "api/projects/<uuid:project_id>/entity-types/<uuid:entity_type_id>/timeline/",
+        api.entity_timeline,
+        name="entity_timeline",
+    ),
+    path(
+        "api/projects/<uuid:project_id>/entity-types/<uuid:entity_type_id>/export/",
+        api.entity_export,
+        name="entity_export",
+    ),
+    path(
+        "api/projects/<uuid:project_id>/entity-types/<uuid:entity_type_id>/map/",
+        api.entity_map,
+        name="entity_map",
+    ),
+    path(
+        "api/projects/<uuid:project_id>/entity-types/<uuid:entity_type_id>/nearest/",
+        api.entity_nearest,
+        name="entity_nearest",
+    ),
     path(
         "api/projects/<uuid:project_id>/entities/",
         api.entity_search,
         name="entity_search",
     ),
     path("api/pages/<uuid:page_id>/annotations/", api.annotations, name="annotations"),
+    path("api/pages/<uuid:page_id>/window/", api.page_window, name="page_window"),
     path(
         "api/pages/<uuid:page_id>/annotations/bulk-update/",
         api.annotations_bulk_update,
@@ -26,11 +52,26 @@ urlpatterns = [
         name="annotation_detail",
     ),
     path("api/pages/<uuid:page_id>/text/", api.page_text, name="page_text"),
+    path(
+        "api/documents/<uuid:document_id>/pages/",
+        api.document_pages,
+        name="document_pages",
+    ),
+    path(
+        "api/documents/<uuid:document_id>/events/",
+        api.document_events,
+        name="document_events",
+    ),
     path(
         "api/projects/<uuid:project_id>/entities/create/",
         api.entity_create,
         name="entity_create",
     ),
+    path(
+        "api/projects/<uuid:project_id>/entities/bulk-edit/",
+        api.entities_bulk_edit,
+        name="entities_bulk_edit",
+    ),
     path(
         "api/entities/<uuid:entity_id>/",
         api.entity_update,
@@ -0,0 +1,84 @@
+from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+
+from .models import RequestProfile
+from .sampler import top_frames
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = [
+        "created_at",
+        "method",
+        "path",
+        "view_name",
+        "status_code",
+        "duration_ms",
+        "query_count",
+        "sample_count",
+        "user",
+    ]
+    list_filter = ["view_name", "method"]
+    search_fields = ["path", "id"]
+    fields = [
+        "id",
+        "created_at",
+        "user",
+        "method",
+        "path",
+        "view_name",
+        "status_code",
+        "duration_ms",
+        "query_count",
+        "sample_count",
+        "download",
+        "hottest_frames",
+        "memory",
+    ]
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                "<uuid:pk>/stacks/",
+                self.admin_site.admin_view(self.download_stacks),
+                name="diagnostics_requestprofile_stacks",
+            ),
+            *super().get_urls(),
+        ]
+
+    def download_stacks(self, request, pk):
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        try:
+            stacks = profile.stacks.open("rb")
+        except FileNotFoundError:
+            raise Http404("The stacks file is gone.")
+        return FileResponse(stacks, as_attachment=True, filename=f"{pk}.collapsed")
+
+    @admin.display(description="Collapsed stacks")
+    def download(self, obj):
+        url = reverse("admin:diagnostics_requestprofile_stacks", args=[obj.pk])
+        return format_html(
+            '<a href="{}">{}.collapsed</a> (flamegraph.pl, speedscope.app)', url, obj.pk
+        )
+
+    @admin.display(description="Hottest frames (samples)")
+    def hottest_frames(self, obj):
+        try:
+            with obj.stacks.open("r") as f:
+                frames = top_frames(f.read())
+        except FileNotFoundError:
+            return "-"
+        return format_html(
+            "<pre>{}</pre>",
+            format_html_join("\n", "{:>6}  {}", ((n, frame) for frame, n in frames)),
+        )
@@ -0,0 +1,383 @@
+"""
+apps/diagnostics/benchmarks.py
+
+The benchmark suite: every endpoint of the annotation API, the project and
+library pages, and schema validation, timed against a corpus made by
+synthetic.generate_corpus(). For each benchmark it reports latency
+percentiles and the queries per call as JSON, so runs on different commits
+can be compared (see compare()).
+
+Requests go through the Django test client, in process: the numbers include
+the middleware and views but no server or network, which keeps them
+comparable from one machine to the next. The write benchmarks change the
+corpus (metadata values, timestamps) and clean up what they create, so run
+the suite on a synthetic project rather than on real data. The live event
+stream (document_events) never ends and isn't benchmarked.
+"""
+
+import json
+import platform
+import random
+import re
+import subprocess
+import time
+from collections import Counter
+
+import django
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from apps.annotation.models import Annotation
+from apps.library.models import Document, Page
+from apps.projects.models import Entity, EntityType, ProjectStats
+from apps.projects.services.schema_service import (
+    deserialize_schema,
+    validate_metadata,
+    validate_patch,
+)
+
+ITERATIONS = 30
+WARMUP = 3
+PERCENTILES = (50, 90, 95, 99)
+# Entities selected by the bulk edit benchmark
+BULK_EDIT_SIZE = 20
+
+
+# Returned by a benchmark call that had nothing to do; it isn't timed
+SKIPPED = object()
+
+
+def summarize(latencies, query_counts, statuses=()):
+    """Latency percentiles in milliseconds and query counts of one benchmark."""
+    if not latencies:
+        return {"iterations": 0}
+    ms = np.asarray(latencies, dtype=np.float64) * 1000
+    queries = np.asarray(query_counts)
+    summary = {
+        "iterations": len(ms),
+        "mean_ms": round(float(ms.mean()), 3),
+        "min_ms": round(float(ms.min()), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+    for p, value in zip(PERCENTILES, np.percentile(ms, PERCENTILES)):
+        summary[f"p{p}_ms"] = round(float(value), 3)
+    summary["queries"] = int(np.median(queries))
+    summary["queries_max"] = int(queries.max())
+    if statuses:
+        summary["statuses"] = {str(s): n for s, n in sorted(Counter(statuses).items())}
+    return summary
+
+
+def measure(run, iterations=ITERATIONS, warmup=WARMUP):
+    """
+    Call run() warmup + iterations times. run() returns an HTTP status code,
+    SKIPPED when it had nothing to do, or anything else for non-HTTP work.
+    """
+    for _ in range(warmup):
+        run()
+    latencies, query_counts, statuses = [], [], []
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            status = run()
+            elapsed = time.perf_counter() - start
+        if status is SKIPPED:
+            continue
+        latencies.append(elapsed)
+        query_counts.append(len(queries.captured_queries))
+        if isinstance(status, int):
+            statuses.append(status)
+    return summarize(latencies, query_counts, statuses)
+
+
+class _Http:
+    def __init__(self, client):
+        self.client = client
+
+    def __call__(self, method, url, data=None, **headers):
+        if method == "get":
+            response = self.client.get(url, data, headers=headers)
+        else:
+            response = getattr(self.client, method)(
+                url,
+                json.dumps(data) if data is not None else None,
+                content_type="application/json",
+                headers=headers,
+            )
+        if response.streaming:
+            # Streamed responses do their work while being read; iterating
+            # the response also consumes async streams
+            b"".join(response)
+        return response
+
+
+def corpus_fixtures(project):
+    """
+    The objects the benchmarks work on: the most annotated page and its
+    document, and an entity type with a field of every type.
+    """
+    entity_types = list(EntityType.objects.filter(project=project).order_by("name"))
+    # The last type has a reference field; the first is its target
+    entity_type = entity_types[-1]
+    page = (
+        Page.objects.filter(document__project=project)
+        .order_by("-annotation_count", "id")
+        .first()
+    )
+    document = Document.objects.get(pk=page.document_id)
+    entities = list(
+        Entity.objects.filter(entity_type=entity_type).order_by("id")[:BULK_EDIT_SIZE]
+    )
+    return {
+        "project": project,
+        "entity_types": entity_types,
+        "entity_type": entity_type,
+        "entities": entities,
+        "entity": entities[0],
+        "document": document,
+        "page": page,
+    }
+
+
+def _api_benchmarks(http, f):
+    project, entity_type, page, document = (
+        f["project"], f["entity_type"], f["page"], f["document"]
+    )
+    et_args = [project.pk, entity_type.pk]
+    entity_ids = [str(e.pk) for e in f["entities"]]
+    rng = random.Random(0)
+
+    def url(name, *args):
+        return reverse(f"annotation:{name}", args=args)
+
+    def get(name, *args, **params):
+        return lambda: http("get", url(name, *args), params).status_code
+
+    # A new word per call: an entity can be annotated on a span only once
+    taken = {
+        (str(entity_id), start, end)
+        for entity_id, start, end in Annotation.objects.filter(page=page).values_list(
+            "entity_id", "start_offset", "end_offset"
+        )
+    }
+    word_spans = ((m.start(), m.end()) for m in re.finditer(r"\S+", page.text))
+    created_annotations = []
+
+    def create_annotation():
+        entity_id = rng.choice(entity_ids)
+        for start, end in word_spans:
+            if (entity_id, start, end) not in taken:
+                break
+        else:
+            return SKIPPED
+        response = http(
+            "post",
+            url("annotations", page.pk),
+            {"entity_id": entity_id, "start_offset": start, "end_offset": end},
+        )
+        if response.status_code == 201:
+            created_annotations.append(response.json()["id"])
+        return response.status_code
+
+    def delete_annotation():
+        if not created_annotations:
+            return SKIPPED
+        return http(
+            "delete", url("annotation_detail", created_annotations.pop())
+        ).status_code
+
+    page_annotations = [
+        {
+            "id": str(a.pk),
+            "start_offset": a.start_offset,
+            "end_offset": a.end_offset,
+            "annotated_text": a.annotated_text,
+        }
+        for a in Annotation.objects.filter(page=page).order_by("start_offset")[:20]
+    ]
+    created_entities = []
+
+    def create_entity():
+        response = http(
+            "post",
+            url("entity_create", project.pk),
+            {
+                "entity_type_id": str(entity_type.pk),
+                "metadata": {"display_name": f"Benchmark {len(created_entities)}"},
+            },
+        )
+        if response.status_code == 201:
+            created_entities.append(response.json()["id"])
+        return response.status_code
+
+    def cleanup():
+        for annotation in Annotation.objects.filter(pk__in=created_annotations):
+            annotation.delete()
+        for entity in Entity.objects.filter(pk__in=created_entities):
+            entity.delete()
+
+    benchmarks = {
+        "annotation:entity_types": get("entity_types", project.pk),
+        "annotation:entity_list": get("entity_list", *et_args),
+        "annotation:entity_list [filtered, sorted]": get(
+            "entity_list",
+            *et_args,
+            filters=json.dumps([{"field": "count", "op": "gte", "value": 50000}]),
+            sort="-count",
+        ),
+        "annotation:entity_list [bbox]": get(
+            "entity_list",
+            *et_args,
+            filters=json.dumps(
+                [{"field": "place", "op": "within_bbox", "value": [-10, 35, 30, 60]}]
+            ),
+        ),
+        "annotation:entity_timeline": get("entity_timeline", *et_args, field="recorded"),
+        "annotation:entity_map": get(
+            "entity_map", *et_args, field="place", bbox="-180,-90,180,90", zoom=2
+        ),
+        "annotation:entity_nearest": get(
+            "entity_nearest", *et_args, field="place", lat=52.37, long=4.9, k=10
+        ),
+        "annotation:entity_export": get("entity_export", *et_args),
+        "annotation:entity_search": get("entity_search", project.pk, q="ri"),
+        "annotation:annotations": get("annotations", page.pk),
+        "annotation:annotations [POST]": create_annotation,
+        "annotation:annotation_detail [DELETE]": delete_annotation,
+        "annotation:page_window": get(
+            "page_window", page.pk, start=0, end=Page.TEXT_WINDOW_SIZE
+        ),
+        "annotation:annotations_bulk_update": lambda: http(
+            "patch",
+            url("annotations_bulk_update", page.pk),
+            {"annotations": page_annotations},
+        ).status_code,
+        "annotation:page_text": lambda: http(
+            "put", url("page_text", page.pk), {"text": page.text}
+        ).status_code,
+        "annotation:document_pages": get(
+            "document_pages", document.pk, around=str(page.pk), radius=2
+        ),
+        "annotation:entity_create": create_entity,
+        "annotation:entity_update": lambda: http(
+            "patch",
+            url("entity_update", rng.choice(entity_ids)),
+            {"metadata": {"count": rng.randint(0, 100000)}},
+        ).status_code,
+        "annotation:entities_bulk_edit": lambda: http(
+            "post",
+            url("entities_bulk_edit", project.pk),
+            {"ids": entity_ids, "set": {"verified": rng.random() < 0.5}},
+        ).status_code,
+    }
+    return benchmarks, cleanup
+
+
+def _view_benchmarks(http, f):
+    project, document, page = f["project"], f["document"], f["page"]
+
+    def get(name, *args):
+        return lambda: http("get", reverse(name, args=args)).status_code
+
+    return {
+        "projects:list": get("projects:list"),
+        "projects:detail": get("projects:detail", project.pk),
+        "library:document_detail": get("library:document_detail", project.pk, document.pk),
+        "library:page_detail": get(
+            "library:page_detail", project.pk, document.pk, page.pk
+        ),
+        "library:page_edit": get("library:page_edit", project.pk, document.pk, page.pk),
+    }
+
+
+def _schema_benchmarks(f):
+    entity_type, entity = f["entity_type"], f["entity"]
+    schema = entity_type.schema
+    type_ids = [et.pk for et in f["entity_types"]]
+    return {
+        "schema:deserialize_schema": lambda: deserialize_schema(
+            schema, entity_type.pk, type_ids
+        ),
+        "schema:validate_metadata": lambda: validate_metadata(schema, entity.metadata),
+        "schema:validate_patch": lambda: validate_patch(
+            schema, {"count": 12, "status": "final", "verified": True}
+        ),
+        "schema:entity_type_clean": entity_type.clean,
+    }
+
+
+def _environment(project):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    stats = ProjectStats.objects.filter(project=project).values(
+        "document_count", "page_count", "char_count", "entity_count", "annotation_count"
+    ).first()
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "postgres": connection.pg_version,
+        "corpus": {"project": str(project.pk), **(stats or {})},
+    }
+
+
+def run_benchmarks(project, iterations=ITERATIONS, warmup=WARMUP, only=None, log=None):
+    """
+    Run the suite (or the benchmarks whose name contains `only`) against
+    `project`, as its owner. Returns the report: environment and results.
+    """
+    fixtures = corpus_fixtures(project)
+    client = Client()
+    client.force_login(project.owner)
+    http = _Http(client)
+
+    api, cleanup = _api_benchmarks(http, fixtures)
+    suite = {**api, **_view_benchmarks(http, fixtures), **_schema_benchmarks(fixtures)}
+    results = {}
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+        try:
+            for name, run in suite.items():
+                if only and only not in name:
+                    continue
+                results[name] = measure(run, iterations, warmup)
+                if log:
+                    log(name, results[name])
+        finally:
+            cleanup()
+    return {
+        "environment": _environment(project),
+        "iterations": iterations,
+        "warmup": warmup,
+        "results": results,
+    }
+
+
+def compare(previous, current, metrics=("p50_ms", "p95_ms", "queries")):
+    """
+    [(benchmark, metric, before, after, change), ...] for the benchmarks in
+    both reports; `change` is relative (0.1 is 10% slower or more queries).
+    """
+    rows = []
+    for name, result in current["results"].items():
+        before = previous["results"].get(name)
+        if before is None:
+            continue
+        for metric in metrics:
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else (0.0 if new == old else None)
+            rows.append((name, metric, old, new, change))
+    return rows
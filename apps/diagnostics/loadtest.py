@@ -0,0 +1,347 @@
+"""
+apps/diagnostics/loadtest.py
+
+A load generator that replays annotation canvas workflows against a running
+server (see the loadtest command). Each virtual user is a thread with its
+own session: it logs in, then repeatedly opens a page and works on it the
+way the canvas does:
+
+    page_detail, entity types, annotations, text window
+    type-ahead entity search, a keystroke at a time
+    create an entity, annotate a span with it
+    edit the page text and bulk-update the surviving annotations
+
+with random think times between steps. The report gives throughput and
+latency percentiles per endpoint (URL name), measured client-side, so they
+include the server's queueing -- which is what worker and database sizing
+needs.
+
+The targets (pages, entity types, search terms) are read from the database
+the command runs against, so run it next to the server, against a corpus
+from generate_corpus: the writes add entities and annotations and append to
+page texts. Use read_only for a corpus that must not change.
+"""
+
+import http.cookiejar
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.urls import reverse
+
+from apps.library.models import Page
+from apps.projects.models import Entity, EntityType
+
+PERCENTILES = (50, 90, 95, 99)
+# Seconds between keystrokes of the type-ahead search
+KEYSTROKE_DELAY = 0.15
+REQUEST_TIMEOUT = 60
+# Targets sampled from the project
+MAX_PAGES = 500
+MAX_SEARCH_TERMS = 200
+
+
+class Stats:
+    """Latencies and errors per endpoint, shared by the virtual users."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    def record(self, name, seconds, error=None):
+        with self._lock:
+            self.latencies[name].append(seconds)
+            if error is not None:
+                self.errors[name][str(error)] += 1
+
+    def report(self, elapsed):
+        """{endpoint: {"requests", "errors", "rps", "p50_ms", ...}} and the totals."""
+        endpoints = {}
+        for name, latencies in sorted(self.latencies.items()):
+            ms = np.asarray(latencies) * 1000
+            summary = {
+                "requests": len(ms),
+                "errors": dict(self.errors.get(name, {})),
+                "rps": round(len(ms) / elapsed, 2),
+                "mean_ms": round(float(ms.mean()), 2),
+                "max_ms": round(float(ms.max()), 2),
+            }
+            for p, value in zip(PERCENTILES, np.percentile(ms, PERCENTILES)):
+                summary[f"p{p}_ms"] = round(float(value), 2)
+            endpoints[name] = summary
+        requests = sum(s["requests"] for s in endpoints.values())
+        errors = sum(sum(s["errors"].values()) for s in endpoints.values())
+        return {
+            "elapsed_s": round(elapsed, 1),
+            "requests": requests,
+            "errors": errors,
+            "rps": round(requests / elapsed, 2) if elapsed else 0,
+            "endpoints": endpoints,
+        }
+
+
+def load_targets(project):
+    """What the virtual users work on, sampled from `project`."""
+    pages = list(
+        Page.objects.filter(document__project=project)
+        .order_by("?")
+        .values_list("id", "document_id")[:MAX_PAGES]
+    )
+    entity_types = list(
+        EntityType.objects.filter(project=project, is_active=True).values_list(
+            "id", flat=True
+        )
+    )
+    names = (
+        Entity.objects.filter(project=project)
+        .order_by("?")
+        .values_list("metadata__display_name", flat=True)[:MAX_SEARCH_TERMS]
+    )
+    terms = sorted({name.split()[0] for name in names if isinstance(name, str) and name})
+    if not pages or not entity_types:
+        raise ValueError("The project needs pages and entity types to load-test.")
+    return {
+        "project_id": project.pk,
+        "pages": pages,
+        "entity_types": entity_types,
+        "search_terms": terms or ["a"],
+    }
+
+
+class VirtualUser(threading.Thread):
+    def __init__(
+        self, base_url, username, password, targets, stats, deadline,
+        think=(1.0, 3.0), read_only=False, seed=None,
+    ):
+        super().__init__(daemon=True)
+        self.base_url = base_url.rstrip("/")
+        self.username, self.password = username, password
+        self.targets = targets
+        self.stats = stats
+        self.deadline = deadline
+        self.think_range = think
+        self.read_only = read_only
+        self.rng = random.Random(seed)
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies)
+        )
+
+    # ---- HTTP ----
+
+    def _csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == "csrftoken":
+                return cookie.value
+        return ""
+
+    def request(self, name, method, path, json_body=None, form=None, params=None):
+        """
+        Send a request and record it under `name`. Returns the decoded JSON
+        (or the raw body), or None when it failed.
+        """
+        url = self.base_url + path
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        headers = {"Referer": self.base_url + "/", "X-CSRFToken": self._csrf_token()}
+        data = None
+        if json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        elif form is not None:
+            data = urllib.parse.urlencode(form).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        request = urllib.request.Request(url, data=data, headers=headers, method=method)
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=REQUEST_TIMEOUT) as response:
+                body = response.read()
+                content_type = response.headers.get("Content-Type", "")
+        except urllib.error.HTTPError as e:
+            e.read()
+            self.stats.record(name, time.perf_counter() - start, e.code)
+            return None
+        except (urllib.error.URLError, OSError) as e:
+            self.stats.record(name, time.perf_counter() - start, type(e).__name__)
+            return None
+        self.stats.record(name, time.perf_counter() - start)
+        if content_type.startswith("application/json"):
+            return json.loads(body)
+        return body
+
+    def think(self, seconds=None):
+        if seconds is None:
+            seconds = self.rng.uniform(*self.think_range)
+        time.sleep(max(0.0, min(seconds, self.deadline - time.monotonic())))
+
+    # ---- WORKFLOW ----
+
+    def login(self):
+        """Log in through the login form. Returns whether a session was opened."""
+        path = reverse("login")
+        self.request("login [GET]", "GET", path)
+        self.request(
+            "login [POST]",
+            "POST",
+            path,
+            form={
+                "username": self.username,
+                "password": self.password,
+                "csrfmiddlewaretoken": self._csrf_token(),
+            },
+        )
+        return any(cookie.name == settings.SESSION_COOKIE_NAME for cookie in self.cookies)
+
+    def run(self):
+        if not self.login():
+            # Every later request would be redirected to the login page
+            self.stats.record("login [POST]", 0.0, "no session")
+            return
+        while time.monotonic() < self.deadline:
+            self.workflow()
+
+    def workflow(self):
+        rng = self.rng
+        targets = self.targets
+        project_id = targets["project_id"]
+        page_id, document_id = rng.choice(targets["pages"])
+
+        self.request(
+            "library:page_detail",
+            "GET",
+            reverse("library:page_detail", args=[project_id, document_id, page_id]),
+        )
+        self.request(
+            "annotation:entity_types",
+            "GET",
+            reverse("annotation:entity_types", args=[project_id]),
+        )
+        self.request(
+            "annotation:annotations", "GET", reverse("annotation:annotations", args=[page_id])
+        )
+        window = self.request(
+            "annotation:page_window",
+            "GET",
+            reverse("annotation:page_window", args=[page_id]),
+            params={"start": 0, "end": Page.TEXT_WINDOW_SIZE},
+        )
+        self.think()
+
+        # Type-ahead: one search per keystroke of a term
+        term = rng.choice(targets["search_terms"])
+        entity_id = None
+        for n in range(1, min(len(term), 4) + 1):
+            result = self.request(
+                "annotation:entity_search",
+                "GET",
+                reverse("annotation:entity_search", args=[project_id]),
+                params={"q": term[:n]},
+            )
+            if result and result["entities"]:
+                entity_id = rng.choice(result["entities"])["id"]
+            self.think(KEYSTROKE_DELAY)
+        self.think()
+        if self.read_only or not isinstance(window, dict):
+            return
+
+        if entity_id is None or rng.random() < 0.3:
+            created = self.request(
+                "annotation:entity_create",
+                "POST",
+                reverse("annotation:entity_create", args=[project_id]),
+                json_body={
+                    "entity_type_id": str(rng.choice(targets["entity_types"])),
+                    "metadata": {"display_name": f"{term} {uuid.uuid4().hex[:8]}"},
+                },
+            )
+            if created:
+                entity_id = created["id"]
+            self.think()
+
+        span = self._word_span(window["text"])
+        if entity_id and span:
+            self.request(
+                "annotation:annotations [POST]",
+                "POST",
+                reverse("annotation:annotations", args=[page_id]),
+                json_body={
+                    "entity_id": entity_id,
+                    "start_offset": span[0],
+                    "end_offset": span[1],
+                },
+            )
+            self.think()
+
+        # Edit the text, only when all of it was loaded: appending a word
+        # leaves every annotation in place
+        if window["length"] == len(window["text"]) and rng.random() < 0.2:
+            saved = self.request(
+                "annotation:page_text",
+                "PUT",
+                reverse("annotation:page_text", args=[page_id]),
+                json_body={"text": window["text"] + " " + term},
+            )
+            if saved:
+                self.request(
+                    "annotation:annotations_bulk_update",
+                    "PATCH",
+                    reverse("annotation:annotations_bulk_update", args=[page_id]),
+                    json_body={
+                        "annotations": [
+                            {
+                                "id": a["id"],
+                                "start_offset": a["start_offset"],
+                                "end_offset": a["end_offset"],
+                                "annotated_text": a["annotated_text"],
+                            }
+                            for a in window["annotations"]
+                        ]
+                    },
+                )
+            self.think()
+
+    def _word_span(self, text):
+        """A random word of `text` as (start, end), or None."""
+        if not text.strip():
+            return None
+        for _ in range(10):
+            start = text.find(" ", self.rng.randrange(len(text))) + 1
+            end = text.find(" ", start)
+            if 0 < start < end:
+                return start, end
+        return None
+
+
+def run_load_test(
+    base_url, username, password, project, users=10, duration=60, ramp_up=10,
+    think=(1.0, 3.0), read_only=False, seed=0,
+):
+    """Run `users` virtual users for `duration` seconds. Returns Stats.report()."""
+    targets = load_targets(project)
+    stats = Stats()
+    start = time.monotonic()
+    deadline = start + ramp_up + duration
+    threads = []
+    for n in range(users):
+        thread = VirtualUser(
+            base_url, username, password, targets, stats, deadline,
+            think=think, read_only=read_only, seed=seed + n,
+        )
+        thread.start()
+        threads.append(thread)
+        time.sleep(ramp_up / users)
+    for thread in threads:
+        thread.join(timeout=max(0.0, deadline - time.monotonic()) + REQUEST_TIMEOUT)
+    report = stats.report(time.monotonic() - start)
+    report["users"] = users
+    return report
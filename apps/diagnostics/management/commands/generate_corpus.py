@@ -0,0 +1,44 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.diagnostics.synthetic import DEFAULT_SCALE, generate_corpus
+
+
+class Command(BaseCommand):
+    help = "Create a synthetic project to benchmark against (see apps/diagnostics/synthetic.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--owner", required=True, help="Username of the project owner")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--title", help="Project title (default: from the seed)")
+        for name, default in DEFAULT_SCALE.items():
+            parser.add_argument(
+                f"--{name.replace('_', '-')}",
+                dest=name,
+                type=type(default),
+                default=default,
+                help=f"default: {default}",
+            )
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options["owner"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['owner']} does not exist.")
+
+        start = time.perf_counter()
+        project, counts = generate_corpus(
+            owner,
+            seed=options["seed"],
+            title=options["title"],
+            **{name: options[name] for name in DEFAULT_SCALE},
+        )
+        for table, n in counts.items():
+            self.stdout.write(f"  {table}: {n}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created project {project.pk} in {time.perf_counter() - start:.1f}s."
+            )
+        )
@@ -0,0 +1,107 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.diagnostics.loadtest import run_load_test
+from apps.projects.models import Project
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay annotation workflows with concurrent virtual users against a "
+        "running server and report throughput and latency percentiles per endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--base-url", default="http://localhost:8000", help="The server to load"
+        )
+        parser.add_argument(
+            "--project", required=True, help="UUID of the project to work on"
+        )
+        parser.add_argument("--username", required=True)
+        parser.add_argument("--password", required=True)
+        parser.add_argument("--users", type=int, default=10, help="Virtual users")
+        parser.add_argument(
+            "--duration", type=int, default=60, help="Seconds at full load"
+        )
+        parser.add_argument(
+            "--ramp-up", type=int, default=10, help="Seconds over which users start"
+        )
+        parser.add_argument(
+            "--think",
+            default="1,3",
+            help="Think time between steps: 'min,max' seconds (default 1,3)",
+        )
+        parser.add_argument(
+            "--read-only",
+            action="store_true",
+            help="Only read: no entities, annotations or text edits",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        try:
+            project = Project.objects.get(pk=options["project"])
+        except (Project.DoesNotExist, ValueError):
+            raise CommandError(f"Project {options['project']} does not exist.")
+        try:
+            low, high = (float(v) for v in options["think"].split(","))
+        except ValueError:
+            raise CommandError("--think takes 'min,max' in seconds.")
+        if not 0 <= low <= high:
+            raise CommandError("--think needs 0 <= min <= max.")
+        if options["users"] < 1:
+            raise CommandError("--users must be at least 1.")
+
+        # The command's own queries (the targets) are not of interest
+        logging.getLogger("networkAnnotation.queries").setLevel(logging.WARNING)
+
+        self.stdout.write(
+            f"{options['users']} users against {options['base_url']} for "
+            f"{options['ramp_up']}s ramp-up + {options['duration']}s..."
+        )
+        try:
+            report = run_load_test(
+                options["base_url"],
+                options["username"],
+                options["password"],
+                project,
+                users=options["users"],
+                duration=options["duration"],
+                ramp_up=options["ramp_up"],
+                think=(low, high),
+                read_only=options["read_only"],
+                seed=options["seed"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            f"\n{'endpoint':<40} {'reqs':>6} {'errs':>5} {'req/s':>7} "
+            f"{'p50':>8} {'p90':>8} {'p95':>8} {'p99':>8} {'max':>8}  (ms)"
+        )
+        for name, s in report["endpoints"].items():
+            errors = sum(s["errors"].values())
+            line = (
+                f"{name:<40} {s['requests']:>6} {errors:>5} {s['rps']:>7.2f} "
+                f"{s['p50_ms']:>8.1f} {s['p90_ms']:>8.1f} {s['p95_ms']:>8.1f} "
+                f"{s['p99_ms']:>8.1f} {s['max_ms']:>8.1f}"
+            )
+            self.stdout.write(self.style.ERROR(line) if errors else line)
+            if errors:
+                self.stdout.write(f"{'':<40} errors: {s['errors']}")
+        summary = (
+            f"\n{report['requests']} requests, {report['errors']} errors, "
+            f"{report['rps']} req/s over {report['elapsed_s']}s"
+        )
+        self.stdout.write(
+            self.style.ERROR(summary) if report["errors"] else self.style.SUCCESS(summary)
+        )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
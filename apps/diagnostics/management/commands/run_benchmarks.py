@@ -0,0 +1,74 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.diagnostics.benchmarks import ITERATIONS, WARMUP, compare, run_benchmarks
+from apps.projects.models import Project
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the API endpoints, views and schema validation against a synthetic "
+        "project and write latency percentiles and query counts as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--project", required=True, help="UUID of a project made by generate_corpus"
+        )
+        parser.add_argument("--iterations", type=int, default=ITERATIONS)
+        parser.add_argument("--warmup", type=int, default=WARMUP)
+        parser.add_argument("--only", help="Run the benchmarks whose name contains this")
+        parser.add_argument("--output", help="Write the JSON report to this file")
+        parser.add_argument(
+            "--compare", help="A previous JSON report to compare the results with"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            project = Project.objects.select_related("owner").get(pk=options["project"])
+        except (Project.DoesNotExist, ValueError):
+            raise CommandError(f"Project {options['project']} does not exist.")
+        if project.owner is None:
+            raise CommandError("The project needs an owner to send requests as.")
+
+        previous = None
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                previous = json.load(f)
+
+        # One line per request would drown the results; N+1 warnings stay
+        logging.getLogger("networkAnnotation.queries").setLevel(logging.WARNING)
+
+        def log(name, result):
+            if not result["iterations"]:
+                self.stdout.write(f"{name:<48} skipped, nothing to do")
+                return
+            self.stdout.write(
+                f"{name:<48} p50 {result['p50_ms']:>9.2f} ms  "
+                f"p95 {result['p95_ms']:>9.2f} ms  {result['queries']:>4} queries"
+            )
+
+        report = run_benchmarks(
+            project,
+            iterations=options["iterations"],
+            warmup=options["warmup"],
+            only=options["only"],
+            log=log,
+        )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+
+        if previous:
+            self.stdout.write("\nChanges from the previous report:")
+            for name, metric, before, after, change in compare(previous, report):
+                if change is None or abs(change) < 0.1:
+                    continue
+                style = self.style.ERROR if change > 0 else self.style.SUCCESS
+                self.stdout.write(
+                    style(f"  {name} {metric}: {before} -> {after} ({change:+.0%})")
+                )
@@ -0,0 +1,137 @@
+"""
+apps/diagnostics/middleware.py
+
+On-demand profiling of single requests. A staff user adds the header
+"X-Profile: 1" (or the query parameter ?_profile=1) to a request; it then
+runs under the stack sampler, and the result is stored as a RequestProfile,
+listed in the admin, whose id comes back in the X-Profile-Id header.
+"memory" instead of 1 also records the top allocations with tracemalloc,
+which slows the request down noticeably.
+
+Requests without the flag only pay for the header lookup. Async requests
+are sampled on every thread, since their work moves between the event loop
+and sync_to_async threads; concurrent requests show up in their profile.
+"""
+
+import threading
+import time
+import tracemalloc
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.core.files.base import ContentFile
+
+from apps.diagnostics.models import RequestProfile
+from apps.diagnostics.sampler import StackSampler
+from networkAnnotation.instrumentation import current_queries
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_PARAM = "_profile"
+# Older profiles are deleted when a new one is stored
+KEEP_PROFILES = 200
+MEMORY_FRAMES = 10
+MEMORY_TOP = 30
+
+# tracemalloc is process-wide, so only one request at a time traces memory
+_memory_lock = threading.Lock()
+
+
+def _requested_mode(request):
+    """"cpu", "memory", or None when the request doesn't ask for a profile."""
+    value = request.headers.get(PROFILE_HEADER)
+    if value is None and PROFILE_PARAM in request.META.get("QUERY_STRING", ""):
+        value = request.GET.get(PROFILE_PARAM)
+    if not value or value == "0":
+        return None
+    return "memory" if value == "memory" else "cpu"
+
+
+class _Profile:
+    def __init__(self, mode, thread_ids):
+        self.sampler = StackSampler(thread_ids)
+        self.trace_memory = mode == "memory" and _memory_lock.acquire(blocking=False)
+        self.memory = ""
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.start(MEMORY_FRAMES)
+        self.start = time.perf_counter()
+        self.sampler.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.sampler.__exit__(*exc_info)
+        self.duration = time.perf_counter() - self.start
+        if self.trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            _memory_lock.release()
+            self.memory = "\n".join(
+                str(stat) for stat in snapshot.statistics("lineno")[:MEMORY_TOP]
+            )
+
+
+def _save(request, response, profile, user, query_count):
+    match = request.resolver_match
+    record = RequestProfile(
+        user=user if user.is_authenticated else None,
+        method=request.method,
+        path=request.get_full_path()[:2000],
+        view_name=match.view_name if match else "",
+        status_code=response.status_code,
+        duration_ms=profile.duration * 1000,
+        sample_count=profile.sampler.sample_count,
+        query_count=query_count,
+        memory=profile.memory,
+    )
+    record.stacks.save(
+        f"{record.id}.collapsed", ContentFile(profile.sampler.collapsed()), save=False
+    )
+    record.save()
+    for old in RequestProfile.objects.all()[KEEP_PROFILES:]:
+        old.delete()
+    return record
+
+
+def _query_count():
+    queries = current_queries()
+    return queries.count if queries is not None else None
+
+
+class ProfilerMiddleware:
+    """Needs request.user; place it after AuthenticationMiddleware."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        mode = _requested_mode(request)
+        if mode is None or not request.user.is_staff:
+            return self.get_response(request)
+        with _Profile(mode, {threading.get_ident()}) as profile:
+            response = self.get_response(request)
+        record = _save(request, response, profile, request.user, _query_count())
+        response["X-Profile-Id"] = str(record.id)
+        return response
+
+    async def __acall__(self, request):
+        mode = _requested_mode(request)
+        if mode is None:
+            return await self.get_response(request)
+        user = await request.auser()
+        if not user.is_staff:
+            return await self.get_response(request)
+        with _Profile(mode, None) as profile:
+            response = await self.get_response(request)
+        record = await sync_to_async(_save)(
+            request, response, profile, user, _query_count()
+        )
+        response["X-Profile-Id"] = str(record.id)
+        return response
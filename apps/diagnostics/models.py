@@ -0,0 +1,39 @@
+import uuid
+
+from django.conf import settings
+from django.db import models
+
+
+class RequestProfile(models.Model):
+    """
+    A profile of one request, taken on demand by ProfilerMiddleware. `stacks`
+    holds the sampled call stacks in the collapsed format ("a;b;c 12" per
+    line) that flamegraph.pl and speedscope read.
+    """
+
+    # The request id, also sent back in the X-Profile-Id response header
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL, related_name="+"
+    )
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2000)
+    view_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    sample_count = models.PositiveIntegerField()
+    query_count = models.PositiveIntegerField(null=True, blank=True)
+    stacks = models.FileField(upload_to="profiles/")
+    # Top allocations from tracemalloc, when asked for
+    memory = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+    def delete(self, *args, **kwargs):
+        self.stacks.delete(save=False)
+        return super().delete(*args, **kwargs)
@@ -0,0 +1,92 @@
+"""
+apps/diagnostics/sampler.py
+
+A sampling profiler: a background thread records the call stacks of the
+profiled threads every SAMPLE_INTERVAL seconds. Unlike cProfile it doesn't
+hook every call, so the profiled code runs at close to full speed and the
+stacks are complete -- what a flamegraph needs.
+"""
+
+import os
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+
+SAMPLE_INTERVAL = 0.005
+# Deeper stacks are cut at the root end
+MAX_DEPTH = 200
+
+# Frames of project code are named relative to the repository root
+_BASE_DIR = str(Path(__file__).resolve().parent.parent.parent)
+
+
+def _location(code):
+    filename = code.co_filename
+    if filename.startswith(_BASE_DIR):
+        filename = os.path.relpath(filename, _BASE_DIR)
+    else:
+        # Library code: keep the package path, drop the interpreter prefix
+        parts = filename.split(os.sep)
+        for marker in ("site-packages", "dist-packages", "lib"):
+            if marker in parts:
+                filename = "/".join(parts[len(parts) - parts[::-1].index(marker):])
+                break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+def collapse(frame):
+    """The stack ending at `frame`, root first, as "a;b;c"."""
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(_location(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """
+    Samples the given threads (by ident), or every thread but its own when
+    `thread_ids` is None. Use as a context manager.
+    """
+
+    def __init__(self, thread_ids=None, interval=SAMPLE_INTERVAL):
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.stacks = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.sample_count += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                if self.thread_ids is not None and thread_id not in self.thread_ids:
+                    continue
+                self.stacks[collapse(frame)] += 1
+
+    def collapsed(self):
+        """The samples in the collapsed stack format, heaviest first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def top_frames(collapsed, limit=20):
+    """[(frame, samples), ...] of the frames most often on top of the stack."""
+    counts = Counter()
+    for line in collapsed.splitlines():
+        stack, _, count = line.rpartition(" ")
+        if stack:
+            counts[stack.rsplit(";", 1)[-1]] += int(count)
+    return counts.most_common(limit)
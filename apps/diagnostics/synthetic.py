@@ -0,0 +1,327 @@
+"""
+apps/diagnostics/synthetic.py
+
+Synthetic corpora for benchmarking (see benchmarks.py and the
+generate_corpus command).
+
+generate_corpus() builds one project at a given scale: documents of pages of
+generated text, entity types whose schemas use every field type in the
+registry, entities with valid metadata for them, and annotations on word
+boundaries at a given density. The same seed gives the same content (the
+ids are fresh, so a database can hold several copies).
+
+Projects and entity types go through the models, so their stats rows and
+schema versions exist. Documents, pages, entities and annotations are
+bulk-loaded with COPY and skip the model hooks. The side tables (EntityDate,
+EntityLocation) and every counter are rebuilt afterwards with the same
+set-based services the maintenance commands use.
+"""
+
+import csv
+import io
+import json
+import random
+import uuid
+
+from django.apps import apps
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.projects.schema_definitions.registry import FIELD_REGISTRY
+from apps.projects.services.entity_dates import refresh_entity_dates
+from apps.projects.services.entity_locations import refresh_entity_locations
+
+DEFAULT_SCALE = {
+    "documents": 10,
+    "pages_per_document": 20,
+    # Characters of text per page (approximately; pages end on a word)
+    "page_chars": 5000,
+    "entity_types": 4,
+    "entities_per_type": 500,
+    "annotations_per_1000_chars": 5,
+}
+
+# Rows per COPY statement
+COPY_CHUNK_SIZE = 10000
+# Annotations span this many words at most
+MAX_ANNOTATION_WORDS = 3
+
+WORDS = (
+    "the of and to in a is that for it as was with be by on not he this are or "
+    "his from at which but have an they you were her she there one all we their "
+    "river harbour council letter merchant parish ledger voyage treaty estate "
+    "garden mill bridge church market captain widow governor printer surveyor "
+    "north south east west winter spring summer autumn morning evening "
+    "received wrote sailed arrived signed recorded travelled purchased "
+    "Amsterdam Batavia Lisbon Calcutta Boston Leiden Hamburg Cadiz Smyrna Canton"
+).split()
+
+DROPDOWN_CHOICES = ["draft", "checked", "disputed", "final"]
+DATE_PRECISIONS = ["day", "month", "year", "decade"]
+
+
+def entity_type_schema(reference_target_id=None):
+    """
+    A schema with a field of every registered type. The reference field
+    points at `reference_target_id` and is left out without one.
+    """
+    definitions = {
+        "text": {"name": "display_name", "label": "Name", "type": "text", "required": True},
+        "number": {"name": "count", "label": "Count", "type": "number"},
+        "date": {"name": "recorded", "label": "Recorded", "type": "date"},
+        "latlong": {"name": "place", "label": "Place", "type": "latlong"},
+        "dropdown": {
+            "name": "status",
+            "label": "Status",
+            "type": "dropdown",
+            "choices": DROPDOWN_CHOICES,
+        },
+        "bool": {"name": "verified", "label": "Verified", "type": "bool"},
+        "reference": {
+            "name": "related",
+            "label": "Related",
+            "type": "reference",
+            "target_entity_type_id": str(reference_target_id),
+        },
+    }
+    missing = set(FIELD_REGISTRY) - set(definitions)
+    if missing:
+        raise ValueError(f"No synthetic definition for field types {sorted(missing)}.")
+    if reference_target_id is None:
+        del definitions["reference"]
+    return [definitions[ftype] for ftype in FIELD_REGISTRY if ftype in definitions]
+
+
+def _date_value(rng):
+    year = rng.randint(1550, 1950)
+    month, day = rng.randint(1, 12), rng.randint(1, 28)
+    precision = rng.choice(DATE_PRECISIONS)
+    iso = {
+        "day": f"{year:04d}-{month:02d}-{day:02d}",
+        "month": f"{year:04d}-{month:02d}-01",
+        "year": f"{year:04d}-01-01",
+        "decade": f"{year // 10 * 10:04d}-01-01",
+    }[precision]
+    return {"iso": iso, "precision": precision, "original": iso}
+
+
+def entity_metadata(rng, schema, number, reference_ids=()):
+    """Metadata valid for `schema`, with a distinct display name per `number`."""
+    metadata = {}
+    for field_def in schema:
+        name, ftype = field_def["name"], field_def["type"]
+        if name == "display_name":
+            value = f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {number}"
+        elif ftype == "text":
+            value = " ".join(rng.choices(WORDS, k=rng.randint(2, 8)))
+        elif ftype == "number":
+            value = rng.randint(0, 100000)
+        elif ftype == "date":
+            value = _date_value(rng)
+        elif ftype == "latlong":
+            value = {
+                "lat": round(rng.uniform(-60, 70), 5),
+                "long": round(rng.uniform(-180, 180), 5),
+            }
+        elif ftype == "dropdown":
+            value = rng.choice(field_def["choices"])
+        elif ftype == "bool":
+            value = rng.random() < 0.5
+        elif ftype == "reference":
+            if not reference_ids:
+                continue
+            value = str(rng.choice(reference_ids))
+        else:
+            continue
+        metadata[name] = value
+    return metadata
+
+
+def page_text(rng, chars):
+    """Generated text of about `chars` characters, and the offset of each word."""
+    words, offsets, length = [], [], 0
+    while length < chars:
+        word = rng.choice(WORDS)
+        if words:
+            length += 1
+        offsets.append(length)
+        words.append(word)
+        length += len(word)
+    return " ".join(words), offsets
+
+
+def annotation_spans(rng, text, word_offsets, per_1000_chars):
+    """[(start, end), ...] on word boundaries, at most one starting per word."""
+    count = min(len(word_offsets), round(len(text) * per_1000_chars / 1000))
+    spans = []
+    for index in sorted(rng.sample(range(len(word_offsets)), count)):
+        last = min(index + rng.randint(1, MAX_ANNOTATION_WORDS), len(word_offsets)) - 1
+        start = word_offsets[index]
+        end = text.find(" ", word_offsets[last])
+        spans.append((start, len(text) if end == -1 else end))
+    return spans
+
+
+def _copy(table, columns, rows):
+    """Bulk-load `rows` with COPY, COPY_CHUNK_SIZE rows per statement."""
+    quoted = ", ".join(f'"{column}"' for column in columns)
+    sql = f"COPY {table} ({quoted}) FROM STDIN WITH (FORMAT csv)"
+    rows = iter(rows)
+    total = 0
+    with connection.cursor() as cursor:
+        while True:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            n = 0
+            for row in rows:
+                # None is written as an unquoted empty field, which COPY reads as NULL
+                writer.writerow(row)
+                n += 1
+                if n == COPY_CHUNK_SIZE:
+                    break
+            if not n:
+                return total
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+            total += n
+
+
+@transaction.atomic
+def generate_corpus(owner, seed=0, title=None, **scale):
+    """
+    Create a synthetic project owned by `owner`. `scale` overrides keys of
+    DEFAULT_SCALE. Returns (project, {table: rows loaded}).
+    """
+    # stats_service imports the models, which this module leaves to the app registry
+    from apps.projects.services.stats_service import reconcile_stats
+
+    Project = apps.get_model("projects", "Project")
+    EntityType = apps.get_model("projects", "EntityType")
+    Document = apps.get_model("library", "Document")
+    Page = apps.get_model("library", "Page")
+
+    unknown = set(scale) - set(DEFAULT_SCALE)
+    if unknown:
+        raise ValueError(f"Unknown scale settings: {sorted(unknown)}")
+    scale = {**DEFAULT_SCALE, **scale}
+    rng = random.Random(seed)
+    now = timezone.now().isoformat()
+    counts = {}
+
+    project = Project.objects.create(
+        owner=owner,
+        title=title or f"Synthetic corpus (seed {seed})",
+        description=json.dumps(scale),
+    )
+
+    # The first type is the target of every other type's reference field
+    entity_types = []
+    for i in range(scale["entity_types"]):
+        target = entity_types[0].pk if entity_types else None
+        entity_types.append(
+            EntityType.objects.create(
+                project=project,
+                name=f"Type {i + 1}",
+                color=f"#{rng.randrange(0x1000000):06x}",
+                schema=entity_type_schema(target),
+            )
+        )
+
+    entity_ids = []
+    reference_ids = ()
+    for entity_type in entity_types:
+        ids = [uuid.uuid4() for _ in range(scale["entities_per_type"])]
+        counts[f"entities:{entity_type.name}"] = _copy(
+            "projects_entity",
+            ["id", "entity_type_id", "project_id", "metadata", "created_at", "updated_at"],
+            (
+                (
+                    pk,
+                    entity_type.pk,
+                    project.pk,
+                    json.dumps(entity_metadata(rng, entity_type.schema, n, reference_ids)),
+                    now,
+                    now,
+                )
+                for n, pk in enumerate(ids, len(entity_ids) + 1)
+            ),
+        )
+        if not reference_ids:
+            reference_ids = ids
+        entity_ids += ids
+
+    documents = Document.objects.bulk_create(
+        Document(project=project, title=f"Document {i + 1}")
+        for i in range(scale["documents"])
+    )
+
+    annotation_rows = []
+
+    def pages():
+        for document in documents:
+            for n in range(scale["pages_per_document"]):
+                page_id = uuid.uuid4()
+                text, offsets = page_text(rng, scale["page_chars"])
+                if entity_ids:
+                    for start, end in annotation_spans(
+                        rng, text, offsets, scale["annotations_per_1000_chars"]
+                    ):
+                        annotation_rows.append(
+                            (
+                                uuid.uuid4(),
+                                page_id,
+                                rng.choice(entity_ids),
+                                start,
+                                end,
+                                text[start:end],
+                                now,
+                                now,
+                            )
+                        )
+                yield (
+                    page_id,
+                    document.pk,
+                    (n + 1) * Page.ORDER_GAP,
+                    f"Page {n + 1}",
+                    text,
+                    None,
+                    len(text),
+                    0,
+                    None,
+                    now,
+                    now,
+                )
+
+    counts["pages"] = _copy(
+        "library_page",
+        [
+            "id", "document_id", "order", "title", "text", "image", "char_count",
+            "annotation_count", "last_edited_at", "created_at", "updated_at",
+        ],
+        pages(),
+    )
+    counts["annotations"] = _copy(
+        "annotation_annotation",
+        [
+            "id", "page_id", "entity_id", "start_offset", "end_offset",
+            "annotated_text", "created_at", "updated_at",
+        ],
+        annotation_rows,
+    )
+    counts["documents"] = len(documents)
+
+    for entity_type in entity_types:
+        refresh_entity_dates(entity_type_id=entity_type.pk)
+        refresh_entity_locations(entity_type_id=entity_type.pk)
+    reconcile_stats(project)
+
+    with connection.cursor() as cursor:
+        for table in (
+            "projects_entity",
+            "projects_entitydate",
+            "projects_entitylocation",
+            "library_page",
+            "annotation_annotation",
+        ):
+            cursor.execute(f"ANALYZE {table}")
+    return project, counts
@@ -0,0 +1,82 @@
+"""
+apps/diagnostics/testing.py
+
+Query budgets for Django TestCases: an endpoint must run the same number of
+queries however many rows it reads, and no more than its budget. A failure
+lists the SQL of the larger run, repeated shapes (an N+1) first.
+"""
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from networkAnnotation.instrumentation import normalize_sql
+
+# Rows seeded before each measured call: the endpoint is measured at 10 and
+# at 1,000 rows
+SIZES = (10, 1000)
+
+
+def _report(queries):
+    shapes = {}
+    for query in queries:
+        shape = normalize_sql(query["sql"])
+        shapes[shape] = shapes.get(shape, 0) + 1
+    lines = [
+        f"  {count}x {shape}"
+        for shape, count in sorted(shapes.items(), key=lambda s: -s[1])
+        if count > 1
+    ]
+    if lines:
+        lines.insert(0, "Repeated query shapes:")
+    lines.append("Queries:")
+    lines += [f"  {n}. {query['sql']}" for n, query in enumerate(queries, 1)]
+    return "\n".join(lines)
+
+
+class QueryBudgetMixin:
+    def capture(self, call):
+        """(response, captured queries) of call(), with the cache emptied first."""
+        # Cached reads would hide queries that a cold request runs
+        cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            response = call()
+        if getattr(response, "streaming", False):
+            response.getvalue()
+        return response, captured.captured_queries
+
+    def assertQueryBudget(self, budget, call):
+        response, queries = self.capture(call)
+        self.assertLess(response.status_code, 400, f"Status {response.status_code}")
+        if len(queries) > budget:
+            self.fail(
+                f"{len(queries)} queries, over the budget of {budget}.\n{_report(queries)}"
+            )
+        return response
+
+    def assertConstantQueries(self, budget, seed, call, sizes=SIZES):
+        """
+        Grow the data with seed(n), which adds n rows, to each of `sizes` in
+        turn and call() at each size: the query count must stay the same and
+        within `budget`.
+        """
+        counts, seeded = [], 0
+        for size in sizes:
+            seed(size - seeded)
+            seeded = size
+            response, queries = self.capture(call)
+            self.assertLess(
+                response.status_code, 400, f"Status {response.status_code} at {size} rows"
+            )
+            counts.append(len(queries))
+            if len(queries) > budget:
+                self.fail(
+                    f"{len(queries)} queries at {size} rows, over the budget of "
+                    f"{budget}.\n{_report(queries)}"
+                )
+        if len(set(counts)) > 1:
+            self.fail(
+                "The query count grows with the data: "
+                + ", ".join(f"{n} at {size} rows" for n, size in zip(counts, sizes))
+                + f".\n{_report(queries)}"
+            )
@@ -0,0 +1,36 @@
+# tests/test_sampler.py
+import os
+import sys
+import threading
+import time
+
+from apps.diagnostics.sampler import _BASE_DIR, StackSampler, collapse, top_frames
+
+# This file as collapse() names it
+HERE = os.path.relpath(os.path.realpath(__file__), _BASE_DIR)
+
+
+def busy(until):
+    while time.perf_counter() < until:
+        pass
+
+
+def test_collapse_is_root_first():
+    stack = collapse(sys._getframe())
+    assert stack.split(";")[-1].startswith(f"test_collapse_is_root_first ({HERE}:")
+
+
+def test_sampler_records_the_profiled_thread():
+    with StackSampler({threading.get_ident()}, interval=0.001) as sampler:
+        busy(time.perf_counter() + 0.1)
+    assert sampler.sample_count > 0
+    collapsed = sampler.collapsed()
+    assert f"busy ({HERE}:" in collapsed
+    frame, samples = top_frames(collapsed)[0]
+    assert frame.startswith("busy ")
+    assert samples <= sampler.sample_count
+
+
+def test_top_frames_counts_leaves():
+    collapsed = "a;b;c 3\na;c 2\na;b 4\n"
+    assert top_frames(collapsed) == [("c", 5), ("b", 4)]
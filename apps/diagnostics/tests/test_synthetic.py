@@ -0,0 +1,43 @@
+# tests/test_synthetic.py
+import random
+import uuid
+
+from apps.diagnostics.synthetic import (
+    annotation_spans,
+    entity_metadata,
+    entity_type_schema,
+    page_text,
+)
+from apps.projects.schema_definitions.registry import FIELD_REGISTRY
+from apps.projects.services.schema_service import validate_metadata
+
+
+def test_schema_uses_every_field_type():
+    schema = entity_type_schema(uuid.uuid4())
+    assert {f["type"] for f in schema} == set(FIELD_REGISTRY)
+    assert schema[0]["name"] == "display_name"
+    assert "reference" not in {f["type"] for f in entity_type_schema()}
+
+
+def test_generated_metadata_is_valid():
+    rng = random.Random(1)
+    schema = entity_type_schema()
+    for n in range(200):
+        validate_metadata(schema, entity_metadata(rng, schema, n))
+
+
+def test_annotation_spans_are_on_word_boundaries():
+    rng = random.Random(2)
+    text, offsets = page_text(rng, 2000)
+    assert len(text) >= 2000
+    spans = annotation_spans(rng, text, offsets, 10)
+    assert len(spans) == round(len(text) * 10 / 1000)
+    for start, end in spans:
+        assert start == 0 or text[start - 1] == " "
+        assert end == len(text) or text[end] == " "
+        assert end > start
+
+
+def test_same_seed_same_text():
+    assert page_text(random.Random(3), 500) == page_text(random.Random(3), 500)
+
@@ -0,0 +1,79 @@
+"""
+apps/library/api.py
+
+JSON API endpoints for managing documents and their pages (e.g. drag-and-drop
+page reordering). All endpoints require login and return JSON.
+"""
+
+import json
+
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_http_methods
+
+from apps.annotation.api import json_error
+from .models import Document, Page
+from .services.page_order import move_page, reorder_pages
+
+
+# ---- PAGE ORDER ----
+
+
+@login_required
+@require_http_methods(["POST"])
+def page_move(request, document_id, page_id):
+    """
+    POST -- move one page, e.g. after a drag-and-drop.
+
+    Accepts: { "before_id": "..." }  -- the page to drop in front of,
+                                        or null to move to the end
+    Returns: { "id": "...", "order": n }
+    """
+    page = get_object_or_404(
+        Page.objects.only("id", "document_id", "order"),
+        pk=page_id,
+        document_id=document_id,
+        document__pending_delete=False,
+    )
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return json_error("Invalid JSON")
+
+    try:
+        order = move_page(page, before_id=data.get("before_id"))
+    except (Page.DoesNotExist, ValueError, ValidationError):
+        return json_error("before_id must be a page in the same document.")
+
+    return JsonResponse({"id": str(page.id), "order": order})
+
+
+@login_required
+@require_http_methods(["PUT"])
+def pages_reorder(request, document_id):
+    """
+    PUT -- replace the page order of a whole document.
+
+    Accepts: { "page_ids": ["...", ...] }  -- every page in the document, in the new order
+    Returns: { "updated": n }
+    """
+    document = get_object_or_404(Document, pk=document_id, pending_delete=False)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return json_error("Invalid JSON")
+
+    page_ids = data.get("page_ids")
+    if not isinstance(page_ids, list):
+        return json_error("'page_ids' must be a list.")
+
+    try:
+        updated = reorder_pages(document, page_ids)
+    except ValueError as e:
+        return json_error(str(e))
+
+    return JsonResponse({"updated": updated})
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:06
+
+import django.db.models.constraints
+from django.db import migrations, models
+
+
+# Documents that already have several pages with the same `order` get
+# renumbered (keeping their current reading order) so the constraint can apply.
+RENUMBER_DUPLICATES = """
+UPDATE library_page AS p
+SET "order" = ranked.rn * 1024
+FROM (
+    SELECT id, row_number() OVER (
+        PARTITION BY document_id ORDER BY "order", created_at, id
+    ) AS rn
+    FROM library_page
+    WHERE document_id IN (
+        SELECT document_id FROM library_page
+        GROUP BY document_id, "order" HAVING count(*) > 1
+    )
+) AS ranked
+WHERE p.id = ranked.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(RENUMBER_DUPLICATES, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='page',
+            constraint=models.UniqueConstraint(deferrable=django.db.models.constraints.Deferrable['DEFERRED'], fields=('document', 'order'), name='page_unique_order_per_document'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:07
+
+from django.db import migrations, models
+
+
+BACKFILL_COUNTERS = """
+UPDATE library_page AS p
+SET char_count = char_length(p.text),
+    annotation_count = COALESCE(a.n, 0),
+    last_edited_at = GREATEST(p.updated_at, a.last_annotated_at)
+FROM library_page AS p2
+LEFT JOIN (
+    SELECT page_id, count(*) AS n, max(updated_at) AS last_annotated_at
+    FROM annotation_annotation
+    GROUP BY page_id
+) AS a ON a.page_id = p2.id
+WHERE p.id = p2.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0002_page_unique_order'),
+        ('annotation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='annotation_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='char_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='last_edited_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunSQL(BACKFILL_COUNTERS, migrations.RunSQL.noop),
+    ]
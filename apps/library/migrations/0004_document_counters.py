@@ -0,0 +1,45 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:11
+
+from django.db import migrations, models
+
+
+BACKFILL_COUNTERS = """
+UPDATE library_document AS d
+SET page_count = COALESCE(p.pages, 0),
+    annotation_count = COALESCE(p.annotations, 0),
+    char_count = COALESCE(p.chars, 0)
+FROM library_document AS d2
+LEFT JOIN (
+    SELECT document_id, count(*) AS pages,
+           sum(annotation_count) AS annotations, sum(char_count) AS chars
+    FROM library_page
+    GROUP BY document_id
+) AS p ON p.document_id = d2.id
+WHERE d.id = d2.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0003_page_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='annotation_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='char_count',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='page_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(BACKFILL_COUNTERS, migrations.RunSQL.noop),
+    ]
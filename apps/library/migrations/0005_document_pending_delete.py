@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0004_document_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='pending_delete',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
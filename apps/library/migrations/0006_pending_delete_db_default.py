@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 04:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0005_document_pending_delete'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='document',
+            name='pending_delete',
+            field=models.BooleanField(db_default=False, default=False, editable=False),
+        ),
+    ]
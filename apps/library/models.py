@@ -1,6 +1,11 @@
-from django.db import models
+from django.apps import apps
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, Greatest, Length, Substr
+from django.utils import timezone
+from django.utils.functional import cached_property
 import uuid
-from apps.projects.models import Project
+from apps.projects.models import CounterQuerySet, Project, ProjectStats
+from apps.projects.services.stats_service import forget_annotations
 
 
 class Document(models.Model):
@@ -10,14 +15,145 @@ class Document(models.Model):
     )
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
+    # Denormalized totals over the document's pages, kept by Page and Annotation
+    page_count = models.PositiveIntegerField(default=0, editable=False)
+    annotation_count = models.PositiveIntegerField(default=0, editable=False)
+    char_count = models.PositiveBigIntegerField(default=0, editable=False)
+    # Hidden and waiting for a DeletionJob to remove it. Defaulted in the
+    # database too, for the raw INSERTs of services/project_clone.py
+    pending_delete = models.BooleanField(default=False, db_default=False, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CounterQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
+    @property
+    def annotation_density(self):
+        """Annotations per 1,000 characters of text."""
+        if not self.char_count:
+            return 0
+        return self.annotation_count * 1000 / self.char_count
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                ProjectStats.objects.filter(project_id=self.project_id).bump(
+                    document_count=1
+                )
+
+    def delete(self, *args, **kwargs):
+        Annotation = apps.get_model("annotation", "Annotation")
+        with transaction.atomic():
+            # Pages and annotations go with the document through the cascade,
+            # so take them off the project totals in bulk
+            forget_annotations(Annotation.objects.filter(page__document=self))
+            empty_pages = self.pages.filter(annotation_count=0).count()
+            result = super().delete(*args, **kwargs)
+            ProjectStats.objects.filter(project_id=self.project_id).bump(
+                document_count=-1,
+                page_count=-self.page_count,
+                empty_page_count=-empty_pages,
+                annotation_count=-self.annotation_count,
+                char_count=-self.char_count,
+            )
+        return result
+
+
+class PageQuerySet(models.QuerySet):
+    # `order` is unique per document, so neighbours are a single index probe
+    # on (document, order) rather than a scan of the document's pages.
+
+    def before(self, page):
+        """Pages preceding `page` in its document, nearest first."""
+        return self.filter(document=page.document_id, order__lt=page.order).order_by(
+            "-order"
+        )
+
+    def after(self, page):
+        """Pages following `page` in its document, nearest first."""
+        return self.filter(document=page.document_id, order__gt=page.order).order_by(
+            "order"
+        )
+
+    def with_neighbors(self):
+        """Annotate each page with `prev_page_id` and `next_page_id` (or None)."""
+        siblings = Page.objects.filter(document=models.OuterRef("document"))
+        return self.annotate(
+            prev_page_id=models.Subquery(
+                siblings.filter(order__lt=models.OuterRef("order"))
+                .order_by("-order")
+                .values("id")[:1]
+            ),
+            next_page_id=models.Subquery(
+                siblings.filter(order__gt=models.OuterRef("order"))
+                .order_by("order")
+                .values("id")[:1]
+            ),
+        )
+
+    def listing(self):
+        """
+        For page lists: skip the text itself and fetch only a short preview.
+        Sizes and counts come from the denormalized counter columns.
+        """
+        return self.defer("text").annotate(
+            preview=Substr("text", 1, Page.PREVIEW_LENGTH + 1)
+        )
+
+    def touch(self, annotation_delta=0):
+        """
+        Record an annotation write on these pages: bump `last_edited_at` and
+        adjust `annotation_count` by `annotation_delta`. One UPDATE.
+        """
+        return self.update(
+            # Clamped so a drifted counter can't trip the non-negative check
+            annotation_count=Greatest(
+                models.F("annotation_count") + annotation_delta, 0
+            ),
+            last_edited_at=timezone.now(),
+        )
+
+    def refresh_counters(self):
+        """Recompute `char_count` and `annotation_count` from scratch, set-based."""
+        Annotation = apps.get_model("annotation", "Annotation")
+        counts = (
+            Annotation.objects.filter(page=models.OuterRef("pk"))
+            .order_by()
+            .values("page")
+            .annotate(n=models.Count("*"))
+            .values("n")
+        )
+        return self.update(
+            char_count=Length("text"),
+            annotation_count=Coalesce(models.Subquery(counts), 0),
+        )
+
+    def with_text_window(self, start, end):
+        """
+        Defer the full text and annotate each page with `text_length` and
+        `text_window` (the slice [start, end) of its text), computed in the DB.
+        """
+        return self.defer("text").annotate(
+            text_length=Length("text"),
+            # Substr is 1-indexed
+            text_window=Substr("text", start + 1, max(end - start, 0)),
+        )
+
 
 class Page(models.Model):
+    # Number of characters of page text sent to the canvas per request
+    TEXT_WINDOW_SIZE = 20000
+    # Spacing between consecutive `order` values, leaving room to move pages
+    # between neighbours without renumbering (see services/page_order.py)
+    ORDER_GAP = 1024
+    # Characters of text shown per page in page listings
+    PREVIEW_LENGTH = 80
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     document = models.ForeignKey(
         Document, on_delete=models.CASCADE, related_name="pages"
@@ -26,11 +162,79 @@ class Page(models.Model):
     title = models.CharField(max_length=200, blank=True)
     text = models.TextField(blank=True)
     image = models.ImageField(upload_to="pages/", blank=True, null=True)
+    # Denormalized so page listings never need to read `text` or count annotations.
+    # char_count is kept by save(); annotation_count and last_edited_at by Annotation.
+    char_count = models.PositiveIntegerField(default=0, editable=False)
+    annotation_count = models.PositiveIntegerField(default=0, editable=False)
+    last_edited_at = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PageQuerySet.as_manager()
+
     class Meta:
         ordering = ["order"]
+        constraints = [
+            # Deferred so set-based renumbering can pass through duplicates mid-statement
+            models.UniqueConstraint(
+                fields=["document", "order"],
+                name="page_unique_order_per_document",
+                deferrable=models.Deferrable.DEFERRED,
+            ),
+        ]
 
     def __str__(self):
-        return self.title or f"Page {self.order}"
+        return self.title or f"Page {self.position}"
+
+    @cached_property
+    def position(self):
+        """
+        1-based place of the page in its document's reading order (an
+        index-only count). `order` is spaced out, so it is not the page number.
+        Assign it when the position is already known, to save the query.
+        """
+        return (
+            Page.objects.filter(document_id=self.document_id, order__lt=self.order).count()
+            + 1
+        )
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        old_char_count = 0 if adding else self.char_count
+        # Only refresh the counter when the text is actually loaded
+        if "text" not in self.get_deferred_fields():
+            self.char_count = len(self.text)
+        self.last_edited_at = timezone.now()
+        update_fields = kwargs.get("update_fields")
+        if update_fields:
+            kwargs["update_fields"] = {*update_fields, "char_count", "last_edited_at"}
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            page_delta = 1 if adding else 0
+            char_delta = self.char_count - old_char_count
+            Document.objects.filter(pk=self.document_id).bump(
+                page_count=page_delta, char_count=char_delta
+            )
+            # New pages start out without annotations
+            ProjectStats.objects.filter(project__documents=self.document_id).bump(
+                page_count=page_delta,
+                empty_page_count=page_delta,
+                char_count=char_delta,
+            )
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            # Annotations go with the page through the cascade
+            removed = forget_annotations(self.annotations.all())
+            result = super().delete(*args, **kwargs)
+            Document.objects.filter(pk=self.document_id).bump(
+                page_count=-1, annotation_count=-removed, char_count=-self.char_count
+            )
+            ProjectStats.objects.filter(project__documents=self.document_id).bump(
+                page_count=-1,
+                empty_page_count=-1 if removed == 0 else 0,
+                annotation_count=-removed,
+                char_count=-self.char_count,
+            )
+        return result
@@ -0,0 +1,142 @@
+"""
+apps/library/services/page_order.py
+
+Page ordering within a document.
+
+`Page.order` values are spaced Page.ORDER_GAP apart, so moving a page between
+two others usually just takes the midpoint of their orders -- a single-row
+UPDATE. When two neighbours have no room left between them, the whole document
+is renumbered with one set-based UPDATE. The (document, order) unique
+constraint is deferred, so renumbering never trips over transient duplicates.
+"""
+
+import uuid
+
+from django.db import connection, transaction
+
+from apps.library.models import Document, Page
+
+
+def next_order(document):
+    """The `order` for a page appended to the end of `document`."""
+    last_order = (
+        document.pages.order_by("-order").values_list("order", flat=True).first()
+    )
+    return Page.ORDER_GAP if last_order is None else last_order + Page.ORDER_GAP
+
+
+def renumber_pages(document_id):
+    """
+    Respace every page of a document ORDER_GAP apart, keeping the current
+    reading order. One UPDATE, regardless of the number of pages.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE library_page AS p
+            SET "order" = ranked.rn * %s
+            FROM (
+                SELECT id, row_number() OVER (ORDER BY "order", id) AS rn
+                FROM library_page
+                WHERE document_id = %s
+            ) AS ranked
+            WHERE p.id = ranked.id
+            """,
+            [Page.ORDER_GAP, document_id],
+        )
+        return cursor.rowcount
+
+
+def _slot_before(document_id, page_id, before):
+    """
+    Return a free `order` value just before `before` (or at the end of the
+    document when `before` is None), ignoring `page_id` itself.
+    Returns None when there is no gap left.
+    """
+    others = Page.objects.filter(document_id=document_id).exclude(pk=page_id)
+
+    if before is None:
+        last_order = (
+            others.order_by("-order").values_list("order", flat=True).first()
+        )
+        return Page.ORDER_GAP if last_order is None else last_order + Page.ORDER_GAP
+
+    upper = before.order
+    lower = (
+        others.filter(order__lt=upper)
+        .order_by("-order")
+        .values_list("order", flat=True)
+        .first()
+    )
+    # Orders are non-negative, so pretend there's a page at -1 before the first one
+    lower = -1 if lower is None else lower
+    if upper - lower < 2:
+        return None
+    return (lower + upper) // 2
+
+
+@transaction.atomic
+def move_page(page, before_id=None):
+    """
+    Move `page` so it sits directly before the page `before_id` in the same
+    document, or to the end of the document when `before_id` is None.
+    Returns the page's new `order`.
+
+    Raises Page.DoesNotExist if `before_id` isn't a page of the same document,
+    or ValidationError if it isn't a UUID.
+    """
+    # Serialise moves within a document without locking all of its pages
+    Document.objects.select_for_update().filter(pk=page.document_id).first()
+
+    before = None
+    if before_id is not None:
+        before = Page.objects.only("id", "order").get(
+            pk=before_id, document_id=page.document_id
+        )
+        if before.pk == page.pk:
+            return page.order
+
+    new_order = _slot_before(page.document_id, page.pk, before)
+    if new_order is None:
+        renumber_pages(page.document_id)
+        before.refresh_from_db(fields=["order"])
+        new_order = _slot_before(page.document_id, page.pk, before)
+
+    Page.objects.filter(pk=page.pk).update(order=new_order)
+    page.order = new_order
+    return new_order
+
+
+@transaction.atomic
+def reorder_pages(document, page_ids):
+    """
+    Set the complete page order of a document in one UPDATE.
+    `page_ids` must list every page of the document exactly once.
+
+    Raises ValueError if it doesn't.
+    """
+    Document.objects.select_for_update().filter(pk=document.pk).first()
+
+    try:
+        page_ids = [str(uuid.UUID(str(page_id))) for page_id in page_ids]
+    except ValueError:
+        raise ValueError("page_ids must be page UUIDs.") from None
+    if len(set(page_ids)) != len(page_ids):
+        raise ValueError("page_ids contains duplicates.")
+    if len(page_ids) != document.pages.count():
+        raise ValueError("page_ids must list every page in the document.")
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE library_page AS p
+            SET "order" = ids.position * %s
+            FROM unnest(%s::uuid[]) WITH ORDINALITY AS ids(id, position)
+            WHERE p.id = ids.id AND p.document_id = %s
+            """,
+            [Page.ORDER_GAP, page_ids, document.pk],
+        )
+        if cursor.rowcount != len(page_ids):
+            # Rolls back the UPDATE along with the transaction
+            raise ValueError("page_ids must list every page in the document.")
+        return cursor.rowcount
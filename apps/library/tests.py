@@ -0,0 +1,74 @@
+import json
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+from apps.diagnostics.testing import QueryBudgetMixin
+from apps.library.models import Document, Page
+from apps.projects.models import Project
+
+
+class LibraryQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("librarian", password="x")
+        cls.project = Project.objects.create(owner=cls.user, title="Budgets")
+        cls.document = Document.objects.create(project=cls.project, title="Letters")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.page_count = 0
+
+    def add_pages(self, n):
+        Page.objects.bulk_create(
+            Page(
+                document=self.document,
+                order=(i + 1) * Page.ORDER_GAP,
+                title=f"Page {i + 1}",
+                text="Dear sir, " * 50,
+            )
+            for i in range(self.page_count, self.page_count + n)
+        )
+        self.page_count += n
+
+    def test_document_detail(self):
+        url = reverse(
+            "library:document_detail", args=[self.project.pk, self.document.pk]
+        )
+        # session, user, project, document, the listed pages, position count
+        self.assertConstantQueries(6, self.add_pages, lambda: self.client.get(url))
+
+
+class PageOrderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("librarian", password="x")
+        cls.project = Project.objects.create(owner=cls.user, title="Orders")
+        cls.document = Document.objects.create(project=cls.project, title="Letters")
+        cls.pages = Page.objects.bulk_create(
+            Page(document=cls.document, order=(i + 1) * Page.ORDER_GAP, text="")
+            for i in range(3)
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_label_is_the_position(self):
+        page = Page.objects.get(pk=self.pages[2].pk)
+        self.assertEqual(str(page), "Page 3")
+
+    def test_malformed_ids_are_rejected(self):
+        move = reverse("library:page_move", args=[self.document.pk, self.pages[0].pk])
+        response = self.client.post(
+            move, json.dumps({"before_id": "nope"}), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+        reorder = reverse("library:pages_reorder", args=[self.document.pk])
+        response = self.client.put(
+            reorder,
+            json.dumps({"page_ids": ["nope", "x", "y"]}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = "library"
 
@@ -46,4 +46,15 @@ urlpatterns = [
         views.page_delete,
         name="page_delete",
     ),
+    # Page order API
+    path(
+        "api/documents/<uuid:document_id>/pages/order/",
+        api.pages_reorder,
+        name="pages_reorder",
+    ),
+    path(
+        "api/documents/<uuid:document_id>/pages/<uuid:page_id>/move/",
+        api.page_move,
+        name="page_move",
+    ),
 ]
@@ -1,9 +1,18 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-
-from apps.projects.models import Project
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+
+from apps.annotation.serializers import (
+    page_annotations,
+    serialize_annotation,
+    serialize_entity_types,
+)
+from apps.projects.services.deletion import schedule_document_deletion
+from apps.projects.services.project_cache import get_project_or_404
 from .models import Document, Page
+from .services.page_order import next_order
 
 
 # ---- DOCUMENT VIEWS ----
@@ -11,7 +20,7 @@ from .models import Document, Page
 
 @login_required
 def document_create(request, project_id):
-    project = get_object_or_404(Project, pk=project_id)
+    project = get_project_or_404(project_id)
 
     if request.method == "POST":
         title = request.POST.get("title", "").strip()
@@ -42,11 +51,45 @@ def document_create(request, project_id):
     )
 
 
+# Pages per screen in the document page list
+PAGES_PER_LISTING = 100
+
+
 @login_required
 def document_detail(request, project_id, document_id):
-    project = get_object_or_404(Project, pk=project_id)
-    document = get_object_or_404(Document, pk=document_id, project=project)
-    pages = document.pages.all()  # ordered by `order` via Meta
+    project = get_project_or_404(project_id)
+    document = get_object_or_404(
+        Document, pk=document_id, project=project, pending_delete=False
+    )
+
+    # Keyset pagination on `order` (unique per document): ?after=<order> for the
+    # next screen, ?before=<order> for the previous one. No OFFSET scans.
+    try:
+        after = int(request.GET["after"]) if "after" in request.GET else None
+        before = int(request.GET["before"]) if "before" in request.GET else None
+    except ValueError:
+        after = before = None
+
+    pages = document.pages.listing()  # ordered by `order` via Meta
+    if before is not None:
+        pages = list(
+            pages.filter(order__lt=before).order_by("-order")[: PAGES_PER_LISTING + 1]
+        )
+        has_prev = len(pages) > PAGES_PER_LISTING
+        pages = pages[:PAGES_PER_LISTING][::-1]
+        has_next = True
+    else:
+        if after is not None:
+            pages = pages.filter(order__gt=after)
+        pages = list(pages[: PAGES_PER_LISTING + 1])
+        has_next = len(pages) > PAGES_PER_LISTING
+        pages = pages[:PAGES_PER_LISTING]
+        has_prev = after is not None
+
+    # Position of the first listed page, for the "#" column (an index-only count)
+    first_position = (
+        document.pages.filter(order__lt=pages[0].order).count() + 1 if pages else 1
+    )
 
     return render(
         request,
@@ -55,6 +98,9 @@ def document_detail(request, project_id, document_id):
             "project": project,
             "document": document,
             "pages": pages,
+            "first_position": first_position,
+            "prev_cursor": pages[0].order if pages and has_prev else None,
+            "next_cursor": pages[-1].order if pages and has_next else None,
             "breadcrumbs": [
                 {"label": "Projects", "link": "/projects/"},
                 {"label": project.title, "link": f"/projects/{project_id}/"},
@@ -66,8 +112,10 @@ def document_detail(request, project_id, document_id):
 
 @login_required
 def document_edit(request, project_id, document_id):
-    project = get_object_or_404(Project, pk=project_id)
-    document = get_object_or_404(Document, pk=document_id, project=project)
+    project = get_project_or_404(project_id)
+    document = get_object_or_404(
+        Document, pk=document_id, project=project, pending_delete=False
+    )
 
     if request.method == "POST":
         title = request.POST.get("title", "").strip()
@@ -105,11 +153,14 @@ def document_edit(request, project_id, document_id):
 
 @login_required
 def document_delete(request, project_id, document_id):
-    project = get_object_or_404(Project, pk=project_id)
-    document = get_object_or_404(Document, pk=document_id, project=project)
+    project = get_project_or_404(project_id)
+    document = get_object_or_404(
+        Document, pk=document_id, project=project, pending_delete=False
+    )
 
     if request.method == "POST":
-        document.delete()
+        # The pages and annotations go in the background, see services/deletion.py
+        schedule_document_deletion(document, request.user)
         return redirect("projects:detail", pk=project_id)
 
     return render(
@@ -132,8 +183,10 @@ def document_delete(request, project_id, document_id):
 
 @login_required
 def page_create(request, project_id, document_id):
-    project = get_object_or_404(Project, pk=project_id)
-    document = get_object_or_404(Document, pk=document_id, project=project)
+    project = get_project_or_404(project_id)
+    document = get_object_or_404(
+        Document, pk=document_id, project=project, pending_delete=False
+    )
 
     if request.method == "POST":
         files = request.FILES.getlist("files")
@@ -143,22 +196,20 @@ def page_create(request, project_id, document_id):
             # Sort files alphabetically by name so order is predictable
             files = sorted(files, key=lambda f: f.name)
 
-            # Find the current highest order value so we append correctly
-            last_order = (
-                document.pages.order_by("-order")
-                .values_list("order", flat=True)
-                .first()
-                or 0
-            )
-
-            for i, file in enumerate(files):
-                text = file.read().decode("utf-8")
-                Page.objects.create(
-                    document=document,
-                    order=last_order + i + 1,
-                    title=file.name,
-                    text=text,
-                )
+            with transaction.atomic():
+                # Lock the document, so concurrent uploads don't pick the same orders
+                Document.objects.select_for_update().filter(pk=document.pk).first()
+                # Append after the current last page, leaving gaps for later moves
+                first_order = next_order(document)
+
+                for i, file in enumerate(files):
+                    text = file.read().decode("utf-8")
+                    Page.objects.create(
+                        document=document,
+                        order=first_order + i * Page.ORDER_GAP,
+                        title=file.name,
+                        text=text,
+                    )
 
             messages.success(request, f"{len(files)} page(s) uploaded successfully.")
             return redirect(
@@ -188,15 +239,26 @@ def page_create(request, project_id, document_id):
 
 @login_required
 def page_detail(request, project_id, document_id, page_id):
-    project = get_object_or_404(Project, pk=project_id)
-    document = get_object_or_404(Document, pk=document_id, project=project)
-    page = get_object_or_404(Page, pk=page_id, document=document)
+    project = get_project_or_404(project_id)
+    document = get_object_or_404(
+        Document, pk=document_id, project=project, pending_delete=False
+    )
+    # Only the first window of text is embedded; the canvas fetches the rest on scroll.
+    # prev/next page ids come back from the same query.
+    page = get_object_or_404(
+        Page.objects.with_text_window(0, Page.TEXT_WINDOW_SIZE).with_neighbors(),
+        pk=page_id,
+        document=document,
+    )
+    prev_page_id = page.prev_page_id
+    next_page_id = page.next_page_id
 
-    # Get prev/next pages for navigation
-    pages = list(document.pages.values_list("id", flat=True))
-    current_index = pages.index(page.id)
-    prev_page_id = pages[current_index - 1] if current_index > 0 else None
-    next_page_id = pages[current_index + 1] if current_index < len(pages) - 1 else None
+    # Embedded so the canvas can render on first paint without waiting on the API
+    entity_types = serialize_entity_types(project)
+    annotations = [
+        serialize_annotation(a)
+        for a in page_annotations(page).overlapping(0, Page.TEXT_WINDOW_SIZE)
+    ]
 
     return render(
         request,
@@ -205,8 +267,12 @@ def page_detail(request, project_id, document_id, page_id):
             "project": project,
             "document": document,
             "page": page,
+            "entity_types": entity_types,
+            "annotations": annotations,
             "prev_page_id": prev_page_id,
             "next_page_id": next_page_id,
+            # The event stream needs an ASGI server, see annotation/api.py
+            "live_events": isinstance(request, ASGIRequest),
             "breadcrumbs": [
                 {"label": "Projects", "link": "/projects/"},
                 {"label": project.title, "link": f"/projects/{project_id}/"},
@@ -214,7 +280,7 @@ def page_detail(request, project_id, document_id, page_id):
                     "label": document.title,
                     "link": f"/projects/{project_id}/documents/{document_id}/",
                 },
-                {"label": page.title or f"Page {page.order}"},
+                {"label": str(page)},
             ],
         },
     )
@@ -222,8 +288,10 @@ def page_detail(request, project_id, document_id, page_id):
 
 @login_required
 def page_edit(request, project_id, document_id, page_id):
-    project = get_object_or_404(Project, pk=project_id)
-    document = get_object_or_404(Document, pk=document_id, project=project)
+    project = get_project_or_404(project_id)
+    document = get_object_or_404(
+        Document, pk=document_id, project=project, pending_delete=False
+    )
     page = get_object_or_404(Page, pk=page_id, document=document)
 
     if request.method == "POST":
@@ -254,7 +322,7 @@ def page_edit(request, project_id, document_id, page_id):
                     "link": f"/projects/{project_id}/documents/{document_id}/",
                 },
                 {
-                    "label": page.title or f"Page {page.order}",
+                    "label": str(page),
                     "link": f"/projects/{project_id}/documents/{document_id}/pages/{page_id}/",
                 },
                 {"label": "Edit"},
@@ -265,8 +333,10 @@ def page_edit(request, project_id, document_id, page_id):
 
 @login_required
 def page_delete(request, project_id, document_id, page_id):
-    project = get_object_or_404(Project, pk=project_id)
-    document = get_object_or_404(Document, pk=document_id, project=project)
+    project = get_project_or_404(project_id)
+    document = get_object_or_404(
+        Document, pk=document_id, project=project, pending_delete=False
+    )
     page = get_object_or_404(Page, pk=page_id, document=document)
 
     if request.method == "POST":
@@ -289,7 +359,7 @@ def page_delete(request, project_id, document_id, page_id):
                     "label": document.title,
                     "link": f"/projects/{project_id}/documents/{document_id}/",
                 },
-                {"label": page.title or f"Page {page.order}"},
+                {"label": str(page)},
             ],
         },
     )
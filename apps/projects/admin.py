@@ -1,7 +1,21 @@
 from django.contrib import admin
 
-from apps.projects.models import Project, EntityType, Entity
+from apps.projects.models import DeletionJob, Entity, EntityType, FilterIndexSync, Project
 
 admin.site.register(Project)
 admin.site.register(EntityType)
 admin.site.register(Entity)
+
+
+@admin.register(DeletionJob)
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_display = ("title", "kind", "status", "progress", "created_at", "finished_at")
+    list_filter = ("kind", "status")
+    readonly_fields = [f.name for f in DeletionJob._meta.fields]
+
+
+@admin.register(FilterIndexSync)
+class FilterIndexSyncAdmin(admin.ModelAdmin):
+    list_display = ("entity_type_id", "status", "created_at", "finished_at")
+    list_filter = ("status",)
+    readonly_fields = [f.name for f in FilterIndexSync._meta.fields]
@@ -0,0 +1,57 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.projects.models import Project
+from apps.projects.services.project_clone import clone_project
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy a project with set-based INSERT ... SELECT statements: all of it, "
+        "or with --template only its entity types and entities."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--project", required=True, help="UUID of the project to copy")
+        parser.add_argument(
+            "--owner", help="Username of the new project's owner (default: the same owner)"
+        )
+        parser.add_argument("--title", help="Title of the new project")
+        parser.add_argument(
+            "--template",
+            action="store_true",
+            help="Copy the entity types and entities only, no documents",
+        )
+        parser.add_argument(
+            "--members", action="store_true", help="Copy the editors and viewers too"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            source = Project.objects.select_related("owner").get(pk=options["project"])
+        except (Project.DoesNotExist, ValueError):
+            raise CommandError(f"Project {options['project']} does not exist.")
+        owner = None
+        if options["owner"]:
+            try:
+                owner = User.objects.get(username=options["owner"])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['owner']} does not exist.")
+
+        start = time.monotonic()
+        project, counts = clone_project(
+            source,
+            owner=owner,
+            title=options["title"],
+            library=not options["template"],
+            members=options["members"],
+        )
+        for table, rows in counts.items():
+            self.stdout.write(f"  {table}: {rows}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created project {project.pk} in {time.monotonic() - start:.1f}s."
+            )
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.projects.models import Project
+from apps.projects.services.stats_service import reconcile_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the dashboard counters and density histograms from the source tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--project", help="UUID of a single project to reconcile (default: all)"
+        )
+
+    def handle(self, *args, **options):
+        project = None
+        if options["project"]:
+            try:
+                project = Project.objects.get(pk=options["project"])
+            except (Project.DoesNotExist, ValueError):
+                raise CommandError(f"Project {options['project']} does not exist.")
+
+        processed = reconcile_stats(project)
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {processed} project(s)."))
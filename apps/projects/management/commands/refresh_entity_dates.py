@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.projects.services.entity_dates import refresh_entity_dates
+
+
+class Command(BaseCommand):
+    help = "Rebuild the normalized date ranges of every entity from its metadata."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = refresh_entity_dates()
+        self.stdout.write(self.style.SUCCESS(f"Stored {count} date range(s)."))
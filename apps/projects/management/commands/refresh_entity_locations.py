@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.projects.services.entity_locations import refresh_entity_locations
+
+
+class Command(BaseCommand):
+    help = "Rebuild the geohashed locations of every entity from its metadata."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = refresh_entity_locations()
+        self.stdout.write(self.style.SUCCESS(f"Stored {count} location(s)."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from apps.projects.services.deletion import run_pending_deletions
+
+
+class Command(BaseCommand):
+    help = "Remove the projects and documents queued for deletion, in batches."
+
+    def handle(self, *args, **options):
+        for job in run_pending_deletions():
+            rows = ", ".join(f"{table} {n}" for table, n in job.progress.items() if n)
+            self.stdout.write(f"{job}: {rows or 'nothing left'}")
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from apps.projects.services.entity_query import run_pending_index_syncs
+
+
+class Command(BaseCommand):
+    help = "Build and drop the metadata expression indexes queued by schema changes."
+
+    def handle(self, *args, **options):
+        for sync, created, dropped in run_pending_index_syncs():
+            for name in created:
+                self.stdout.write(f"{sync.entity_type_id}: created {name}")
+            for name in dropped:
+                self.stdout.write(f"{sync.entity_type_id}: dropped {name}")
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.projects.models import EntityType
+from apps.projects.services.schema_migration import run_pending_migrations
+
+
+class Command(BaseCommand):
+    help = "Rewrite entity metadata for every pending or interrupted schema change."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--entity-type", help="UUID of a single entity type (default: all)"
+        )
+
+    def handle(self, *args, **options):
+        entity_type = None
+        if options["entity_type"]:
+            try:
+                entity_type = EntityType.objects.get(pk=options["entity_type"])
+            except (EntityType.DoesNotExist, ValueError):
+                raise CommandError(
+                    f"Entity type {options['entity_type']} does not exist."
+                )
+
+        for migration in run_pending_migrations(entity_type):
+            self.stdout.write(
+                f"{migration}: {migration.processed_count} entities, "
+                f"{migration.failure_count} failed validation"
+            )
+            for failure in migration.failures:
+                self.stdout.write(
+                    f"  {failure['entity_id']} {failure['field']}: {failure['error']}"
+                )
+        self.stdout.write(self.style.SUCCESS("Done."))
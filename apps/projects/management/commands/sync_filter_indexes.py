@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from apps.projects.models import EntityType
+from apps.projects.services.entity_query import sync_filter_indexes
+
+
+class Command(BaseCommand):
+    help = "Create and drop metadata expression indexes to match the filterable schema fields."
+
+    def handle(self, *args, **options):
+        for entity_type in EntityType.objects.all():
+            created, dropped = sync_filter_indexes(entity_type)
+            for name in created:
+                self.stdout.write(f"{entity_type}: created {name}")
+            for name in dropped:
+                self.stdout.write(f"{entity_type}: dropped {name}")
+        self.stdout.write(self.style.SUCCESS("Done."))
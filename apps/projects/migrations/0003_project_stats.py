@@ -0,0 +1,74 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+BACKFILL_STATS = """
+INSERT INTO projects_projectstats (
+    project_id, document_count, page_count, empty_page_count,
+    char_count, entity_count, annotation_count, density_histogram
+)
+SELECT
+    p.id,
+    (SELECT count(*) FROM library_document d WHERE d.project_id = p.id),
+    (SELECT COALESCE(sum(d.page_count), 0) FROM library_document d WHERE d.project_id = p.id),
+    (SELECT count(*) FROM library_page pg
+       JOIN library_document d ON d.id = pg.document_id
+      WHERE d.project_id = p.id AND pg.annotation_count = 0),
+    (SELECT COALESCE(sum(d.char_count), 0) FROM library_document d WHERE d.project_id = p.id),
+    (SELECT count(*) FROM projects_entity e WHERE e.project_id = p.id),
+    (SELECT COALESCE(sum(d.annotation_count), 0) FROM library_document d WHERE d.project_id = p.id),
+    '[]'::jsonb
+FROM projects_project p;
+
+INSERT INTO projects_entitytypestats (entity_type_id, entity_count, annotation_count)
+SELECT
+    et.id,
+    (SELECT count(*) FROM projects_entity e WHERE e.entity_type_id = et.id),
+    (SELECT count(*) FROM annotation_annotation a
+       JOIN projects_entity e ON e.id = a.entity_id
+      WHERE e.entity_type_id = et.id)
+FROM projects_entitytype et;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0002_alter_entity_options'),
+        ('library', '0004_document_counters'),
+        ('annotation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntityTypeStats',
+            fields=[
+                ('entity_type', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='projects.entitytype')),
+                ('entity_count', models.PositiveIntegerField(default=0)),
+                ('annotation_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Entity type stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProjectStats',
+            fields=[
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='projects.project')),
+                ('document_count', models.PositiveIntegerField(default=0)),
+                ('page_count', models.PositiveIntegerField(default=0)),
+                ('empty_page_count', models.PositiveIntegerField(default=0)),
+                ('char_count', models.PositiveBigIntegerField(default=0)),
+                ('entity_count', models.PositiveIntegerField(default=0)),
+                ('annotation_count', models.PositiveIntegerField(default=0)),
+                ('density_histogram', models.JSONField(blank=True, default=list)),
+                ('histogram_updated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Project stats',
+            },
+        ),
+        migrations.RunSQL(BACKFILL_STATS, migrations.RunSQL.noop),
+    ]
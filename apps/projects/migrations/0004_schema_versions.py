@@ -0,0 +1,64 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:14
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+BACKFILL_VERSIONS = """
+INSERT INTO projects_schemaversion (entity_type_id, version, schema, created_at)
+SELECT id, 1, schema, now()
+FROM projects_entitytype
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0003_project_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entitytype',
+            name='schema_version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.CreateModel(
+            name='SchemaMigration',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('from_version', models.PositiveIntegerField()),
+                ('to_version', models.PositiveIntegerField()),
+                ('plan', models.JSONField(default=list)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('last_entity_id', models.UUIDField(blank=True, null=True)),
+                ('processed_count', models.PositiveIntegerField(default=0)),
+                ('failure_count', models.PositiveIntegerField(default=0)),
+                ('failures', models.JSONField(blank=True, default=list)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('entity_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schema_migrations', to='projects.entitytype')),
+            ],
+            options={
+                'ordering': ['entity_type', 'to_version'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SchemaVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('schema', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('entity_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schema_versions', to='projects.entitytype')),
+            ],
+            options={
+                'ordering': ['entity_type', 'version'],
+                'unique_together': {('entity_type', 'version')},
+            },
+        ),
+        migrations.RunSQL(BACKFILL_VERSIONS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,118 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:20
+
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+BOUNDS_FUNCTION = r"""
+CREATE OR REPLACE FUNCTION entity_date_bounds(value jsonb, OUT earliest date, OUT latest date)
+LANGUAGE plpgsql IMMUTABLE AS $$
+DECLARE
+    iso text;
+    date_precision text;
+    d date;
+    y int;
+    width int;
+BEGIN
+    IF jsonb_typeof(value) = 'object' THEN
+        iso := value ->> 'iso';
+        date_precision := COALESCE(value ->> 'precision', 'day');
+    ELSIF jsonb_typeof(value) = 'string' THEN
+        iso := value #>> '{}';
+        IF iso ~ '^\d{4}$' THEN
+            iso := iso || '-01-01';
+            date_precision := 'year';
+        ELSIF iso ~ '^\d{4}-\d{2}$' THEN
+            iso := iso || '-01';
+            date_precision := 'month';
+        ELSE
+            date_precision := 'day';
+        END IF;
+    ELSE
+        RETURN;
+    END IF;
+
+    IF iso IS NULL OR iso LIKE '0000-%' OR iso !~ '^\d{4}-\d{2}-\d{2}' THEN
+        RETURN;
+    END IF;
+    BEGIN
+        d := left(iso, 10)::date;
+    EXCEPTION WHEN others THEN
+        RETURN;
+    END;
+    y := extract(year FROM d)::int;
+
+    CASE date_precision
+        WHEN 'day' THEN
+            earliest := d;
+            latest := d;
+        WHEN 'month' THEN
+            earliest := date_trunc('month', d)::date;
+            latest := (date_trunc('month', d) + interval '1 month - 1 day')::date;
+        WHEN 'year' THEN
+            earliest := make_date(y, 1, 1);
+            latest := make_date(y, 12, 31);
+        ELSE
+            width := CASE date_precision
+                WHEN 'decade' THEN 10
+                WHEN 'quarter_century' THEN 25
+                WHEN 'century' THEN 100
+            END;
+            IF width IS NULL THEN
+                RETURN;
+            END IF;
+            earliest := make_date(greatest(y / width * width, 1), 1, 1);
+            latest := make_date(y / width * width + width - 1, 12, 31);
+    END CASE;
+END;
+$$;
+"""
+
+BACKFILL_DATES = """
+INSERT INTO projects_entitydate (entity_id, entity_type_id, field, earliest, latest)
+SELECT e.id, e.entity_type_id, f.name, b.earliest, b.latest
+FROM projects_entity e
+JOIN projects_entitytype et ON et.id = e.entity_type_id
+CROSS JOIN LATERAL (
+    SELECT DISTINCT elem ->> 'name' AS name
+    FROM jsonb_array_elements(
+        CASE WHEN jsonb_typeof(et.schema) = 'array' THEN et.schema ELSE '[]' END
+    ) AS elem
+    WHERE elem ->> 'type' = 'date'
+) AS f
+CROSS JOIN LATERAL entity_date_bounds(e.metadata -> f.name) AS b
+WHERE b.earliest IS NOT NULL
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0004_schema_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntityDate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=100)),
+                ('earliest', models.DateField()),
+                ('latest', models.DateField()),
+                ('span', models.GeneratedField(db_persist=True, expression=models.Func('earliest', 'latest', models.Value('[]'), function='daterange', output_field=django.contrib.postgres.fields.ranges.DateRangeField()), output_field=django.contrib.postgres.fields.ranges.DateRangeField())),
+                ('entity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dates', to='projects.entity')),
+                ('entity_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='projects.entitytype')),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GistIndex(fields=['entity_type', 'field', 'span'], name='entitydate_span_gist'), models.Index(fields=['entity_type', 'field', 'earliest', 'latest'], name='entitydate_earliest_idx')],
+                'unique_together': {('entity', 'field')},
+            },
+        ),
+        migrations.RunSQL(
+            BOUNDS_FUNCTION,
+            "DROP FUNCTION IF EXISTS entity_date_bounds(jsonb)",
+        ),
+        migrations.RunSQL(BACKFILL_DATES, migrations.RunSQL.noop),
+    ]
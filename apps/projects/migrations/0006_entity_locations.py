@@ -0,0 +1,105 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+GEOHASH_FUNCTION = r"""
+CREATE OR REPLACE FUNCTION geohash_encode(lat double precision, long double precision, len int)
+RETURNS text LANGUAGE plpgsql IMMUTABLE STRICT AS $$
+DECLARE
+    base32 CONSTANT text := '0123456789bcdefghjkmnpqrstuvwxyz';
+    lat_lo double precision := -90;
+    lat_hi double precision := 90;
+    long_lo double precision := -180;
+    long_hi double precision := 180;
+    mid double precision;
+    hash text := '';
+    bits int := 0;
+    bit_count int := 0;
+    even boolean := true;
+BEGIN
+    WHILE length(hash) < len LOOP
+        IF even THEN
+            mid := (long_lo + long_hi) / 2;
+            IF long >= mid THEN
+                bits := bits * 2 + 1;
+                long_lo := mid;
+            ELSE
+                bits := bits * 2;
+                long_hi := mid;
+            END IF;
+        ELSE
+            mid := (lat_lo + lat_hi) / 2;
+            IF lat >= mid THEN
+                bits := bits * 2 + 1;
+                lat_lo := mid;
+            ELSE
+                bits := bits * 2;
+                lat_hi := mid;
+            END IF;
+        END IF;
+        even := NOT even;
+        bit_count := bit_count + 1;
+        IF bit_count = 5 THEN
+            hash := hash || substr(base32, bits + 1, 1);
+            bits := 0;
+            bit_count := 0;
+        END IF;
+    END LOOP;
+    RETURN hash;
+END;
+$$;
+"""
+
+BACKFILL_LOCATIONS = """
+INSERT INTO projects_entitylocation (entity_id, entity_type_id, field, lat, long, geohash)
+SELECT e.id, e.entity_type_id, f.name, p.lat, p.long, geohash_encode(p.lat, p.long, 9)
+FROM projects_entity e
+JOIN projects_entitytype et ON et.id = e.entity_type_id
+CROSS JOIN LATERAL (
+    SELECT DISTINCT elem ->> 'name' AS name
+    FROM jsonb_array_elements(
+        CASE WHEN jsonb_typeof(et.schema) = 'array' THEN et.schema ELSE '[]' END
+    ) AS elem
+    WHERE elem ->> 'type' = 'latlong'
+) AS f
+CROSS JOIN LATERAL (
+    SELECT (e.metadata -> f.name ->> 'lat')::double precision AS lat,
+           (e.metadata -> f.name ->> 'long')::double precision AS long
+    WHERE jsonb_typeof(e.metadata -> f.name -> 'lat') = 'number'
+      AND jsonb_typeof(e.metadata -> f.name -> 'long') = 'number'
+) AS p
+WHERE p.lat BETWEEN -90 AND 90 AND p.long BETWEEN -180 AND 180
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0005_entity_dates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntityLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=100)),
+                ('lat', models.FloatField()),
+                ('long', models.FloatField()),
+                ('geohash', models.CharField(db_collation='C', max_length=12)),
+                ('entity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='locations', to='projects.entity')),
+                ('entity_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='projects.entitytype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['entity_type', 'field', 'geohash'], include=('lat', 'long', 'entity'), name='entityloc_geohash_idx')],
+                'unique_together': {('entity', 'field')},
+            },
+        ),
+        migrations.RunSQL(
+            GEOHASH_FUNCTION,
+            "DROP FUNCTION IF EXISTS geohash_encode(double precision, double precision, int)",
+        ),
+        migrations.RunSQL(BACKFILL_LOCATIONS, migrations.RunSQL.noop),
+    ]
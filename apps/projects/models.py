@@ -1,13 +1,43 @@
 import uuid
 
-from django.db import models
+from django.contrib.postgres.fields import DateRangeField
+from django.contrib.postgres.indexes import GistIndex
+from django.db import models, transaction
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import User
 from colorfield.fields import ColorField
 
 # from tailwind.validate import ValidationError
 from django.core.exceptions import ValidationError
-from apps.projects.schema_definitions.registry import get_field_class
-from apps.projects.services.schema_service import deserialize_schema, validate_metadata
+from apps.projects.services.entity_dates import date_fields, refresh_entity_dates
+from apps.projects.services.entity_locations import (
+    location_fields,
+    refresh_entity_locations,
+)
+from apps.projects.services.entity_query import filterable_fields, queue_filter_index_sync
+from apps.projects.services.schema_service import (
+    deserialize_schema,
+    diff_schemas,
+    schema_hash,
+    validate_metadata,
+)
+
+
+class CounterQuerySet(models.QuerySet):
+    def bump(self, **deltas):
+        """
+        Add each delta to the named counter column, in one UPDATE.
+        Zero deltas are skipped. Counters are clamped at zero so a drifted
+        value can't trip a non-negative check; reconcile_stats repairs drift.
+        """
+        updates = {
+            name: Greatest(models.F(name) + delta, 0)
+            for name, delta in deltas.items()
+            if delta
+        }
+        if not updates:
+            return 0
+        return self.update(**updates)
 
 
 class Project(models.Model):
@@ -17,10 +47,20 @@ class Project(models.Model):
     description = models.TextField(blank=True, null=True)
     editors = models.ManyToManyField(User, related_name="editors", blank=True)
     viewers = models.ManyToManyField(User, related_name="viewers", blank=True)
+    # Hidden and waiting for a DeletionJob to remove it. Defaulted in the
+    # database too, for the raw INSERTs of services/project_clone.py
+    pending_delete = models.BooleanField(default=False, db_default=False, editable=False)
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                ProjectStats.objects.create(project=self)
+
 
 class EntityType(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -31,6 +71,8 @@ class EntityType(models.Model):
     color = ColorField(default="#f0dc48")
     description = models.TextField(blank=True)
     schema = models.JSONField(default=list, blank=True)
+    # Bumped on every schema change, see SchemaVersion and SchemaMigration
+    schema_version = models.PositiveIntegerField(default=1, editable=False)
     is_active = models.BooleanField(default=True)
 
     class Meta:
@@ -39,6 +81,57 @@ class EntityType(models.Model):
     def __str__(self):
         return f"{self.name} ({self.project.title})"
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            old_schema = None
+            if not adding:
+                old_schema = (
+                    EntityType.objects.select_for_update()
+                    .filter(pk=self.pk)
+                    .values_list("schema", flat=True)
+                    .first()
+                )
+            plan = None
+            if old_schema is not None and old_schema != self.schema:
+                plan = diff_schemas(old_schema, self.schema)
+                self.schema_version += 1
+                update_fields = kwargs.get("update_fields")
+                if update_fields:
+                    kwargs["update_fields"] = {*update_fields, "schema_version"}
+            # `renamed_from` is only a hint for the diff
+            if isinstance(self.schema, list):
+                for field_def in self.schema:
+                    if isinstance(field_def, dict):
+                        field_def.pop("renamed_from", None)
+
+            super().save(*args, **kwargs)
+
+            if adding:
+                EntityTypeStats.objects.create(entity_type=self)
+            if adding or plan is not None:
+                SchemaVersion.objects.create(
+                    entity_type=self, version=self.schema_version, schema=self.schema
+                )
+            if plan:
+                SchemaMigration.objects.create(
+                    entity_type=self,
+                    from_version=self.schema_version - 1,
+                    to_version=self.schema_version,
+                    plan=plan,
+                )
+            # Expression indexes are built concurrently, in the background
+            if filterable_fields(old_schema or []) != filterable_fields(self.schema):
+                queue_filter_index_sync(self.pk)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            pk = self.pk
+            result = super().delete(*args, **kwargs)
+            if filterable_fields(self.schema):
+                queue_filter_index_sync(pk)
+        return result
+
     def clean(self):
         super().clean()
 
@@ -55,13 +148,30 @@ class EntityType(models.Model):
         for field_def in self.schema:
             if "type" not in field_def:
                 raise ValidationError(f"Field {field_def} must have a 'type' field")
-            field_cls = get_field_class(field_def["type"])
-            field_obj = field_cls(**field_def)
-            field_obj.clean_definition(field_def)
+        deserialize_schema(self.schema, self.pk, project_id=self.project_id)
+
+    def deserialized_schema(self, entity_type_ids=None):
+        """
+        The schema as field objects, remembered on the instance until the
+        schema changes. Pass the ids of the project's entity types when they
+        are at hand to check reference fields without a query; either way
+        they must target a type of the same project, as clean() requires.
+        """
+        digest = schema_hash(self.schema)
+        memo = getattr(self, "_schema_memo", None)
+        if memo is None or memo[0] != digest:
+            memo = (
+                digest,
+                deserialize_schema(
+                    self.schema, self.pk, entity_type_ids, project_id=self.project_id
+                ),
+            )
+            self._schema_memo = memo
+        return memo[1]
 
     @property
     def schema_object(self):
-        return deserialize_schema(self.schema)
+        return self.deserialized_schema()
 
 
 class Entity(models.Model):
@@ -91,10 +201,303 @@ class Entity(models.Model):
         return self.metadata.get("display_name", f"[unnamed {self.entity_type.name}]")
 
     def save(self, *args, **kwargs):
+        adding = self._state.adding
         # Denormalize project from entity_type
         self.project = self.entity_type.project
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                self._record_count_change(1)
+            if date_fields(self.entity_type.schema):
+                refresh_entity_dates([self.pk])
+            if location_fields(self.entity_type.schema):
+                refresh_entity_locations([self.pk])
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            self._record_count_change(-1)
+        return result
+
+    def _record_count_change(self, delta):
+        ProjectStats.objects.filter(project_id=self.project_id).bump(entity_count=delta)
+        EntityTypeStats.objects.filter(entity_type_id=self.entity_type_id).bump(
+            entity_count=delta
+        )
 
     def clean(self):
         super().clean()
         validate_metadata(self.entity_type.schema, self.metadata)
+
+
+class EntityDate(models.Model):
+    """
+    The value of one DateField of an entity, normalized to the [earliest,
+    latest] days its precision allows -- a date of precision "decade" in the
+    1750s spans 1750-01-01 to 1759-12-31. Dates without a year are left out.
+    Rebuilt from metadata by services/entity_dates.py whenever it changes.
+    """
+
+    entity = models.ForeignKey(Entity, on_delete=models.CASCADE, related_name="dates")
+    # Denormalized from the entity, so queries stay on this table
+    entity_type = models.ForeignKey(
+        EntityType, on_delete=models.CASCADE, related_name="+"
+    )
+    field = models.CharField(max_length=100)
+    earliest = models.DateField()
+    latest = models.DateField()
+    span = models.GeneratedField(
+        expression=models.Func(
+            "earliest",
+            "latest",
+            models.Value("[]"),
+            function="daterange",
+            output_field=DateRangeField(),
+        ),
+        output_field=DateRangeField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        unique_together = ("entity", "field")
+        indexes = [
+            # Overlap queries
+            GistIndex(fields=["entity_type", "field", "span"], name="entitydate_span_gist"),
+            # Timeline histograms, as index-only scans
+            models.Index(
+                fields=["entity_type", "field", "earliest", "latest"],
+                name="entitydate_earliest_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.field}: {self.earliest} - {self.latest}"
+
+
+class EntityLocation(models.Model):
+    """
+    The value of one LatLongField of an entity, with its geohash for
+    bounding-box, nearest-neighbour and map clustering queries. Rebuilt from
+    metadata by services/entity_locations.py whenever it changes.
+    """
+
+    entity = models.ForeignKey(
+        Entity, on_delete=models.CASCADE, related_name="locations"
+    )
+    # Denormalized from the entity, so queries stay on this table
+    entity_type = models.ForeignKey(
+        EntityType, on_delete=models.CASCADE, related_name="+"
+    )
+    field = models.CharField(max_length=100)
+    lat = models.FloatField()
+    long = models.FloatField()
+    # Byte order, so geohash prefixes are contiguous ranges of the index
+    geohash = models.CharField(max_length=12, db_collation="C")
+
+    class Meta:
+        unique_together = ("entity", "field")
+        indexes = [
+            # Prefix range scans, and map clusters as index-only scans
+            models.Index(
+                fields=["entity_type", "field", "geohash"],
+                include=["lat", "long", "entity"],
+                name="entityloc_geohash_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.field}: {self.lat}, {self.long}"
+
+
+class ProjectStats(models.Model):
+    """
+    Running totals for the project dashboard, kept up to date by the save/delete
+    hooks of the counted models so the dashboard never aggregates on read.
+    `manage.py reconcile_stats` rebuilds them and refreshes the density histogram.
+    """
+
+    project = models.OneToOneField(
+        Project, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    document_count = models.PositiveIntegerField(default=0)
+    page_count = models.PositiveIntegerField(default=0)
+    empty_page_count = models.PositiveIntegerField(default=0)  # pages with no annotations
+    char_count = models.PositiveBigIntegerField(default=0)
+    entity_count = models.PositiveIntegerField(default=0)
+    annotation_count = models.PositiveIntegerField(default=0)
+    # Pages binned by annotations per 1,000 characters, see stats_service
+    density_histogram = models.JSONField(default=list, blank=True)
+    histogram_updated_at = models.DateTimeField(null=True, blank=True)
+
+    objects = CounterQuerySet.as_manager()
+
+    class Meta:
+        verbose_name_plural = "Project stats"
+
+    def __str__(self):
+        return f"Stats for {self.project_id}"
+
+
+class EntityTypeStats(models.Model):
+    entity_type = models.OneToOneField(
+        EntityType, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    entity_count = models.PositiveIntegerField(default=0)
+    annotation_count = models.PositiveIntegerField(default=0)
+
+    objects = CounterQuerySet.as_manager()
+
+    class Meta:
+        verbose_name_plural = "Entity type stats"
+
+    def __str__(self):
+        return f"Stats for {self.entity_type_id}"
+
+
+class SchemaVersion(models.Model):
+    """Every schema an EntityType has had, so any two versions can be diffed."""
+
+    entity_type = models.ForeignKey(
+        EntityType, on_delete=models.CASCADE, related_name="schema_versions"
+    )
+    version = models.PositiveIntegerField()
+    schema = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("entity_type", "version")
+        ordering = ["entity_type", "version"]
+
+    def __str__(self):
+        return f"{self.entity_type_id} v{self.version}"
+
+
+class SchemaMigration(models.Model):
+    """
+    A job that rewrites the metadata of every entity of a type after its schema
+    changed from `from_version` to `to_version`. `plan` is the output of
+    diff_schemas; see services/schema_migration.py for how it is run.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    entity_type = models.ForeignKey(
+        EntityType, on_delete=models.CASCADE, related_name="schema_migrations"
+    )
+    from_version = models.PositiveIntegerField()
+    to_version = models.PositiveIntegerField()
+    plan = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    # Keyset position, so an interrupted job resumes where it stopped
+    last_entity_id = models.UUIDField(null=True, blank=True)
+    processed_count = models.PositiveIntegerField(default=0)
+    failure_count = models.PositiveIntegerField(default=0)
+    # The first MAX_REPORTED_FAILURES entities that fail revalidation
+    failures = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["entity_type", "to_version"]
+
+    def __str__(self):
+        return f"{self.entity_type_id} v{self.from_version} -> v{self.to_version}"
+
+
+class FilterIndexSync(models.Model):
+    """
+    A queued sync_filter_indexes() for an entity type whose filterable fields
+    changed. The indexes are built CONCURRENTLY, outside any transaction and
+    at the cost of a scan of the entities, so requests only queue the work;
+    see run_pending_index_syncs(). The type is referenced by id: once it is
+    deleted, the sync drops its indexes.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    entity_type_id = models.UUIDField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["created_at"]
+        constraints = [
+            # A waiting sync reads the schema when it runs, so one per type will do
+            models.UniqueConstraint(
+                fields=["entity_type_id"],
+                condition=models.Q(status="pending"),
+                name="filter_index_sync_one_pending_per_type",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Index sync {self.entity_type_id}"
+
+
+class DeletionJob(models.Model):
+    """
+    Removes a project or document that was marked pending_delete, children
+    first, in batches that commit on their own; see services/deletion.py.
+    The object is referenced by id, as it is gone when the job is done.
+    """
+
+    PROJECT = "project"
+    DOCUMENT = "document"
+    KIND_CHOICES = [(PROJECT, "Project"), (DOCUMENT, "Document")]
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.UUIDField()
+    # For display once the object is gone
+    title = models.CharField(max_length=200)
+    requested_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    # Rows deleted so far, by table
+    progress = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["created_at"]
+
+    def __str__(self):
+        return f"Delete {self.kind} {self.title}"
@@ -3,6 +3,12 @@ from django.core.exceptions import ValidationError
 
 class BaseSchemaField:
     type = None
+    # SQL for this field's value in Entity.metadata, used to filter, sort and
+    # index on it. `{value}` stands for the jsonb value and `{text}` for it as
+    # text. None means the field can't be queried.
+    sql_template = None
+    # Django field matching the type of sql_template, e.g. models.TextField
+    sql_output_field = None
 
     def __init__(self, **kwargs):
         self.name = kwargs.get("name")
@@ -1,6 +1,7 @@
 # bool.py
 from .base import BaseSchemaField
 from django.core.exceptions import ValidationError
+from django.db import models
 
 """
 Bool fields have:
@@ -13,6 +14,8 @@ Bool fields have:
 
 class BoolField(BaseSchemaField):
     type = "bool"
+    sql_template = "(CASE WHEN jsonb_typeof({value}) = 'boolean' THEN ({text})::boolean END)"
+    sql_output_field = models.BooleanField
 
     def validate(self, value, field_def):
         if value is None or value == "":
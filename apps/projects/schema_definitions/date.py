@@ -1,11 +1,15 @@
 # date.py
 from .base import BaseSchemaField
 from django.core.exceptions import ValidationError
+from django.db import models
 from datetime import datetime
 
 
 class DateField(BaseSchemaField):
     type = "date"
+    # The ISO string of structured dates; it sorts chronologically
+    sql_template = "({value} ->> 'iso')"
+    sql_output_field = models.TextField
 
     def validate(self, value, field_def):
         if value is None:
@@ -1,6 +1,7 @@
 # dropdown.py
 from .base import BaseSchemaField
 from django.core.exceptions import ValidationError
+from django.db import models
 
 
 """
@@ -16,6 +17,8 @@ Date fields have:
 
 class DropdownField(BaseSchemaField):
     type = "dropdown"
+    sql_template = "({text})"
+    sql_output_field = models.TextField
 
     def clean_definition(self, field_def):
         super().clean_definition(field_def)
@@ -1,4 +1,5 @@
 from django.core.exceptions import ValidationError
+from django.db import models
 from .base import BaseSchemaField
 
 """
@@ -12,6 +13,9 @@ Number fields have:
 
 class NumberField(BaseSchemaField):
     type = "number"
+    # Only JSON numbers; anything else would make the cast (and the index) fail
+    sql_template = "(CASE WHEN jsonb_typeof({value}) = 'number' THEN ({text})::numeric END)"
+    sql_output_field = models.DecimalField
 
     def validate(self, value, field_def):
         if value is None or value == "":
@@ -1,6 +1,7 @@
 # reference.py
 from .base import BaseSchemaField
 from django.core.exceptions import ValidationError
+from django.db import models
 from django.apps import apps
 
 # todo: figure out what happens if an entity type is deleted
@@ -18,6 +19,8 @@ Reference fields have:
 
 class ReferenceField(BaseSchemaField):
     type = "reference"
+    sql_template = "({text})"
+    sql_output_field = models.TextField
 
     def clean_definition(self, field_def):
         super().clean_definition(field_def)
@@ -26,12 +29,8 @@ class ReferenceField(BaseSchemaField):
             raise ValidationError(
                 "Reference field must define 'target_entity_type_id'."
             )
-        # Optional: verify that the target EntityType exists
-        EntityType = apps.get_model("projects", "EntityType")
-        if not EntityType.objects.filter(id=target_id).exists():
-            raise ValidationError(
-                f"Target EntityType with id {target_id} does not exist."
-            )
+        # That the target EntityType exists is checked for all reference
+        # fields at once, see schema_service.check_reference_targets()
         return field_def
 
     def validate(self, value, field_def):
@@ -1,4 +1,5 @@
 from django.core.exceptions import ValidationError
+from django.db import models
 from .base import BaseSchemaField
 
 """
@@ -12,6 +13,8 @@ Text fields have:
 
 class TextField(BaseSchemaField):
     type = "text"
+    sql_template = "({text})"
+    sql_output_field = models.TextField
 
     def validate(self, value, field_def):
         if value is None:
@@ -0,0 +1,173 @@
+"""
+apps/projects/services/bulk_edit.py
+
+Editing many entities at once.
+
+Both operations stream the selected entities in chunks (only id, type and
+metadata are loaded), validate, and write each chunk back with one
+bulk_update, all inside a single transaction. Entities that fail validation
+are skipped and reported; the rest are saved.
+"""
+
+from collections import Counter
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from apps.projects.models import Entity, EntityType, EntityTypeStats
+from apps.projects.services.entity_dates import date_fields, refresh_entity_dates
+from apps.projects.services.entity_locations import (
+    location_fields,
+    refresh_entity_locations,
+)
+from apps.projects.services.schema_service import validate_field_values, validate_patch
+from apps.projects.signals import entities_changed
+
+CHUNK_SIZE = 500
+
+
+def _entities(queryset):
+    return (
+        queryset.select_for_update()
+        .only("id", "entity_type", "metadata", "updated_at")
+        .order_by("pk")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def _chunks(iterable):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+@transaction.atomic
+def bulk_set_metadata(queryset, patch):
+    """
+    Apply the partial metadata `patch` to every entity in `queryset`. A None
+    value removes the field. The patch is validated once per entity type
+    involved, not once per entity.
+
+    Returns (updated_count, errors) where `errors` maps an entity type id to
+    the ValidationError messages of the patch for that type; entities of such
+    types are left unchanged.
+    """
+    type_errors = {}
+    touches_dates = touches_locations = False
+    for entity_type in EntityType.objects.filter(
+        pk__in=queryset.values("entity_type_id")
+    ):
+        try:
+            validate_patch(entity_type.schema, patch)
+        except ValidationError as e:
+            type_errors[str(entity_type.pk)] = e.message_dict
+            continue
+        touches_dates |= bool(set(patch) & set(date_fields(entity_type.schema)))
+        touches_locations |= bool(set(patch) & set(location_fields(entity_type.schema)))
+
+    now = timezone.now()
+    updated = 0
+    valid = queryset.exclude(entity_type_id__in=list(type_errors))
+    for chunk in _chunks(_entities(valid)):
+        for entity in chunk:
+            for name, value in patch.items():
+                if value is None:
+                    entity.metadata.pop(name, None)
+                else:
+                    entity.metadata[name] = value
+            entity.updated_at = now
+        updated += Entity.objects.bulk_update(chunk, ["metadata", "updated_at"])
+        if touches_dates:
+            refresh_entity_dates(entity.pk for entity in chunk)
+        if touches_locations:
+            refresh_entity_locations(entity.pk for entity in chunk)
+        entities_changed.send(sender=Entity, entity_ids=[entity.pk for entity in chunk])
+
+    return updated, type_errors
+
+
+@transaction.atomic
+def bulk_change_type(queryset, target_type, field_map=None):
+    """
+    Move every entity in `queryset` to `target_type`, carrying metadata across
+    by `field_map` ({source_field: target_field}; display_name is always
+    kept). Unmapped fields are dropped. Each entity's new metadata is checked
+    against the target schema, instantiating each field class once.
+
+    Returns (updated_count, errors) where `errors` maps an entity id to
+    {field: message}; those entities are left unchanged.
+    """
+    field_map = {"display_name": "display_name", **(field_map or {})}
+    target_defs = [
+        f for f in target_type.schema if isinstance(f, dict) and f.get("name")
+    ]
+    target_names = {f["name"] for f in target_defs}
+    unknown = set(field_map.values()) - target_names
+    if unknown:
+        raise ValidationError(
+            {name: f"'{name}' is not a field of {target_type.name}." for name in unknown}
+        )
+
+    Annotation = apps.get_model("annotation", "Annotation")
+    now = timezone.now()
+    updated = 0
+    errors = {}
+    # Per source entity type, for the stats
+    moved_entities, moved_annotations = Counter(), Counter()
+    for chunk in _chunks(_entities(queryset.exclude(entity_type=target_type))):
+        for entity in chunk:
+            entity.metadata = {
+                target: entity.metadata[source]
+                for source, target in field_map.items()
+                if entity.metadata.get(source) is not None
+            }
+
+        rows = [
+            (entity.pk, *(entity.metadata.get(f["name"]) for f in target_defs))
+            for entity in chunk
+        ]
+        for failure in validate_field_values(target_defs, rows):
+            errors.setdefault(failure["entity_id"], {})[failure["field"]] = failure[
+                "error"
+            ]
+
+        valid = [entity for entity in chunk if str(entity.pk) not in errors]
+        moved_annotations.update(
+            dict(
+                Annotation.objects.filter(entity__in=valid)
+                .order_by()
+                .values_list("entity__entity_type")
+                .annotate(n=Count("id"))
+            )
+        )
+        for entity in valid:
+            moved_entities[entity.entity_type_id] += 1
+            entity.entity_type_id = target_type.pk
+            entity.updated_at = now
+        updated += Entity.objects.bulk_update(
+            valid, ["entity_type", "metadata", "updated_at"]
+        )
+        refresh_entity_dates(entity.pk for entity in valid)
+        refresh_entity_locations(entity.pk for entity in valid)
+        if valid:
+            entities_changed.send(
+                sender=Entity, entity_ids=[entity.pk for entity in valid]
+            )
+
+    for source_type_id, count in moved_entities.items():
+        EntityTypeStats.objects.filter(entity_type_id=source_type_id).bump(
+            entity_count=-count, annotation_count=-moved_annotations[source_type_id]
+        )
+    EntityTypeStats.objects.filter(entity_type=target_type).bump(
+        entity_count=sum(moved_entities.values()),
+        annotation_count=sum(moved_annotations.values()),
+    )
+    return updated, errors
@@ -0,0 +1,203 @@
+"""
+apps/projects/services/deletion.py
+
+Deleting projects and documents in the background.
+
+Model.delete() has Django's collector load every page, annotation and entity
+underneath into memory to cascade, inside the request. Instead the request
+only marks the object pending_delete, which hides it, and queues a
+DeletionJob; `manage.py run_deletions` then removes the rows with raw DELETEs
+of BATCH_SIZE rows, children before parents (annotations before the entities
+and pages they PROTECT, entities before their types). Nothing is loaded into
+Python, each batch commits on its own, and the job records the rows deleted
+so far, so an interrupted job resumes by starting over on what is left.
+
+Counters are settled when the deletion is scheduled, as Document.delete()
+does, so the dashboard drops the object as soon as it is hidden.
+"""
+
+from django.apps import apps
+from django.db import connection, transaction
+from django.db.models import ProtectedError
+from django.utils import timezone
+
+from apps.projects.models import DeletionJob, EntityType, ProjectStats
+from apps.projects.services.entity_query import filterable_fields, sync_filter_indexes
+from apps.projects.services.stats_service import forget_annotations
+
+BATCH_SIZE = 5000
+
+_PROJECT_PAGES = """
+    SELECT p.id FROM library_page p
+    JOIN library_document d ON d.id = p.document_id
+    WHERE d.project_id = %s
+"""
+_PROJECT_DOCUMENTS = "SELECT id FROM library_document WHERE project_id = %s"
+_PROJECT_TYPES = "SELECT id FROM projects_entitytype WHERE project_id = %s"
+
+# (table, condition on the rows to delete, whether to batch), in the order
+# the foreign keys require: Django emulates its cascades, so the database
+# has no ON DELETE CASCADE to lean on
+PROJECT_STEPS = [
+    ("annotation_annotation", f"page_id IN ({_PROJECT_PAGES})", True),
+    ("library_page", f"document_id IN ({_PROJECT_DOCUMENTS})", True),
+    ("library_document", "project_id = %s", True),
+    ("projects_entitydate", f"entity_type_id IN ({_PROJECT_TYPES})", True),
+    ("projects_entitylocation", f"entity_type_id IN ({_PROJECT_TYPES})", True),
+    ("projects_entity", "project_id = %s", True),
+    ("projects_schemaversion", f"entity_type_id IN ({_PROJECT_TYPES})", False),
+    ("projects_schemamigration", f"entity_type_id IN ({_PROJECT_TYPES})", False),
+    ("projects_entitytypestats", f"entity_type_id IN ({_PROJECT_TYPES})", False),
+    ("projects_entitytype", "project_id = %s", False),
+    ("projects_projectstats", "project_id = %s", False),
+    ("projects_project_editors", "project_id = %s", False),
+    ("projects_project_viewers", "project_id = %s", False),
+    ("projects_project", "id = %s", False),
+]
+
+DOCUMENT_STEPS = [
+    (
+        "annotation_annotation",
+        "page_id IN (SELECT id FROM library_page WHERE document_id = %s)",
+        True,
+    ),
+    ("library_page", "document_id = %s", True),
+    ("library_document", "id = %s", False),
+]
+
+
+def external_annotations(project):
+    """
+    Annotations in other projects of the entities of `project`. Entities
+    PROTECT their annotations, so while there are any the project can't be
+    deleted: those annotations belong to the other projects.
+    """
+    Annotation = apps.get_model("annotation", "Annotation")
+    return Annotation.objects.filter(entity__project=project).exclude(
+        page__document__project=project
+    )
+
+
+@transaction.atomic
+def schedule_project_deletion(project, user=None):
+    """
+    Hide `project` and queue its deletion. Returns the DeletionJob. Raises
+    ProtectedError when other projects annotate its entities, as
+    Model.delete() would.
+    """
+    blocking = external_annotations(project)
+    count = blocking.count()
+    if count:
+        raise ProtectedError(
+            f"{count} annotation(s) in other projects refer to entities of "
+            f"{project}; remove them first.",
+            set(blocking[:10]),
+        )
+    project.pending_delete = True
+    # Through save(), so the signals drop the cached project
+    project.save(update_fields=["pending_delete"])
+    # Its documents too, so the lookups by document or page hide them as well
+    project.documents.update(pending_delete=True)
+    return DeletionJob.objects.create(
+        kind=DeletionJob.PROJECT,
+        object_id=project.pk,
+        title=project.title,
+        requested_by=user,
+    )
+
+
+@transaction.atomic
+def schedule_document_deletion(document, user=None):
+    """Hide `document`, take it off the counters, and queue its deletion."""
+    Document = apps.get_model("library", "Document")
+    Annotation = apps.get_model("annotation", "Annotation")
+    Document.objects.select_for_update().filter(pk=document.pk).first()
+    document.refresh_from_db()
+    if document.pending_delete:
+        return DeletionJob.objects.filter(
+            kind=DeletionJob.DOCUMENT, object_id=document.pk
+        ).last()
+
+    forget_annotations(Annotation.objects.filter(page__document=document))
+    empty_pages = document.pages.filter(annotation_count=0).count()
+    ProjectStats.objects.filter(project_id=document.project_id).bump(
+        document_count=-1,
+        page_count=-document.page_count,
+        empty_page_count=-empty_pages,
+        annotation_count=-document.annotation_count,
+        char_count=-document.char_count,
+    )
+    Document.objects.filter(pk=document.pk).update(pending_delete=True)
+    document.pending_delete = True
+    return DeletionJob.objects.create(
+        kind=DeletionJob.DOCUMENT,
+        object_id=document.pk,
+        title=document.title,
+        requested_by=user,
+    )
+
+
+def _delete_batches(job, table, where, batched):
+    """Delete the rows of `table` matching `where`, recording them on the job."""
+    params = [job.object_id] * where.count("%s")
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            if batched:
+                cursor.execute(
+                    f"""
+                    DELETE FROM {table} WHERE id IN (
+                        SELECT id FROM {table} WHERE {where} LIMIT %s
+                    )
+                    """,
+                    params + [BATCH_SIZE],
+                )
+            else:
+                cursor.execute(f"DELETE FROM {table} WHERE {where}", params)
+            deleted = cursor.rowcount
+            job.progress[table] = job.progress.get(table, 0) + deleted
+            job.save(update_fields=["progress"])
+        if not batched or deleted < BATCH_SIZE:
+            return
+
+
+def run_deletion_job(job):
+    """
+    Run (or resume) a DeletionJob to completion. Returns the job. Errors
+    mark the job failed and re-raise; rows deleted until then stay deleted.
+    """
+    if job.status == DeletionJob.DONE:
+        return job
+
+    steps = PROJECT_STEPS if job.kind == DeletionJob.PROJECT else DOCUMENT_STEPS
+    job.status = DeletionJob.RUNNING
+    job.started_at = job.started_at or timezone.now()
+    job.save(update_fields=["status", "started_at"])
+
+    try:
+        if job.kind == DeletionJob.PROJECT:
+            # First, while the types still say which expression indexes they have
+            for pk, schema in EntityType.objects.filter(
+                project_id=job.object_id
+            ).values_list("pk", "schema"):
+                if filterable_fields(schema):
+                    sync_filter_indexes(EntityType(pk=pk), drop_all=True)
+        for table, where, batched in steps:
+            _delete_batches(job, table, where, batched)
+    except Exception as e:
+        job.status = DeletionJob.FAILED
+        job.error = str(e)
+        job.save(update_fields=["status", "error"])
+        raise
+
+    job.status = DeletionJob.DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "finished_at"])
+    return job
+
+
+def run_pending_deletions():
+    """Run every unfinished DeletionJob, oldest first. Returns the jobs that were run."""
+    ran = []
+    for job in DeletionJob.objects.exclude(status=DeletionJob.DONE):
+        ran.append(run_deletion_job(job))
+    return ran
@@ -0,0 +1,164 @@
+"""
+apps/projects/services/entity_dates.py
+
+Normalized date ranges for DateField values (see EntityDate).
+
+The conversion from `{iso, precision, original}` (or a plain date string) to
+[earliest, latest] happens in the database, in the entity_date_bounds()
+function installed by the projects migrations, so the side table can be
+rebuilt for any number of entities with one INSERT ... SELECT.
+"""
+
+from django.db import connection
+
+# Bin widths for timeline(), in years
+TIMELINE_BINS = {"year": 1, "decade": 10, "century": 100}
+
+# Installed by migration 0005_entity_dates. Returns NULLs for anything that
+# can't be placed in time: no value, no year ("0000-04-30"), or unparseable.
+BOUNDS_FUNCTION = r"""
+CREATE OR REPLACE FUNCTION entity_date_bounds(value jsonb, OUT earliest date, OUT latest date)
+LANGUAGE plpgsql IMMUTABLE AS $$
+DECLARE
+    iso text;
+    date_precision text;
+    d date;
+    y int;
+    width int;
+BEGIN
+    IF jsonb_typeof(value) = 'object' THEN
+        iso := value ->> 'iso';
+        date_precision := COALESCE(value ->> 'precision', 'day');
+    ELSIF jsonb_typeof(value) = 'string' THEN
+        iso := value #>> '{}';
+        IF iso ~ '^\d{4}$' THEN
+            iso := iso || '-01-01';
+            date_precision := 'year';
+        ELSIF iso ~ '^\d{4}-\d{2}$' THEN
+            iso := iso || '-01';
+            date_precision := 'month';
+        ELSE
+            date_precision := 'day';
+        END IF;
+    ELSE
+        RETURN;
+    END IF;
+
+    IF iso IS NULL OR iso LIKE '0000-%' OR iso !~ '^\d{4}-\d{2}-\d{2}' THEN
+        RETURN;
+    END IF;
+    BEGIN
+        d := left(iso, 10)::date;
+    EXCEPTION WHEN others THEN
+        RETURN;
+    END;
+    y := extract(year FROM d)::int;
+
+    CASE date_precision
+        WHEN 'day' THEN
+            earliest := d;
+            latest := d;
+        WHEN 'month' THEN
+            earliest := date_trunc('month', d)::date;
+            latest := (date_trunc('month', d) + interval '1 month - 1 day')::date;
+        WHEN 'year' THEN
+            earliest := make_date(y, 1, 1);
+            latest := make_date(y, 12, 31);
+        ELSE
+            width := CASE date_precision
+                WHEN 'decade' THEN 10
+                WHEN 'quarter_century' THEN 25
+                WHEN 'century' THEN 100
+            END;
+            IF width IS NULL THEN
+                RETURN;
+            END IF;
+            earliest := make_date(greatest(y / width * width, 1), 1, 1);
+            latest := make_date(y / width * width + width - 1, 12, 31);
+    END CASE;
+END;
+$$;
+"""
+
+
+def date_fields(schema):
+    """Names of the date fields of a schema."""
+    if not isinstance(schema, list):
+        return []
+    return [
+        f["name"]
+        for f in schema
+        if isinstance(f, dict) and f.get("type") == "date" and f.get("name")
+    ]
+
+
+def refresh_entity_dates(entity_ids=None, entity_type_id=None):
+    """
+    Rebuild the EntityDate rows of the given entities, of every entity of a
+    type, or (with neither) of every entity. Two statements in total.
+    """
+    if entity_ids is not None:
+        entity_ids = list(entity_ids)
+        if not entity_ids:
+            return 0
+        where, params = "e.id = ANY(%s::uuid[])", [[str(i) for i in entity_ids]]
+    elif entity_type_id is not None:
+        where, params = "e.entity_type_id = %s", [entity_type_id]
+    else:
+        where, params = "TRUE", []
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            DELETE FROM projects_entitydate
+            WHERE entity_id IN (SELECT e.id FROM projects_entity e WHERE {where})
+            """,
+            params,
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO projects_entitydate (entity_id, entity_type_id, field, earliest, latest)
+            SELECT e.id, e.entity_type_id, f.name, b.earliest, b.latest
+            FROM projects_entity e
+            JOIN projects_entitytype et ON et.id = e.entity_type_id
+            CROSS JOIN LATERAL (
+                SELECT DISTINCT elem ->> 'name' AS name
+                FROM jsonb_array_elements(
+                    CASE WHEN jsonb_typeof(et.schema) = 'array' THEN et.schema ELSE '[]' END
+                ) AS elem
+                WHERE elem ->> 'type' = 'date'
+            ) AS f
+            CROSS JOIN LATERAL entity_date_bounds(e.metadata -> f.name) AS b
+            WHERE {where} AND b.earliest IS NOT NULL
+            """,
+            params,
+        )
+        return cursor.rowcount
+
+
+def timeline(entity_type_id, field, bin_name="decade", start=None, end=None):
+    """
+    Count the entities of a type by the year their `field` date starts in,
+    binned by TIMELINE_BINS[bin_name], optionally only dates overlapping
+    [start, end]. Returns [(first_year_of_bin, count), ...] in order.
+    """
+    width = TIMELINE_BINS[bin_name]
+    conditions = ["entity_type_id = %s", "field = %s"]
+    params = [width, width, entity_type_id, field]
+    if start is not None or end is not None:
+        conditions.append("span && daterange(%s::date, %s::date, '[]')")
+        params += [start, end]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT floor(extract(year FROM earliest) / %s)::int * %s AS bucket,
+                   count(*)
+            FROM projects_entitydate
+            WHERE {" AND ".join(conditions)}
+            GROUP BY bucket
+            ORDER BY bucket
+            """,
+            params,
+        )
+        return cursor.fetchall()
@@ -0,0 +1,269 @@
+"""
+apps/projects/services/entity_locations.py
+
+Spatial queries over LatLongField values (see EntityLocation).
+
+Each location is stored with its geohash in a B-tree indexed column, so a
+bounding box becomes a handful of prefix ranges on that index (see
+geohash.cover()) and a map viewport is clustered in the database by grouping
+on a geohash prefix whose length follows the zoom level.
+"""
+
+import math
+
+from django.db import connection
+
+from apps.projects.services import geohash
+
+EARTH_RADIUS_KM = 6371.0088
+# nearest() searches a box of this radius first and widens it fourfold
+# until it holds enough points
+NEAREST_START_RADIUS_KM = 5.0
+NEAREST_MAX = 100
+
+# Installed by migration 0006_entity_locations; the same algorithm as
+# geohash.encode()
+GEOHASH_FUNCTION = r"""
+CREATE OR REPLACE FUNCTION geohash_encode(lat double precision, long double precision, len int)
+RETURNS text LANGUAGE plpgsql IMMUTABLE STRICT AS $$
+DECLARE
+    base32 CONSTANT text := '0123456789bcdefghjkmnpqrstuvwxyz';
+    lat_lo double precision := -90;
+    lat_hi double precision := 90;
+    long_lo double precision := -180;
+    long_hi double precision := 180;
+    mid double precision;
+    hash text := '';
+    bits int := 0;
+    bit_count int := 0;
+    even boolean := true;
+BEGIN
+    WHILE length(hash) < len LOOP
+        IF even THEN
+            mid := (long_lo + long_hi) / 2;
+            IF long >= mid THEN
+                bits := bits * 2 + 1;
+                long_lo := mid;
+            ELSE
+                bits := bits * 2;
+                long_hi := mid;
+            END IF;
+        ELSE
+            mid := (lat_lo + lat_hi) / 2;
+            IF lat >= mid THEN
+                bits := bits * 2 + 1;
+                lat_lo := mid;
+            ELSE
+                bits := bits * 2;
+                lat_hi := mid;
+            END IF;
+        END IF;
+        even := NOT even;
+        bit_count := bit_count + 1;
+        IF bit_count = 5 THEN
+            hash := hash || substr(base32, bits + 1, 1);
+            bits := 0;
+            bit_count := 0;
+        END IF;
+    END LOOP;
+    RETURN hash;
+END;
+$$;
+"""
+
+_DISTANCE_SQL = (
+    "2 * %s * asin(least(1, sqrt("
+    "power(sin(radians(lat - %s) / 2), 2)"
+    " + cos(radians(%s)) * cos(radians(lat)) * power(sin(radians(long - %s) / 2), 2)"
+    ")))"
+)
+
+
+def location_fields(schema):
+    """Names of the latlong fields of a schema."""
+    if not isinstance(schema, list):
+        return []
+    return [
+        f["name"]
+        for f in schema
+        if isinstance(f, dict) and f.get("type") == "latlong" and f.get("name")
+    ]
+
+
+def refresh_entity_locations(entity_ids=None, entity_type_id=None):
+    """
+    Rebuild the EntityLocation rows of the given entities, of every entity of
+    a type, or (with neither) of every entity. Two statements in total.
+    """
+    if entity_ids is not None:
+        entity_ids = list(entity_ids)
+        if not entity_ids:
+            return 0
+        where, params = "e.id = ANY(%s::uuid[])", [[str(i) for i in entity_ids]]
+    elif entity_type_id is not None:
+        where, params = "e.entity_type_id = %s", [entity_type_id]
+    else:
+        where, params = "TRUE", []
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            DELETE FROM projects_entitylocation
+            WHERE entity_id IN (SELECT e.id FROM projects_entity e WHERE {where})
+            """,
+            params,
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO projects_entitylocation
+                (entity_id, entity_type_id, field, lat, long, geohash)
+            SELECT e.id, e.entity_type_id, f.name, p.lat, p.long,
+                   geohash_encode(p.lat, p.long, %s)
+            FROM projects_entity e
+            JOIN projects_entitytype et ON et.id = e.entity_type_id
+            CROSS JOIN LATERAL (
+                SELECT DISTINCT elem ->> 'name' AS name
+                FROM jsonb_array_elements(
+                    CASE WHEN jsonb_typeof(et.schema) = 'array' THEN et.schema ELSE '[]' END
+                ) AS elem
+                WHERE elem ->> 'type' = 'latlong'
+            ) AS f
+            CROSS JOIN LATERAL (
+                SELECT (e.metadata -> f.name ->> 'lat')::double precision AS lat,
+                       (e.metadata -> f.name ->> 'long')::double precision AS long
+                WHERE jsonb_typeof(e.metadata -> f.name -> 'lat') = 'number'
+                  AND jsonb_typeof(e.metadata -> f.name -> 'long') = 'number'
+            ) AS p
+            WHERE {where}
+              AND p.lat BETWEEN -90 AND 90
+              AND p.long BETWEEN -180 AND 180
+            """,
+            [geohash.PRECISION, *params],
+        )
+        return cursor.rowcount
+
+
+def parse_bbox(value):
+    """
+    A bounding box given as [west, south, east, north] (the GeoJSON order) or
+    as the same four numbers comma-separated, as (south, west, north, east).
+    West may exceed east for a box across the antimeridian. Raises ValueError.
+    """
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, (list, tuple)) or len(value) != 4:
+        raise ValueError("A bounding box is [west, south, east, north].")
+    try:
+        west, south, east, north = (float(v) for v in value)
+    except TypeError:
+        raise ValueError("A bounding box is [west, south, east, north].")
+    if not all(map(math.isfinite, (west, south, east, north))):
+        raise ValueError("A bounding box is [west, south, east, north].")
+    if not -90 <= south <= north <= 90:
+        raise ValueError("Latitudes must be between -90 and 90, south first.")
+    if not (-180 <= west <= 180 and -180 <= east <= 180):
+        raise ValueError("Longitudes must be between -180 and 180.")
+    return south, west, north, east
+
+
+def box_condition(bbox):
+    """
+    SQL condition (and params) on projects_entitylocation rows for the points
+    inside `bbox` (as returned by parse_bbox()): geohash prefix ranges the
+    index can seek to, then the exact bounds.
+    """
+    boxes, params = [], []
+    for south, west, north, east in geohash.split_box(*bbox):
+        cells = geohash.cover(south, west, north, east)
+        ranges = " OR ".join(["(geohash >= %s AND geohash < %s)"] * len(cells))
+        for cell in cells:
+            params += [cell, geohash.prefix_upper_bound(cell)]
+        boxes.append(
+            f"(({ranges}) AND lat BETWEEN %s AND %s AND long BETWEEN %s AND %s)"
+        )
+        params += [south, north, west, east]
+    return "(" + " OR ".join(boxes) + ")", params
+
+
+def entities_in_box(entity_type_id, field, bbox):
+    """SQL selecting the ids of the entities whose `field` lies in `bbox`."""
+    condition, params = box_condition(bbox)
+    return (
+        "SELECT entity_id FROM projects_entitylocation "
+        f"WHERE entity_type_id = %s AND field = %s AND {condition}",
+        [entity_type_id, field, *params],
+    )
+
+
+def _box_around(lat, long, radius_km):
+    """The bbox circumscribing the circle of `radius_km` around a point."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south, north = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    if south == -90.0 or north == 90.0:
+        return south, -180.0, north, 180.0
+    reach = math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat))
+    dlong = math.degrees(math.asin(min(1.0, reach)))
+    if dlong >= 90.0 or radius_km >= math.pi * EARTH_RADIUS_KM / 2:
+        return south, -180.0, north, 180.0
+    west, east = long - dlong, long + dlong
+    if west < -180.0:
+        west += 360.0
+    if east > 180.0:
+        east -= 360.0
+    return south, west, north, east
+
+
+def nearest(entity_type_id, field, lat, long, k=10):
+    """
+    The `k` entities whose `field` is closest to (lat, long) by great-circle
+    distance: [(entity_id, lat, long, distance_km), ...], nearest first.
+    """
+    k = max(1, min(k, NEAREST_MAX))
+    radius = NEAREST_START_RADIUS_KM
+    with connection.cursor() as cursor:
+        while True:
+            condition, params = box_condition(_box_around(lat, long, radius))
+            cursor.execute(
+                f"""
+                SELECT entity_id, lat, long, {_DISTANCE_SQL} AS distance
+                FROM projects_entitylocation
+                WHERE entity_type_id = %s AND field = %s AND {condition}
+                ORDER BY distance, entity_id
+                LIMIT %s
+                """,
+                [EARTH_RADIUS_KM, lat, lat, long, entity_type_id, field, *params, k],
+            )
+            rows = cursor.fetchall()
+            # The box holds every point within `radius`, so once the k-th
+            # closest is inside it nothing outside the box can be closer
+            if len(rows) == k and rows[-1][3] <= radius:
+                return rows
+            if radius >= math.pi * EARTH_RADIUS_KM:
+                return rows
+            radius *= 4
+
+
+def clusters(entity_type_id, field, bbox, zoom):
+    """
+    The points of `field` in `bbox`, grouped into geohash cells sized for the
+    map `zoom` level: [(cell, count, lat, long, entity_id), ...] with the mean
+    position of each cell, and the entity id when a cell holds a single point.
+    """
+    precision = geohash.zoom_precision(zoom)
+    condition, params = box_condition(bbox)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT left(geohash, %s) AS cell,
+                   count(*),
+                   avg(lat),
+                   avg(long),
+                   CASE WHEN count(*) = 1 THEN min(entity_id::text) END
+            FROM projects_entitylocation
+            WHERE entity_type_id = %s AND field = %s AND {condition}
+            GROUP BY cell
+            ORDER BY cell
+            """,
+            [precision, entity_type_id, field, *params],
+        )
+        return cursor.fetchall()
@@ -0,0 +1,316 @@
+"""
+apps/projects/services/entity_query.py
+
+Structured queries over Entity.metadata.
+
+Filters and sort keys name schema fields; each field's type (see
+schema_definitions) supplies the SQL that extracts and casts its value from
+the metadata column. Fields marked `"filterable": true` in the schema get a
+partial expression index per entity type, built from the very same SQL so the
+planner can use it. sync_filter_indexes() creates and drops those indexes to
+match the schemas; schema changes queue it as a FilterIndexSync, run by
+`manage.py run_filter_index_syncs`.
+"""
+
+import base64
+import hashlib
+import json
+import re
+from datetime import date
+
+from django.apps import apps
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.backends.postgresql.psycopg_any import DateRange
+from django.db.models import Exists, F, OuterRef, Q, TextField, Value
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from apps.projects.schema_definitions.registry import get_field_class
+from apps.projects.services.entity_locations import entities_in_box, parse_bbox
+
+# Field names are inlined into SQL (index expressions can't take parameters),
+# so only plain identifiers are queryable
+QUERYABLE_NAME = re.compile(r"^[A-Za-z0-9_]+$")
+INDEX_PREFIX = "ent_meta_"
+
+LOOKUPS = {
+    "eq": "exact",
+    "ne": "exact",
+    "lt": "lt",
+    "lte": "lte",
+    "gt": "gt",
+    "gte": "gte",
+    "in": "in",
+    "contains": "icontains",
+    "startswith": "istartswith",
+    "isnull": "isnull",
+}
+TEXT_ONLY_LOOKUPS = {"contains", "startswith"}
+# Range lookups on the normalized bounds of date fields (see EntityDate); the
+# value is [start, end], either side may be null
+DATE_RANGE_LOOKUPS = {"overlaps": "overlap", "within": "contained_by"}
+# On latlong fields (see EntityLocation); the value is [west, south, east, north]
+BBOX_LOOKUP = "within_bbox"
+
+
+class EntityQueryError(ValueError):
+    """A filter or sort that doesn't fit the entity type's schema."""
+
+
+def field_sql(field_def):
+    """
+    The SQL expression for a schema field's value, and the Django field class
+    of its type. Raises EntityQueryError if the field can't be queried.
+    """
+    name = field_def.get("name", "")
+    field_cls = get_field_class(field_def.get("type"))
+    if field_cls.sql_template is None or not QUERYABLE_NAME.match(name):
+        raise EntityQueryError(f"'{name}' can't be filtered or sorted on.")
+    return (
+        field_cls.sql_template.format(
+            value=f"metadata -> '{name}'", text=f"metadata ->> '{name}'"
+        ),
+        field_cls.sql_output_field,
+    )
+
+
+def _field_defs(entity_type):
+    return {
+        f["name"]: f for f in entity_type.schema if isinstance(f, dict) and f.get("name")
+    }
+
+
+def _expression(field_defs, name):
+    field_def = field_defs.get(name)
+    if field_def is None:
+        raise EntityQueryError(f"'{name}' is not a field of this entity type.")
+    sql, output_field = field_sql(field_def)
+    return RawSQL(sql, [], output_field=output_field()), field_def
+
+
+def filter_entities(queryset, entity_type, filters):
+    """
+    Narrow `queryset` (entities of `entity_type`) by a list of filters:
+        [{"field": "born", "op": "gte", "value": 1700}, ...]
+    `op` is one of LOOKUPS and defaults to "eq". All filters must match.
+    """
+    field_defs = _field_defs(entity_type)
+    for i, spec in enumerate(filters):
+        if not isinstance(spec, dict) or "field" not in spec:
+            raise EntityQueryError("Each filter needs a 'field'.")
+        op = spec.get("op", "eq")
+        if op in DATE_RANGE_LOOKUPS:
+            queryset = _filter_date_range(queryset, field_defs, spec)
+            continue
+        if op == BBOX_LOOKUP:
+            queryset = _filter_bbox(queryset, entity_type, field_defs, spec)
+            continue
+        if op not in LOOKUPS:
+            raise EntityQueryError(f"Unknown filter operator '{op}'.")
+        expression, field_def = _expression(field_defs, spec["field"])
+        if op in TEXT_ONLY_LOOKUPS and field_def["type"] not in ("text", "dropdown"):
+            raise EntityQueryError(f"'{op}' only applies to text fields.")
+        value = spec.get("value")
+        if op == "in" and not isinstance(value, list):
+            raise EntityQueryError("'in' needs a list value.")
+
+        alias = f"_filter_{i}"
+        condition = Q(**{f"{alias}__{LOOKUPS[op]}": value})
+        queryset = queryset.annotate(**{alias: expression})
+        queryset = queryset.exclude(condition) if op == "ne" else queryset.filter(condition)
+    return queryset
+
+
+def _filter_date_range(queryset, field_defs, spec):
+    field_def = field_defs.get(spec["field"])
+    if field_def is None or field_def.get("type") != "date":
+        raise EntityQueryError(f"'{spec['op']}' only applies to date fields.")
+    value = spec.get("value")
+    if not isinstance(value, list) or len(value) != 2:
+        raise EntityQueryError(f"'{spec['op']}' needs a [start, end] value.")
+    try:
+        start, end = (date.fromisoformat(v) if v else None for v in value)
+    except (TypeError, ValueError):
+        raise EntityQueryError("Dates must be ISO formatted.")
+
+    EntityDate = apps.get_model("projects", "EntityDate")
+    lookup = f"span__{DATE_RANGE_LOOKUPS[spec['op']]}"
+    matches = EntityDate.objects.filter(
+        entity=OuterRef("pk"),
+        field=field_def["name"],
+        **{lookup: DateRange(start, end, "[]")},
+    )
+    return queryset.filter(Exists(matches))
+
+
+def _filter_bbox(queryset, entity_type, field_defs, spec):
+    field_def = field_defs.get(spec["field"])
+    if field_def is None or field_def.get("type") != "latlong":
+        raise EntityQueryError(f"'{BBOX_LOOKUP}' only applies to latlong fields.")
+    try:
+        bbox = parse_bbox(spec.get("value"))
+    except ValueError as e:
+        raise EntityQueryError(str(e))
+    sql, params = entities_in_box(entity_type.pk, field_def["name"], bbox)
+    return queryset.filter(pk__in=RawSQL(sql, params))
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, cls=DjangoJSONEncoder).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise EntityQueryError("Malformed cursor.")
+    if not isinstance(values, list) or len(values) != 2:
+        raise EntityQueryError("Malformed cursor.")
+    return values
+
+
+def sort_entities(queryset, entity_type, sort=None, after=None):
+    """
+    Order `queryset` by a schema field (prefix "-" for descending) with the
+    entity id as tie-breaker -- entities without a value come last -- and,
+    given the cursor of the last row of the previous page, continue after it.
+    Rows carry the sort value as `sort_key`; pass the last row to next_cursor().
+    """
+    if not sort:
+        queryset = queryset.annotate(sort_key=Value(None, output_field=TextField()))
+        if after:
+            queryset = queryset.filter(pk__gt=decode_cursor(after)[1])
+        return queryset.order_by("pk")
+
+    descending = sort.startswith("-")
+    expression, _ = _expression(_field_defs(entity_type), sort.lstrip("-"))
+    queryset = queryset.annotate(sort_key=expression)
+    key = F("sort_key")
+    ordering = key.desc(nulls_last=True) if descending else key.asc(nulls_last=True)
+    queryset = queryset.order_by(ordering, "pk")
+
+    if after:
+        value, last_id = decode_cursor(after)
+        if value is None:
+            queryset = queryset.filter(sort_key__isnull=True, pk__gt=last_id)
+        else:
+            beyond = "sort_key__lt" if descending else "sort_key__gt"
+            queryset = queryset.filter(
+                Q(**{beyond: value})
+                | Q(sort_key=value, pk__gt=last_id)
+                | Q(sort_key__isnull=True)
+            )
+    return queryset
+
+
+def next_cursor(entity):
+    return encode_cursor([entity.sort_key, entity.pk])
+
+
+def filterable_fields(schema):
+    """(name, type) of the fields a schema marks as filterable."""
+    if not isinstance(schema, list):
+        return set()
+    return {
+        (f.get("name"), f.get("type"))
+        for f in schema
+        if isinstance(f, dict) and f.get("filterable")
+    }
+
+
+def _index_name(entity_type, field_def):
+    sql, _ = field_sql(field_def)
+    digest = hashlib.md5(sql.encode()).hexdigest()[:10]
+    return f"{INDEX_PREFIX}{entity_type.pk.hex[:12]}_{digest}"
+
+
+def sync_filter_indexes(entity_type, drop_all=False):
+    """
+    Create the expression indexes for the filterable fields of `entity_type`
+    and drop the ones no longer wanted (all of them with `drop_all`, e.g. when
+    the type is deleted). Indexes are built CONCURRENTLY, so this must run
+    outside a transaction. Returns (created, dropped) index names.
+    """
+    wanted = {}
+    if not drop_all:
+        for field_def in _field_defs(entity_type).values():
+            if not field_def.get("filterable"):
+                continue
+            try:
+                sql, _ = field_sql(field_def)
+            except (EntityQueryError, ValueError):
+                continue
+            wanted[_index_name(entity_type, field_def)] = sql
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname, i.indisvalid
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_class t ON t.oid = i.indrelid
+            WHERE t.relname = 'projects_entity' AND c.relname LIKE %s
+            """,
+            [f"{INDEX_PREFIX}{entity_type.pk.hex[:12]}_%"],
+        )
+        rows = cursor.fetchall()
+        # A failed concurrent build leaves an invalid index behind; rebuild it
+        existing = {name for name, valid in rows if valid}
+        created = sorted(set(wanted) - existing)
+        dropped = sorted(({name for name, _ in rows} - existing) | (existing - set(wanted)))
+        for name in dropped:
+            cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+        for name in created:
+            # Sorting ties break on id, so the index serves keyset pages too
+            cursor.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" '
+                f"ON projects_entity (({wanted[name]}), id) "
+                f"WHERE entity_type_id = '{entity_type.pk}'"
+            )
+    return created, dropped
+
+
+def queue_filter_index_sync(entity_type_id):
+    """
+    Queue a sync of the expression indexes of an entity type, for
+    run_pending_index_syncs(). A sync already waiting for the type covers it.
+    """
+    FilterIndexSync = apps.get_model("projects", "FilterIndexSync")
+    FilterIndexSync.objects.bulk_create(
+        [FilterIndexSync(entity_type_id=entity_type_id)], ignore_conflicts=True
+    )
+
+
+def run_pending_index_syncs():
+    """
+    Run every unfinished FilterIndexSync, oldest first, each against the
+    schema its type has now. Returns [(sync, created, dropped), ...]. Errors
+    mark the sync failed and re-raise.
+    """
+    EntityType = apps.get_model("projects", "EntityType")
+    FilterIndexSync = apps.get_model("projects", "FilterIndexSync")
+    ran = []
+    for sync in FilterIndexSync.objects.exclude(status=FilterIndexSync.DONE):
+        # Frees the pending slot, so changes made from here on queue a new sync
+        sync.status = FilterIndexSync.RUNNING
+        sync.save(update_fields=["status"])
+        entity_type = EntityType.objects.filter(pk=sync.entity_type_id).first()
+        try:
+            if entity_type is None:
+                created, dropped = sync_filter_indexes(
+                    EntityType(pk=sync.entity_type_id), drop_all=True
+                )
+            else:
+                created, dropped = sync_filter_indexes(entity_type)
+        except Exception as e:
+            sync.status = FilterIndexSync.FAILED
+            sync.error = str(e)
+            sync.save(update_fields=["status", "error"])
+            raise
+        sync.status = FilterIndexSync.DONE
+        sync.finished_at = timezone.now()
+        sync.save(update_fields=["status", "finished_at"])
+        ran.append((sync, created, dropped))
+    return ran
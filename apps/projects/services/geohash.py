@@ -0,0 +1,93 @@
+"""
+apps/projects/services/geohash.py
+
+Geohash encoding and cell cover computations for EntityLocation queries.
+
+encode() must agree character for character with the geohash_encode() SQL
+function installed by the projects migrations, which fills the column.
+"""
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Stored precision: cells of about 4.8m x 4.8m
+PRECISION = 9
+# Cover a bounding box with at most this many cells
+MAX_COVER_CELLS = 32
+
+
+def encode(lat, long, precision=PRECISION):
+    lat_range, long_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        value, bounds = (long, long_range) if even else (lat, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            bounds[0] = mid
+        else:
+            bits = bits * 2
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """(height, width) of a cell of the given precision, in degrees."""
+    long_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2**lat_bits, 360.0 / 2**long_bits
+
+
+def cover(south, west, north, east, max_cells=MAX_COVER_CELLS):
+    """
+    Geohash prefixes whose cells together cover the box, using the finest
+    precision that needs at most `max_cells` cells. The box must not cross
+    the antimeridian (west <= east); see split_box().
+    """
+    for precision in range(PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = int(north // height - south // height) + 1
+        cols = int(east // width - west // width) + 1
+        if rows * cols <= max_cells or precision == 1:
+            break
+
+    cells = set()
+    lat = south
+    while True:
+        long = west
+        while True:
+            cells.add(encode(min(lat, 90.0), min(long, 180.0), precision))
+            if long >= east:
+                break
+            long = min(long + width, east)
+        if lat >= north:
+            break
+        lat = min(lat + height, north)
+    return sorted(cells)
+
+
+def split_box(south, west, north, east):
+    """A box that crosses the antimeridian (west > east) as two that don't."""
+    if west <= east:
+        return [(south, west, north, east)]
+    return [(south, west, north, 180.0), (south, -180.0, north, east)]
+
+
+def prefix_upper_bound(prefix):
+    """The smallest string greater than every geohash starting with `prefix`."""
+    return prefix + "~"
+
+
+def zoom_precision(zoom):
+    """
+    Geohash precision to cluster by at a web map zoom level: cells a little
+    smaller than a 256px tile, so a viewport shows a few dozen clusters.
+    """
+    for precision in range(1, PRECISION + 1):
+        _, width = cell_size(precision)
+        if width <= 360.0 / 2 ** (zoom + 1):
+            return precision
+    return PRECISION
@@ -0,0 +1,92 @@
+"""
+apps/projects/services/metadata_patch.py
+
+JSON merge-patch (RFC 7386) updates of Entity.metadata.
+
+Only the top-level fields named in a patch are validated and written. The
+write is a single `metadata - removed || changed` UPDATE, so fields nobody
+touched keep whatever value is in the database, and an optional `updated_at`
+precondition turns concurrent edits of the same entity into a conflict
+instead of a silent overwrite.
+"""
+
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from apps.projects.models import Entity
+from apps.projects.services.entity_dates import date_fields, refresh_entity_dates
+from apps.projects.services.entity_locations import (
+    location_fields,
+    refresh_entity_locations,
+)
+from apps.projects.services.schema_service import merge_patch, validate_patch
+from apps.projects.signals import entities_changed
+
+
+class StaleEntity(Exception):
+    """The entity changed since the client read it."""
+
+
+def patch_metadata(entity_id, patch, expected_updated_at=None):
+    """
+    Merge `patch` into the metadata of entity `entity_id`.
+
+    Raises Entity.DoesNotExist (also while its project is pending deletion),
+    StaleEntity if `expected_updated_at` is given and no longer matches, or
+    ValidationError if a touched field is invalid or the result lacks a
+    required field. Returns the updated entity.
+    """
+    if not isinstance(patch, dict):
+        raise ValidationError("A merge patch of metadata must be an object.")
+
+    with transaction.atomic():
+        # The row lock makes the read-merge-write of nested values atomic
+        entity = (
+            Entity.objects.select_for_update(of=("self",))
+            .select_related("entity_type")
+            .get(pk=entity_id, project__pending_delete=False)
+        )
+        if expected_updated_at is not None and entity.updated_at != expected_updated_at:
+            raise StaleEntity()
+
+        touched = {
+            name: merge_patch(entity.metadata.get(name), value)
+            for name, value in patch.items()
+        }
+        schema = entity.entity_type.schema
+        validate_patch(schema, touched)
+
+        missing = {
+            f["name"]: f"'{f['name']}' is required."
+            for f in schema
+            if f.get("required")
+            and f["name"] not in touched
+            and entity.metadata.get(f["name"]) is None
+        }
+        if missing:
+            raise ValidationError(missing)
+
+        removed = [name for name, value in touched.items() if value is None]
+        changed = {name: value for name, value in touched.items() if value is not None}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE projects_entity
+                SET metadata = (metadata - %s::text[]) || %s::jsonb,
+                    updated_at = now()
+                WHERE id = %s
+                RETURNING metadata, updated_at
+                """,
+                [removed, json.dumps(changed), entity.pk],
+            )
+            metadata, entity.updated_at = cursor.fetchone()
+        if set(touched) & set(date_fields(schema)):
+            refresh_entity_dates([entity.pk])
+        if set(touched) & set(location_fields(schema)):
+            refresh_entity_locations([entity.pk])
+        # Django leaves jsonb from raw queries undecoded
+        entity.metadata = json.loads(metadata)
+        entities_changed.send(sender=Entity, entity_ids=[entity.pk])
+    return entity
@@ -0,0 +1,46 @@
+"""
+apps/projects/services/project_cache.py
+
+Cached reads of projects and their entity types, and their invalidation.
+
+Everything is cached under the project's scope (see networkAnnotation/cache.py)
+and dropped at once by invalidate_project(), which the model signals in
+apps/projects/signals.py call whenever a project or entity type changes.
+"""
+
+from django.apps import apps
+from django.shortcuts import get_object_or_404
+
+from networkAnnotation.cache import (
+    bump_scope,
+    cached,
+    owner_scope,
+    project_scope,
+    scoped_key,
+)
+
+
+def get_project_or_404(pk):
+    Project = apps.get_model("projects", "Project")
+    return cached(
+        "project",
+        scoped_key(project_scope(pk), "project"),
+        lambda: get_object_or_404(Project, pk=pk, pending_delete=False),
+    )
+
+
+def project_entity_types(project_id):
+    """The entity types of a project, as a list."""
+    EntityType = apps.get_model("projects", "EntityType")
+    return cached(
+        "entity_types",
+        scoped_key(project_scope(project_id), "entity_types"),
+        lambda: list(EntityType.objects.filter(project_id=project_id)),
+    )
+
+
+def invalidate_project(project_id, owner_id=None):
+    """Drop everything cached for a project, and its owner's project list."""
+    bump_scope(project_scope(project_id))
+    if owner_id is not None:
+        bump_scope(owner_scope(owner_id))
@@ -0,0 +1,312 @@
+"""
+apps/projects/services/project_clone.py
+
+Copying a project: its entity types and entities, and (unless the copy is
+only a template) its documents, pages and annotations.
+
+Every table is copied with one INSERT ... SELECT, whatever its size. The new
+ids come from gen_random_uuid(), and the old -> new pairs are kept in
+temporary map tables that the later statements join through: entities map
+their type, pages their document, annotations their page and entity.
+Reference fields point at other entity types (in the schema) and at other
+entities (in metadata); both are rewritten in the same statements, so no row
+is written twice. Counters are copied from the source rather than recounted
+-- reconcile_stats repairs them if the source had drifted.
+
+Page images are not duplicated: the copied pages point at the same files.
+"""
+
+from django.db import connection, transaction
+
+from apps.projects.models import EntityType, Project
+from apps.projects.services.entity_query import filterable_fields, queue_filter_index_sync
+
+
+def _schema_sql(column):
+    """`column`, a schema (jsonb array), with each target_entity_type_id mapped."""
+    return f"""
+        CASE WHEN jsonb_typeof({column}) = 'array' THEN (
+            SELECT COALESCE(jsonb_agg(
+                CASE WHEN m.new_id IS NULL THEN f
+                     ELSE jsonb_set(f, '{{target_entity_type_id}}', to_jsonb(m.new_id::text))
+                END ORDER BY n), '[]'::jsonb)
+            FROM jsonb_array_elements({column}) WITH ORDINALITY AS s(f, n)
+            LEFT JOIN clone_entity_type_map m
+                   ON m.old_id::text = lower(f ->> 'target_entity_type_id')
+        ) ELSE {column} END"""
+
+
+def _reference_fields(source):
+    """[(entity type id, field name), ...] of the reference fields of `source`."""
+    return [
+        (entity_type_id, field_def["name"])
+        for entity_type_id, schema in EntityType.objects.filter(project=source)
+        .values_list("id", "schema")
+        for field_def in (schema if isinstance(schema, list) else [])
+        if isinstance(field_def, dict)
+        and field_def.get("type") == "reference"
+        and field_def.get("name")
+    ]
+
+
+def _create_map(cursor, name, select_ids, params):
+    """
+    A temporary table `name` of (old_id, new_id) for the ids `select_ids`
+    returns. Returns the number of ids.
+    """
+    cursor.execute(
+        f"CREATE TEMPORARY TABLE {name} (old_id uuid PRIMARY KEY, new_id uuid NOT NULL)"
+    )
+    cursor.execute(
+        f"INSERT INTO {name} (old_id, new_id) SELECT id, gen_random_uuid() FROM ({select_ids}) AS ids",
+        params,
+    )
+    count = cursor.rowcount
+    # Temporary tables are never analyzed on their own
+    cursor.execute(f"ANALYZE {name}")
+    return count
+
+
+def _copy_entities(cursor, source, target):
+    cursor.execute(
+        """
+        CREATE TEMPORARY TABLE clone_reference_fields (entity_type_id uuid, field text)
+        """
+    )
+    references = _reference_fields(source)
+    if references:
+        cursor.executemany(
+            "INSERT INTO clone_reference_fields VALUES (%s, %s)", references
+        )
+    # The metadata of each entity with references, as a patch of new ids
+    cursor.execute(
+        """
+        CREATE TEMPORARY TABLE clone_reference_patches AS
+        SELECT e.id AS entity_id, jsonb_object_agg(r.field, m.new_id::text) AS patch
+        FROM projects_entity e
+        JOIN clone_reference_fields r ON r.entity_type_id = e.entity_type_id
+        JOIN clone_entity_map m ON m.old_id::text = lower(e.metadata ->> r.field)
+        WHERE e.project_id = %s
+        GROUP BY e.id
+        """,
+        [source.pk],
+    )
+    cursor.execute("ANALYZE clone_reference_patches")
+    cursor.execute(
+        """
+        INSERT INTO projects_entity (
+            id, entity_type_id, project_id, metadata, created_at, updated_at
+        )
+        SELECT em.new_id, tm.new_id, %s,
+               e.metadata || COALESCE(p.patch, '{}'::jsonb), now(), now()
+        FROM projects_entity e
+        JOIN clone_entity_map em ON em.old_id = e.id
+        JOIN clone_entity_type_map tm ON tm.old_id = e.entity_type_id
+        LEFT JOIN clone_reference_patches p ON p.entity_id = e.id
+        """,
+        [target.pk],
+    )
+    count = cursor.rowcount
+    cursor.execute("DROP TABLE clone_reference_fields, clone_reference_patches")
+
+    # The side tables are derived from metadata, which only changed in
+    # reference fields: copy them rather than recompute
+    cursor.execute(
+        """
+        INSERT INTO projects_entitydate (entity_id, entity_type_id, field, earliest, latest)
+        SELECT em.new_id, tm.new_id, d.field, d.earliest, d.latest
+        FROM projects_entitydate d
+        JOIN clone_entity_map em ON em.old_id = d.entity_id
+        JOIN clone_entity_type_map tm ON tm.old_id = d.entity_type_id
+        """
+    )
+    cursor.execute(
+        """
+        INSERT INTO projects_entitylocation (
+            entity_id, entity_type_id, field, lat, long, geohash
+        )
+        SELECT em.new_id, tm.new_id, l.field, l.lat, l.long, l.geohash
+        FROM projects_entitylocation l
+        JOIN clone_entity_map em ON em.old_id = l.entity_id
+        JOIN clone_entity_type_map tm ON tm.old_id = l.entity_type_id
+        """
+    )
+    return count
+
+
+def _copy_library(cursor, source, target):
+    counts = {}
+    counts["documents"] = _create_map(
+        cursor,
+        "clone_document_map",
+        "SELECT id FROM library_document WHERE project_id = %s AND NOT pending_delete",
+        [source.pk],
+    )
+    cursor.execute(
+        """
+        INSERT INTO library_document (
+            id, project_id, title, description, page_count, annotation_count,
+            char_count, pending_delete, created_at, updated_at
+        )
+        SELECT m.new_id, %s, d.title, d.description, d.page_count,
+               d.annotation_count, d.char_count, false, now(), now()
+        FROM library_document d
+        JOIN clone_document_map m ON m.old_id = d.id
+        """,
+        [target.pk],
+    )
+    counts["pages"] = _create_map(
+        cursor,
+        "clone_page_map",
+        """
+        SELECT p.id FROM library_page p
+        JOIN library_document d ON d.id = p.document_id
+        WHERE d.project_id = %s AND NOT d.pending_delete
+        """,
+        [source.pk],
+    )
+    cursor.execute(
+        """
+        INSERT INTO library_page (
+            id, document_id, "order", title, text, image, char_count,
+            annotation_count, last_edited_at, created_at, updated_at
+        )
+        SELECT pm.new_id, dm.new_id, p."order", p.title, p.text, p.image,
+               p.char_count, p.annotation_count, p.last_edited_at, now(), now()
+        FROM library_page p
+        JOIN clone_page_map pm ON pm.old_id = p.id
+        JOIN clone_document_map dm ON dm.old_id = p.document_id
+        """
+    )
+    # Annotations of entities outside the project keep pointing at them
+    cursor.execute(
+        """
+        INSERT INTO annotation_annotation (
+            id, page_id, entity_id, start_offset, end_offset, annotated_text,
+            created_at, updated_at
+        )
+        SELECT gen_random_uuid(), pm.new_id, COALESCE(em.new_id, a.entity_id),
+               a.start_offset, a.end_offset, a.annotated_text, now(), now()
+        FROM annotation_annotation a
+        JOIN clone_page_map pm ON pm.old_id = a.page_id
+        LEFT JOIN clone_entity_map em ON em.old_id = a.entity_id
+        """
+    )
+    counts["annotations"] = cursor.rowcount
+    cursor.execute("DROP TABLE clone_document_map, clone_page_map")
+    return counts
+
+
+def _copy_stats(cursor, source, target, library):
+    if library:
+        cursor.execute(
+            """
+            UPDATE projects_projectstats AS t
+            SET document_count = s.document_count, page_count = s.page_count,
+                empty_page_count = s.empty_page_count, char_count = s.char_count,
+                entity_count = s.entity_count, annotation_count = s.annotation_count,
+                density_histogram = s.density_histogram,
+                histogram_updated_at = s.histogram_updated_at
+            FROM projects_projectstats s
+            WHERE s.project_id = %s AND t.project_id = %s
+            """,
+            [source.pk, target.pk],
+        )
+    else:
+        cursor.execute(
+            """
+            UPDATE projects_projectstats AS t SET entity_count = s.entity_count
+            FROM projects_projectstats s
+            WHERE s.project_id = %s AND t.project_id = %s
+            """,
+            [source.pk, target.pk],
+        )
+    cursor.execute(
+        f"""
+        INSERT INTO projects_entitytypestats (entity_type_id, entity_count, annotation_count)
+        SELECT m.new_id, s.entity_count, {"s.annotation_count" if library else "0"}
+        FROM projects_entitytypestats s
+        JOIN clone_entity_type_map m ON m.old_id = s.entity_type_id
+        """
+    )
+
+
+@transaction.atomic
+def clone_project(source, owner=None, title=None, library=True, members=False):
+    """
+    Copy `source` into a new project owned by `owner` (by default the owner
+    of `source`). With `library` False only the entity types and entities
+    are copied, as when starting a project from a template. `members` also
+    copies the editors and viewers. Returns (project, {table: rows copied}).
+    """
+    target = Project.objects.create(
+        owner=owner or source.owner,
+        title=title or f"Copy of {source.title}"[: Project._meta.get_field("title").max_length],
+        description=source.description,
+    )
+    if members:
+        target.editors.set(source.editors.all())
+        target.viewers.set(source.viewers.all())
+
+    counts = {}
+    with connection.cursor() as cursor:
+        counts["entity_types"] = _create_map(
+            cursor,
+            "clone_entity_type_map",
+            "SELECT id FROM projects_entitytype WHERE project_id = %s",
+            [source.pk],
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO projects_entitytype (
+                id, project_id, name, color, description, schema, schema_version, is_active
+            )
+            SELECT m.new_id, %s, et.name, et.color, et.description,
+                   {_schema_sql("et.schema")}, et.schema_version, et.is_active
+            FROM projects_entitytype et
+            JOIN clone_entity_type_map m ON m.old_id = et.id
+            """,
+            [target.pk],
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO projects_schemaversion (entity_type_id, version, schema, created_at)
+            SELECT m.new_id, v.version, {_schema_sql("v.schema")}, v.created_at
+            FROM projects_schemaversion v
+            JOIN clone_entity_type_map m ON m.old_id = v.entity_type_id
+            """
+        )
+        # Entities are copied as they are, so metadata that is still waiting
+        # for a migration needs the job too, from the start
+        cursor.execute(
+            """
+            INSERT INTO projects_schemamigration (
+                id, entity_type_id, from_version, to_version, plan, status,
+                processed_count, failure_count, failures, error, created_at
+            )
+            SELECT gen_random_uuid(), m.new_id, j.from_version, j.to_version, j.plan,
+                   'pending', 0, 0, '[]'::jsonb, '', now()
+            FROM projects_schemamigration j
+            JOIN clone_entity_type_map m ON m.old_id = j.entity_type_id
+            WHERE j.status IN ('pending', 'running')
+            """
+        )
+
+        _create_map(
+            cursor,
+            "clone_entity_map",
+            "SELECT id FROM projects_entity WHERE project_id = %s",
+            [source.pk],
+        )
+        counts["entities"] = _copy_entities(cursor, source, target)
+        if library:
+            counts.update(_copy_library(cursor, source, target))
+        _copy_stats(cursor, source, target, library)
+
+        cursor.execute("DROP TABLE clone_entity_type_map, clone_entity_map")
+
+    # Expression indexes are per entity type and built in the background
+    for pk, schema in EntityType.objects.filter(project=target).values_list("pk", "schema"):
+        if filterable_fields(schema):
+            queue_filter_index_sync(pk)
+    return target, counts
@@ -0,0 +1,296 @@
+"""
+apps/projects/services/schema_migration.py
+
+Running SchemaMigration jobs.
+
+Entities of the type are processed in keyset batches of BATCH_SIZE. Each batch
+is one UPDATE that rewrites `metadata` with JSONB operators -- every plan step
+is a LATERAL subquery feeding the next, so the whole plan is applied in a
+single pass over the rows -- and RETURNs only the fields the plan touched.
+Those are revalidated in Python against their field classes; nothing else of
+the entity is loaded. A batch commits on its own, and the job records its
+position after each one, so an interrupted job resumes where it stopped.
+
+Values a cast can't convert are left as they are and show up as failures.
+"""
+
+import json
+
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from apps.projects.models import Entity, SchemaMigration
+from apps.projects.services.entity_dates import refresh_entity_dates
+from apps.projects.services.entity_locations import refresh_entity_locations
+from apps.projects.services.schema_service import validate_field_values
+from apps.projects.signals import entities_changed
+
+BATCH_SIZE = 2000
+MAX_REPORTED_FAILURES = 500
+# Schema edits on types with at most this many entities are migrated in the request
+INLINE_LIMIT = 5000
+
+# jsonb -> jsonb conversions, by target field type. `{v}` is the old value;
+# NULL means "leave the value alone".
+CASTS = {
+    "text": """
+        CASE WHEN jsonb_typeof({v}) IN ('number', 'boolean')
+             THEN to_jsonb({v} #>> '{}') END""",
+    "dropdown": """
+        CASE WHEN jsonb_typeof({v}) IN ('number', 'boolean')
+             THEN to_jsonb({v} #>> '{}') END""",
+    "number": r"""
+        CASE WHEN jsonb_typeof({v}) = 'string'
+                  AND ({v} #>> '{}') ~ '^\s*-?[0-9]+(\.[0-9]+)?\s*$'
+             THEN to_jsonb(trim({v} #>> '{}')::numeric)
+             WHEN jsonb_typeof({v}) = 'boolean'
+             THEN to_jsonb(({v} #>> '{}')::boolean::int) END""",
+    "bool": """
+        CASE WHEN jsonb_typeof({v}) IN ('string', 'number')
+                  AND lower(trim({v} #>> '{}')) IN ('true', '1', 'yes')
+             THEN 'true'::jsonb
+             WHEN jsonb_typeof({v}) IN ('string', 'number')
+                  AND lower(trim({v} #>> '{}')) IN ('false', '0', 'no')
+             THEN 'false'::jsonb END""",
+    # A plain string is a valid (unparsed) date
+    "date": """
+        CASE WHEN jsonb_typeof({v}) = 'number'
+             THEN to_jsonb({v} #>> '{}') END""",
+    # "lat, long" strings
+    "latlong": r"""
+        CASE WHEN jsonb_typeof({v}) = 'string'
+                  AND ({v} #>> '{}') ~ '^\s*-?[0-9]+(\.[0-9]+)?\s*,\s*-?[0-9]+(\.[0-9]+)?\s*$'
+             THEN jsonb_build_object(
+                 'lat', split_part({v} #>> '{}', ',', 1)::numeric,
+                 'long', split_part({v} #>> '{}', ',', 2)::numeric) END""",
+    "reference": r"""
+        CASE WHEN jsonb_typeof({v}) = 'string'
+                  AND trim({v} #>> '{}') ~* '^[0-9a-f]{8}-([0-9a-f]{4}-){3}[0-9a-f]{12}$'
+             THEN to_jsonb(lower(trim({v} #>> '{}'))) END""",
+}
+# Field types with side tables (EntityDate, EntityLocation) derived from metadata
+SIDE_TABLE_TYPES = {"date", "latlong"}
+
+
+def _rewrite_steps(plan):
+    """
+    Translate the rewriting steps of a plan into LATERAL subqueries.
+    Returns (sql, params, final_alias); each subquery reads the metadata
+    produced by the previous one as `<alias>.m`.
+    """
+    clauses, params = [], []
+    previous = "batch"
+    for i, step in enumerate(plan):
+        m = f"{previous}.m"
+        alias = f"s{i}"
+        op = step["op"]
+
+        if op == "rename":
+            # Only the keys that are present move; their values are kept whole
+            old_names = list(step["fields"])
+            clauses.append(
+                f"LATERAL (SELECT ({m} - %s::text[]) || COALESCE(("
+                f"SELECT jsonb_object_agg(r.new_name, {m} -> r.old_name) "
+                f"FROM unnest(%s::text[], %s::text[]) AS r(old_name, new_name) "
+                f"WHERE {m} ? r.old_name), '{{}}'::jsonb) AS m) AS {alias}"
+            )
+            params += [old_names, old_names, [step["fields"][n] for n in old_names]]
+
+        elif op == "drop":
+            clauses.append(f"LATERAL (SELECT {m} - %s::text[] AS m) AS {alias}")
+            params.append(list(step["fields"]))
+
+        elif op == "cast":
+            cast = CASTS.get(step["to_type"])
+            if cast is None:
+                continue
+            clauses.append(
+                f"LATERAL (SELECT {m} -> %s AS v) AS {alias}v, "
+                f"LATERAL (SELECT {cast.replace('{v}', f'{alias}v.v')} AS v) AS {alias}c, "
+                f"LATERAL (SELECT CASE WHEN {alias}c.v IS NULL THEN {m} "
+                f"ELSE jsonb_set({m}, ARRAY[%s::text], {alias}c.v) END AS m) AS {alias}"
+            )
+            params += [step["field"], step["field"]]
+
+        elif op == "default":
+            clauses.append(
+                f"LATERAL (SELECT CASE "
+                f"WHEN COALESCE({m} -> %s, 'null'::jsonb) = 'null'::jsonb "
+                f"THEN jsonb_set({m}, ARRAY[%s::text], %s::jsonb) "
+                f"ELSE {m} END AS m) AS {alias}"
+            )
+            params += [step["field"], step["field"], json.dumps(step["value"])]
+
+        else:
+            continue
+        previous = alias
+
+    return ",\n".join(clauses), params, previous
+
+
+def _affected_fields(plan):
+    return [step["field"] for step in plan if step["op"] == "validate"]
+
+
+def _changes_side_tables(plan):
+    """Whether the plan moves values into or out of a date or latlong field."""
+    return any(
+        step["op"] == "cast"
+        and SIDE_TABLE_TYPES & {step.get("from_type"), step.get("to_type")}
+        for step in plan
+    )
+
+
+def _run_batch(migration, rewrite_sql, rewrite_params, final_alias, fields):
+    """
+    Rewrite (or, for validate-only plans, read) the next batch. Returns the
+    rows as (id, value_of_field_1, ...) tuples.
+    """
+    returning = "".join(", e.metadata -> %s" for _ in fields)
+    batch = f"""
+        WITH batch AS (
+            SELECT id, metadata AS m
+            FROM projects_entity
+            WHERE entity_type_id = %s AND (%s::uuid IS NULL OR id > %s::uuid)
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE
+        )
+    """
+    batch_params = [
+        migration.entity_type_id,
+        migration.last_entity_id,
+        migration.last_entity_id,
+        BATCH_SIZE,
+    ]
+
+    with connection.cursor() as cursor:
+        if rewrite_sql:
+            cursor.execute(
+                f"""
+                {batch}
+                UPDATE projects_entity AS e
+                SET metadata = {final_alias}.m, updated_at = now()
+                FROM batch,
+                {rewrite_sql}
+                WHERE e.id = batch.id
+                RETURNING e.id{returning}
+                """,
+                batch_params + rewrite_params + fields,
+            )
+        else:
+            cursor.execute(
+                f"""
+                {batch}
+                SELECT e.id{returning}
+                FROM projects_entity AS e JOIN batch ON batch.id = e.id
+                """,
+                batch_params + fields,
+            )
+        # Django leaves jsonb from raw queries undecoded
+        return [
+            (row[0], *(None if value is None else json.loads(value) for value in row[1:]))
+            for row in cursor.fetchall()
+        ]
+
+
+def run_schema_migration(migration):
+    """
+    Run (or resume) a SchemaMigration to completion. Returns the migration.
+    Errors other than validation failures mark the job failed and re-raise.
+    """
+    if migration.status == SchemaMigration.DONE:
+        return migration
+
+    schema = (
+        migration.entity_type.schema_versions.filter(version=migration.to_version)
+        .values_list("schema", flat=True)
+        .first()
+    )
+    if schema is None:
+        schema = migration.entity_type.schema
+    field_defs = {f["name"]: f for f in schema if isinstance(f, dict) and f.get("name")}
+    fields = [name for name in _affected_fields(migration.plan) if name in field_defs]
+    rewrite_sql, rewrite_params, final_alias = _rewrite_steps(migration.plan)
+    # A cast can leave the values alone yet change whether they are dates or
+    # locations, so the side tables follow the types as well as the rewrites
+    refresh_side_tables = bool(rewrite_sql) or _changes_side_tables(migration.plan)
+
+    migration.status = SchemaMigration.RUNNING
+    migration.started_at = migration.started_at or timezone.now()
+    migration.save(update_fields=["status", "started_at"])
+
+    try:
+        while True:
+            with transaction.atomic():
+                rows = _run_batch(
+                    migration, rewrite_sql, rewrite_params, final_alias, fields
+                )
+                if not rows:
+                    break
+                if refresh_side_tables:
+                    refresh_entity_dates(row[0] for row in rows)
+                    refresh_entity_locations(row[0] for row in rows)
+                if rewrite_sql:
+                    entities_changed.send(
+                        sender=Entity, entity_ids=[row[0] for row in rows]
+                    )
+                failures = validate_field_values([field_defs[f] for f in fields], rows)
+
+                room = MAX_REPORTED_FAILURES - len(migration.failures)
+                migration.failures += failures[: max(room, 0)]
+                migration.failure_count += len(failures)
+                migration.processed_count += len(rows)
+                # Python orders UUIDs the same way Postgres does
+                migration.last_entity_id = max(row[0] for row in rows)
+                migration.save(
+                    update_fields=[
+                        "failures",
+                        "failure_count",
+                        "processed_count",
+                        "last_entity_id",
+                    ]
+                )
+            if len(rows) < BATCH_SIZE:
+                break
+    except Exception as e:
+        migration.status = SchemaMigration.FAILED
+        migration.error = str(e)
+        migration.save(update_fields=["status", "error"])
+        raise
+
+    migration.status = SchemaMigration.DONE
+    migration.finished_at = timezone.now()
+    migration.save(update_fields=["status", "finished_at"])
+    return migration
+
+
+def run_pending_migrations(entity_type=None):
+    """
+    Run every unfinished migration, oldest version first per entity type.
+    Returns the migrations that were run.
+    """
+    migrations = SchemaMigration.objects.exclude(status=SchemaMigration.DONE)
+    if entity_type is not None:
+        migrations = migrations.filter(entity_type=entity_type)
+    ran = []
+    for migration in migrations.select_related("entity_type"):
+        ran.append(run_schema_migration(migration))
+    return ran
+
+
+def migrate_if_small(entity_type):
+    """
+    Run pending migrations of `entity_type` right away when it has at most
+    INLINE_LIMIT entities; larger types are left to `manage.py
+    run_schema_migrations`. Returns the latest migration, or None.
+    """
+    pending = entity_type.schema_migrations.exclude(status=SchemaMigration.DONE)
+    if not pending.exists():
+        return None
+    if not entity_type.entities.all()[INLINE_LIMIT : INLINE_LIMIT + 1].exists():
+        try:
+            run_pending_migrations(entity_type)
+        except DatabaseError:
+            pass  # recorded on the migration, which is shown to the user
+    return entity_type.schema_migrations.last()
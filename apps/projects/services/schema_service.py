@@ -1,3 +1,11 @@
+import copy
+import hashlib
+import json
+import threading
+import uuid
+
+from django.apps import apps
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db.models.expressions import result
 from django.core.exceptions import ValidationError
 from apps.projects.schema_definitions.registry import get_field_class
@@ -31,21 +39,89 @@ def deserialize_properties(schema, properties):
     return result
 
 
-def deserialize_schema(schema_json):
+# Deserialized schemas by (entity type id, schema hash)
+SCHEMA_CACHE_SIZE = 1024
+_schema_cache = {}
+_schema_cache_lock = threading.Lock()
+
+
+def schema_hash(schema_json):
+    raw = json.dumps(schema_json, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def check_reference_targets(schema_json, entity_type_ids=None, project_id=None):
+    """
+    Raise ValidationError if a reference field of the schema targets an entity
+    type that doesn't exist or belongs to another project. Checks against
+    `entity_type_ids` (the ids of the project's types) when given, otherwise
+    with one query for all the schema's reference fields.
+    """
+    targets = {
+        str(f["target_entity_type_id"])
+        for f in schema_json
+        if isinstance(f, dict)
+        and f.get("type") == "reference"
+        and f.get("target_entity_type_id") is not None
+    }
+    if not targets:
+        return
+    if entity_type_ids is None:
+        valid = []
+        for target in targets:
+            try:
+                valid.append(uuid.UUID(target))
+            except ValueError:
+                pass
+        EntityType = apps.get_model("projects", "EntityType")
+        entity_types = EntityType.objects.filter(id__in=valid)
+        if project_id is not None:
+            entity_types = entity_types.filter(project_id=project_id)
+        entity_type_ids = entity_types.values_list("id", flat=True)
+    missing = targets - {str(i) for i in entity_type_ids}
+    if missing:
+        raise ValidationError(
+            f"Target EntityType with id {min(missing)} does not exist."
+        )
+
+
+def deserialize_schema(
+    schema_json, entity_type_id=None, entity_type_ids=None, project_id=None
+):
     """
     Convert schema JSON into Python field objects.
     Each field object has a .to_dict() method with all relevant attributes.
+
+    Given the id of the entity type the schema belongs to, the field objects
+    are cached per (id, schema hash). Reference targets are checked every
+    time, see check_reference_targets().
     """
-    field_objects = []
-    for field_def in schema_json:
-        field_type = field_def.get("type")
-        if not field_type:
-            continue
-        cls = get_field_class(field_type)
-        obj = cls(**field_def)
-        obj.clean_definition(field_def)
-        field_objects.append(obj)
-    return field_objects
+    key = None
+    field_objects = None
+    if entity_type_id is not None:
+        key = (str(entity_type_id), schema_hash(schema_json))
+        field_objects = _schema_cache.get(key)
+
+    if field_objects is None:
+        field_objects = []
+        for field_def in schema_json:
+            field_type = field_def.get("type")
+            if not field_type:
+                continue
+            cls = get_field_class(field_type)
+            # Cached objects must not share dicts the caller may still change
+            field_def = copy.deepcopy(field_def)
+            obj = cls(**field_def)
+            obj.clean_definition(field_def)
+            field_objects.append(obj)
+        if key is not None:
+            with _schema_cache_lock:
+                if len(_schema_cache) >= SCHEMA_CACHE_SIZE:
+                    del _schema_cache[next(iter(_schema_cache))]
+                _schema_cache[key] = field_objects
+
+    check_reference_targets(schema_json, entity_type_ids, project_id)
+    return list(field_objects)
 
 
 def validate_metadata(schema, metadata):
@@ -82,3 +158,206 @@ def validate_metadata(schema, metadata):
 
     if errors:
         raise ValidationError(errors)
+
+
+def validate_field_values(field_defs, rows):
+    """
+    Validate many entities' values for the given fields at once. `rows` are
+    (entity_id, value_of_field_1, ...) tuples, in the order of `field_defs`.
+    Each field class is instantiated once, and references are checked with one
+    query per field rather than one per value.
+    Returns a list of {"entity_id", "field", "error"} dicts.
+    """
+    failures = []
+    for index, field_def in enumerate(field_defs, start=1):
+        name = field_def["name"]
+        field_obj = get_field_class(field_def["type"])(**field_def)
+        references = {}
+
+        for row in rows:
+            value = row[index]
+            if field_def.get("required") and value is None:
+                error = f"'{name}' is required."
+            elif name == "display_name" and not value:
+                error = "'display_name' is required."
+            elif field_def["type"] == "reference" and value is not None:
+                try:
+                    references[row[0]] = uuid.UUID(str(value))
+                    continue
+                except (ValueError, AttributeError):
+                    error = f"{name} must be a valid entity UUID."
+            else:
+                try:
+                    field_obj.validate(value, field_def)
+                    continue
+                except ValidationError as e:
+                    error = " ".join(e.messages)
+            failures.append({"entity_id": str(row[0]), "field": name, "error": error})
+
+        if references:
+            target_id = field_def.get("target_entity_type_id")
+            Entity = apps.get_model("projects", "Entity")
+            existing = set(
+                Entity.objects.filter(
+                    id__in=set(references.values()), entity_type_id=target_id
+                ).values_list("id", flat=True)
+            )
+            failures += [
+                {
+                    "entity_id": str(entity_id),
+                    "field": name,
+                    "error": f"{name} must reference a valid entity of the correct type.",
+                }
+                for entity_id, target in references.items()
+                if target not in existing
+            ]
+    return failures
+
+
+def merge_patch(target, patch):
+    """Apply an RFC 7386 merge patch to `target` and return the result."""
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+
+def validate_patch(schema, patch):
+    """
+    Validate a partial metadata update -- only the fields it sets, and only
+    once, however many entities it is applied to. A None value removes the
+    field. Raises ValidationError keyed by field name.
+    """
+    field_defs = {f["name"]: f for f in schema if isinstance(f, dict) and f.get("name")}
+    errors = {}
+    for name, value in patch.items():
+        field_def = field_defs.get(name)
+        if field_def is None:
+            errors[name] = f"'{name}' is not a field of this entity type."
+            continue
+        if value is None or (name == "display_name" and not value):
+            if field_def.get("required") or name == "display_name":
+                errors[name] = f"'{name}' is required."
+            continue
+        try:
+            field_cls = get_field_class(field_def["type"])
+            field_cls(**field_def).validate(value, field_def)
+        except ValidationError as e:
+            errors[name] = " ".join(e.messages)
+
+    if errors:
+        raise ValidationError(errors)
+
+
+# Definition keys that don't affect how stored values are interpreted
+_COSMETIC_KEYS = {"label", "default", "renamed_from", "filterable"}
+
+
+def _field_defs(schema):
+    """The named field definitions of a schema, skipping anything malformed."""
+    if not isinstance(schema, list):
+        return []
+    return [f for f in schema if isinstance(f, dict) and f.get("name")]
+
+
+def _match_renames(old_by_name, new_fields):
+    """
+    Map old field names to new ones. A new field can name its predecessor
+    explicitly with `renamed_from`; otherwise a removed field and an added
+    field with the same label and type are taken to be the same field.
+    """
+    new_names = {f["name"] for f in new_fields}
+    renames = {}
+    for field_def in new_fields:
+        source = field_def.get("renamed_from")
+        if source in old_by_name and source not in new_names:
+            renames[source] = field_def["name"]
+
+    removed = [
+        name for name in old_by_name if name not in new_names and name not in renames
+    ]
+    added = [
+        f
+        for f in new_fields
+        if f["name"] not in old_by_name and f["name"] not in renames.values()
+    ]
+    for name in removed:
+        old_def = old_by_name[name]
+        candidates = [
+            f
+            for f in added
+            if f.get("label") == old_def.get("label")
+            and f.get("type") == old_def.get("type")
+        ]
+        if len(candidates) == 1:
+            renames[name] = candidates[0]["name"]
+            added.remove(candidates[0])
+    return renames
+
+
+def diff_schemas(old_schema, new_schema):
+    """
+    Compare two versions of an EntityType schema and return the plan that
+    brings metadata written against `old_schema` in line with `new_schema`:
+    a list of steps, applied in order.
+
+        {"op": "rename", "fields": {old_name: new_name, ...}}
+        {"op": "drop", "fields": [name, ...]}
+        {"op": "cast", "field": name, "from_type": ..., "to_type": ...}
+        {"op": "default", "field": name, "value": ...}
+        {"op": "validate", "field": name}
+
+    Renames are applied simultaneously, so swapping two names is safe.
+    A `default` only fills missing or null values. Every field touched by a
+    rename, cast or default, or whose definition changed, is revalidated.
+    """
+    old_by_name = {f["name"]: f for f in _field_defs(old_schema)}
+    new_fields = _field_defs(new_schema)
+    new_names = {f["name"] for f in new_fields}
+
+    renames = _match_renames(old_by_name, new_fields)
+    sources = {new: old for old, new in renames.items()}
+    dropped = [
+        name for name in old_by_name if name not in new_names and name not in renames
+    ]
+
+    plan = []
+    if renames:
+        plan.append({"op": "rename", "fields": renames})
+    if dropped:
+        plan.append({"op": "drop", "fields": dropped})
+
+    validate = []
+    for field_def in new_fields:
+        name = field_def["name"]
+        old_def = old_by_name.get(sources.get(name, name))
+
+        if old_def is not None and old_def.get("type") != field_def.get("type"):
+            plan.append(
+                {
+                    "op": "cast",
+                    "field": name,
+                    "from_type": old_def.get("type"),
+                    "to_type": field_def.get("type"),
+                }
+            )
+        if field_def.get("default") is not None and (
+            old_def is None or field_def.get("required")
+        ):
+            plan.append({"op": "default", "field": name, "value": field_def["default"]})
+
+        if old_def is None:
+            changed = bool(field_def.get("required"))
+        else:
+            strip = lambda d: {k: v for k, v in d.items() if k not in _COSMETIC_KEYS}
+            changed = name in sources or strip(old_def) != strip(field_def)
+        if changed or any(step.get("field") == name for step in plan):
+            validate.append(name)
+
+    plan.extend({"op": "validate", "field": name} for name in validate)
+    return plan
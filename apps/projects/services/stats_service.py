@@ -0,0 +1,175 @@
+"""
+apps/projects/services/stats_service.py
+
+Project dashboard statistics.
+
+The counters on ProjectStats, EntityTypeStats, Document and Page are kept
+current incrementally by the models' save/delete hooks. Bulk operations
+(QuerySet.update/delete, raw SQL) bypass those hooks, so reconcile_stats()
+rebuilds every counter from the source tables with a handful of set-based
+statements and refreshes the annotation density histogram, which is too
+expensive to maintain per write.
+"""
+
+import numpy as np
+from django.apps import apps
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from apps.projects.models import EntityTypeStats, Project, ProjectStats
+
+# Bin edges for the density histogram, in annotations per 1,000 characters.
+# Fixed rather than data-driven so histograms are comparable across projects.
+DENSITY_BIN_EDGES = [0, 0.5, 1, 2, 5, 10, 20, 50, np.inf]
+
+
+def forget_annotations(annotations):
+    """
+    Take a set of annotations that is about to be deleted in bulk (e.g. by a
+    cascade) off the per-entity-type counters. Returns how many there were.
+    """
+    total = 0
+    rows = (
+        annotations.order_by()
+        .values("entity__entity_type")
+        .annotate(n=Count("id"))
+    )
+    for row in rows:
+        EntityTypeStats.objects.filter(
+            entity_type_id=row["entity__entity_type"]
+        ).bump(annotation_count=-row["n"])
+        total += row["n"]
+    return total
+
+
+def density_histogram(project):
+    """
+    Bin the pages of `project` by annotations per 1,000 characters.
+    Returns a list of {"low", "high", "count"} dicts; `high` is None for the
+    open-ended last bin. Pages without text are left out.
+    """
+    Page = apps.get_model("library", "Page")
+    rows = (
+        Page.objects.filter(
+            document__project=project, document__pending_delete=False, char_count__gt=0
+        )
+        .values_list("annotation_count", "char_count")
+    )
+    counts = np.fromiter(
+        (value for row in rows.iterator(chunk_size=5000) for value in row),
+        dtype=np.float64,
+    ).reshape(-1, 2)
+    densities = counts[:, 0] * 1000 / counts[:, 1]
+    hist, edges = np.histogram(densities, bins=DENSITY_BIN_EDGES)
+    return [
+        {
+            "low": float(low),
+            "high": None if np.isinf(high) else float(high),
+            "count": int(count),
+        }
+        for low, high, count in zip(edges[:-1], edges[1:], hist)
+    ]
+
+
+@transaction.atomic
+def reconcile_stats(project=None):
+    """
+    Rebuild all counters of `project` (or of every project) from scratch and
+    refresh its density histogram. Returns the number of projects processed.
+    """
+    Page = apps.get_model("library", "Page")
+    # Documents and projects waiting for a DeletionJob are already off the counters
+    projects = (
+        Project.objects.filter(pending_delete=False) if project is None else [project]
+    )
+    processed = 0
+
+    for project in projects:
+        Page.objects.filter(document__project=project).refresh_counters()
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE library_document AS d
+                SET page_count = COALESCE(t.pages, 0),
+                    annotation_count = COALESCE(t.annotations, 0),
+                    char_count = COALESCE(t.chars, 0)
+                FROM library_document AS d2
+                LEFT JOIN (
+                    SELECT document_id, COUNT(*) AS pages,
+                           SUM(annotation_count) AS annotations,
+                           SUM(char_count) AS chars
+                    FROM library_page
+                    GROUP BY document_id
+                ) AS t ON t.document_id = d2.id
+                WHERE d.id = d2.id AND d2.project_id = %s
+                """,
+                [project.pk],
+            )
+            cursor.execute(
+                """
+                INSERT INTO projects_projectstats (
+                    project_id, document_count, page_count, empty_page_count,
+                    char_count, entity_count, annotation_count, density_histogram
+                )
+                SELECT
+                    p.id,
+                    (SELECT COUNT(*) FROM library_document d
+                      WHERE d.project_id = p.id AND NOT d.pending_delete),
+                    (SELECT COALESCE(SUM(d.page_count), 0)
+                       FROM library_document d
+                      WHERE d.project_id = p.id AND NOT d.pending_delete),
+                    (SELECT COUNT(*) FROM library_page pg
+                       JOIN library_document d ON d.id = pg.document_id
+                      WHERE d.project_id = p.id AND NOT d.pending_delete
+                        AND pg.annotation_count = 0),
+                    (SELECT COALESCE(SUM(d.char_count), 0)
+                       FROM library_document d
+                      WHERE d.project_id = p.id AND NOT d.pending_delete),
+                    (SELECT COUNT(*) FROM projects_entity e WHERE e.project_id = p.id),
+                    (SELECT COALESCE(SUM(d.annotation_count), 0)
+                       FROM library_document d
+                      WHERE d.project_id = p.id AND NOT d.pending_delete),
+                    '[]'::jsonb
+                FROM projects_project p
+                WHERE p.id = %s
+                ON CONFLICT (project_id) DO UPDATE SET
+                    document_count = EXCLUDED.document_count,
+                    page_count = EXCLUDED.page_count,
+                    empty_page_count = EXCLUDED.empty_page_count,
+                    char_count = EXCLUDED.char_count,
+                    entity_count = EXCLUDED.entity_count,
+                    annotation_count = EXCLUDED.annotation_count
+                """,
+                [project.pk],
+            )
+            cursor.execute(
+                """
+                INSERT INTO projects_entitytypestats (
+                    entity_type_id, entity_count, annotation_count
+                )
+                SELECT
+                    et.id,
+                    (SELECT COUNT(*) FROM projects_entity e WHERE e.entity_type_id = et.id),
+                    (SELECT COUNT(*) FROM annotation_annotation a
+                       JOIN projects_entity e ON e.id = a.entity_id
+                       JOIN library_page pg ON pg.id = a.page_id
+                       JOIN library_document d ON d.id = pg.document_id
+                      WHERE e.entity_type_id = et.id AND NOT d.pending_delete)
+                FROM projects_entitytype et
+                WHERE et.project_id = %s
+                ON CONFLICT (entity_type_id) DO UPDATE SET
+                    entity_count = EXCLUDED.entity_count,
+                    annotation_count = EXCLUDED.annotation_count
+                """,
+                [project.pk],
+            )
+
+        ProjectStats.objects.filter(project=project).update(
+            density_histogram=density_histogram(project),
+            histogram_updated_at=timezone.now(),
+        )
+        processed += 1
+
+    return processed
@@ -0,0 +1,36 @@
+"""
+apps/projects/signals.py
+
+Cache invalidation: any change to a project or one of its entity types drops
+what is cached for the project (see services/project_cache.py). The bump waits
+for the commit, so a concurrent request can't cache the old rows again.
+
+Also defines entities_changed, for changes that bypass the model signals.
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from apps.projects.models import EntityType, Project
+from apps.projects.services.project_cache import invalidate_project
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def project_changed(sender, instance, **kwargs):
+    # Deleting clears instance.pk before the commit
+    project_id, owner_id = instance.pk, instance.owner_id
+    transaction.on_commit(lambda: invalidate_project(project_id, owner_id))
+
+
+@receiver(post_save, sender=EntityType)
+@receiver(post_delete, sender=EntityType)
+def entity_type_changed(sender, instance, **kwargs):
+    project_id = instance.project_id
+    transaction.on_commit(lambda: invalidate_project(project_id))
+
+
+# Sent with `entity_ids` when entities' metadata or type change without
+# Entity.save(), e.g. by merge patches, bulk edits and schema migrations
+entities_changed = Signal()
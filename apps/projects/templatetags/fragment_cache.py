@@ -0,0 +1,47 @@
+from django import template
+
+from networkAnnotation.cache import cached, owner_scope, project_scope, scoped_key
+
+register = template.Library()
+
+SCOPES = {"project": project_scope, "owner": owner_scope}
+
+
+class CachedFragmentNode(template.Node):
+    def __init__(self, nodelist, scope, scope_id, name, vary_on):
+        self.nodelist = nodelist
+        self.scope = scope
+        self.scope_id = scope_id
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        scope = SCOPES[self.scope.resolve(context)](self.scope_id.resolve(context))
+        name = self.name.resolve(context)
+        key = scoped_key(
+            scope, "fragment", name, *(v.resolve(context) for v in self.vary_on)
+        )
+        return cached(f"fragment:{name}", key, lambda: self.nodelist.render(context))
+
+
+@register.tag
+def cachedfragment(parser, token):
+    """
+    Cache a template fragment under a project's or owner's scope, so it is
+    dropped together with everything else cached for them:
+
+        {% cachedfragment "project" project.pk "project_details" %}
+            ...
+        {% endcachedfragment %}
+
+    Further arguments are added to the key, e.g. the id of a row.
+    """
+    bits = token.split_contents()
+    if len(bits) < 4:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' takes a scope, a scope id and a fragment name."
+        )
+    nodelist = parser.parse(("endcachedfragment",))
+    parser.delete_first_token()
+    scope, scope_id, name, *vary_on = (parser.compile_filter(bit) for bit in bits[1:])
+    return CachedFragmentNode(nodelist, scope, scope_id, name, vary_on)
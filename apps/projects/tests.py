@@ -1,7 +1,29 @@
+import json
+
+from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.test import TestCase
+from django.urls import reverse
 
-from apps.projects.models import EntityType
+from apps.diagnostics.testing import QueryBudgetMixin
+from apps.annotation.models import Annotation
+from apps.library.models import Document, Page
+from apps.projects.models import (
+    DeletionJob,
+    Entity,
+    EntityLocation,
+    EntityType,
+    FilterIndexSync,
+    Project,
+    ProjectStats,
+)
+from apps.projects.services.deletion import (
+    run_deletion_job,
+    schedule_document_deletion,
+    schedule_project_deletion,
+)
+from apps.projects.services.project_clone import clone_project
+from apps.projects.services.schema_migration import run_pending_migrations
 
 
 class EntityTypeSchemaModelTests(TestCase):
@@ -80,3 +102,295 @@ class EntityTypeSchemaModelTests(TestCase):
             EntityType(
                 name="foo", schema={"name": {"type": "entity", "options": "cats"}}
             ).save()
+
+
+class ProjectDetailQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """The project page lists every document and entity type of a project."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("owner", password="x")
+        cls.project = Project.objects.create(owner=cls.user, title="Budgets")
+        cls.target = EntityType.objects.create(
+            project=cls.project,
+            name="Place",
+            schema=[{"name": "display_name", "label": "Name", "type": "text"}],
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.count = 0
+
+    def add_rows(self, n):
+        # Reference fields are checked against the listed types, not queried
+        schema = [
+            {"name": "display_name", "label": "Name", "type": "text"},
+            {
+                "name": "place",
+                "label": "Place",
+                "type": "reference",
+                "target_entity_type_id": str(self.target.pk),
+            },
+        ]
+        numbers = range(self.count, self.count + n)
+        EntityType.objects.bulk_create(
+            EntityType(project=self.project, name=f"Type {i}", schema=schema)
+            for i in numbers
+        )
+        Document.objects.bulk_create(
+            Document(project=self.project, title=f"Document {i}") for i in numbers
+        )
+        self.count += n
+
+    def test_project_detail(self):
+        url = reverse("projects:detail", args=[self.project.pk])
+        # session, user, project, entity types, documents
+        self.assertConstantQueries(5, self.add_rows, lambda: self.client.get(url))
+
+
+class ReferenceTargetTests(TestCase):
+    def test_target_must_be_in_the_project(self):
+        user = User.objects.create_user("owner", password="x")
+        project = Project.objects.create(owner=user, title="Mine")
+        other = EntityType.objects.create(
+            project=Project.objects.create(owner=user, title="Other"), name="Place"
+        )
+        person = EntityType(
+            project=project,
+            name="Person",
+            schema=[
+                {"name": "display_name", "label": "Name", "type": "text"},
+                {
+                    "name": "born_in",
+                    "label": "Born in",
+                    "type": "reference",
+                    "target_entity_type_id": str(other.pk),
+                },
+            ],
+        )
+        with self.assertRaises(ValidationError):
+            person.full_clean()
+
+
+class FilterIndexSyncTests(TestCase):
+    def test_schema_changes_queue_one_sync(self):
+        user = User.objects.create_user("owner", password="x")
+        project = Project.objects.create(owner=user, title="Places")
+        place = EntityType.objects.create(
+            project=project,
+            name="Place",
+            schema=[{"name": "name", "label": "Name", "type": "text", "filterable": True}],
+        )
+        place.schema = place.schema + [
+            {"name": "country", "label": "Country", "type": "text", "filterable": True}
+        ]
+        place.save()
+        self.assertEqual(
+            list(FilterIndexSync.objects.values_list("entity_type_id", "status")),
+            [(place.pk, FilterIndexSync.PENDING)],
+        )
+
+
+class SchemaMigrationTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("owner", password="x")
+        project = Project.objects.create(owner=user, title="Places")
+        self.place = EntityType.objects.create(
+            project=project,
+            name="Place",
+            schema=[
+                {"name": "notes", "label": "Notes", "type": "text"},
+                {"name": "where", "label": "Where", "type": "text"},
+            ],
+        )
+        self.leiden = Entity.objects.create(
+            entity_type=self.place,
+            metadata={"notes": {"checked": None}, "where": "52.16, 4.49"},
+        )
+
+    def test_rename_and_cast(self):
+        self.place.schema = [
+            {"name": "remarks", "label": "Notes", "type": "text", "renamed_from": "notes"},
+            {"name": "where", "label": "Where", "type": "latlong"},
+        ]
+        self.place.save()
+        run_pending_migrations(self.place)
+
+        self.leiden.refresh_from_db()
+        # Nested nulls survive the rename
+        self.assertEqual(
+            self.leiden.metadata,
+            {"remarks": {"checked": None}, "where": {"lat": 52.16, "long": 4.49}},
+        )
+        self.assertTrue(EntityLocation.objects.filter(entity=self.leiden).exists())
+
+
+class CloneProjectTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("owner", password="x")
+        cls.project = Project.objects.create(owner=cls.user, title="Source")
+        cls.place = EntityType.objects.create(
+            project=cls.project,
+            name="Place",
+            schema=[{"name": "display_name", "label": "Name", "type": "text"}],
+        )
+        cls.person = EntityType.objects.create(
+            project=cls.project,
+            name="Person",
+            schema=[
+                {"name": "display_name", "label": "Name", "type": "text"},
+                {
+                    "name": "born_in",
+                    "label": "Born in",
+                    "type": "reference",
+                    "target_entity_type_id": str(cls.place.pk),
+                },
+            ],
+        )
+        cls.leiden = Entity.objects.create(
+            entity_type=cls.place, metadata={"display_name": "Leiden"}
+        )
+        cls.anna = Entity.objects.create(
+            entity_type=cls.person,
+            metadata={"display_name": "Anna", "born_in": str(cls.leiden.pk)},
+        )
+        document = Document.objects.create(project=cls.project, title="Letters")
+        cls.page = Page.objects.create(document=document, text="Anna of Leiden")
+        Annotation.objects.create(
+            page=cls.page, entity=cls.anna, start_offset=0, end_offset=4,
+            annotated_text="Anna",
+        )
+
+    def test_clone_remaps_ids(self):
+        clone, counts = clone_project(self.project, title="Clone")
+        self.assertEqual(
+            counts,
+            {"entity_types": 2, "entities": 2, "documents": 1, "pages": 1, "annotations": 1},
+        )
+
+        place = EntityType.objects.get(project=clone, name="Place")
+        person = EntityType.objects.get(project=clone, name="Person")
+        self.assertEqual(person.schema[1]["target_entity_type_id"], str(place.pk))
+
+        leiden = Entity.objects.get(project=clone, entity_type=place)
+        anna = Entity.objects.get(project=clone, entity_type=person)
+        self.assertEqual(anna.metadata["born_in"], str(leiden.pk))
+
+        annotation = Annotation.objects.get(page__document__project=clone)
+        self.assertEqual(annotation.entity_id, anna.pk)
+        self.assertEqual(annotation.page.text, "Anna of Leiden")
+        self.assertEqual(ProjectStats.objects.get(project=clone).annotation_count, 1)
+        self.assertEqual(person.stats.annotation_count, 1)
+
+        # The source is untouched
+        self.anna.refresh_from_db()
+        self.assertEqual(self.anna.metadata["born_in"], str(self.leiden.pk))
+        self.assertEqual(Entity.objects.filter(project=self.project).count(), 2)
+
+    def test_template_copies_no_documents(self):
+        clone, counts = clone_project(self.project, library=False)
+        self.assertNotIn("documents", counts)
+        self.assertFalse(Document.objects.filter(project=clone).exists())
+        stats = ProjectStats.objects.get(project=clone)
+        self.assertEqual(stats.entity_count, 2)
+        self.assertEqual(stats.annotation_count, 0)
+        self.assertEqual(clone.title, "Copy of Source")
+
+
+class DeletionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("owner", password="x")
+        self.project = Project.objects.create(owner=self.user, title="Doomed")
+        place = EntityType.objects.create(
+            project=self.project,
+            name="Place",
+            schema=[{"name": "display_name", "label": "Name", "type": "text"}],
+        )
+        entity = Entity.objects.create(entity_type=place, metadata={"display_name": "Leiden"})
+        self.document = Document.objects.create(project=self.project, title="Letters")
+        page = self.page = Page.objects.create(document=self.document, text="Leiden")
+        Annotation.objects.create(
+            page=page, entity=entity, start_offset=0, end_offset=6, annotated_text="Leiden"
+        )
+        self.client.force_login(self.user)
+
+    def test_project_is_hidden_then_removed(self):
+        response = self.client.post(reverse("projects:delete", args=[self.project.pk]))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            self.client.get(reverse("projects:detail", args=[self.project.pk])).status_code,
+            404,
+        )
+        self.assertEqual(
+            self.client.get(reverse("annotation:annotations", args=[self.page.pk])).status_code,
+            404,
+        )
+        job = DeletionJob.objects.get(object_id=self.project.pk)
+        self.assertTrue(Project.objects.filter(pk=self.project.pk).exists())
+
+        run_deletion_job(job)
+        self.assertEqual(job.status, DeletionJob.DONE)
+        self.assertFalse(Project.objects.filter(pk=self.project.pk).exists())
+        self.assertFalse(Entity.objects.exists())
+        self.assertFalse(Annotation.objects.exists())
+        self.assertEqual(job.progress["annotation_annotation"], 1)
+
+    def test_entities_are_hidden_while_pending(self):
+        schedule_project_deletion(self.project, self.user)
+        entity = Entity.objects.get()
+        self.assertEqual(
+            self.client.get(
+                reverse("annotation:entity_list", args=[self.project.pk, entity.entity_type_id])
+            ).status_code,
+            404,
+        )
+        response = self.client.patch(
+            reverse("annotation:entity_update", args=[entity.pk]),
+            json.dumps({"metadata": {"display_name": "Delft"}}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 404)
+        entity.refresh_from_db()
+        self.assertEqual(entity.metadata["display_name"], "Leiden")
+
+    def test_project_with_entities_annotated_elsewhere_is_kept(self):
+        other = Project.objects.create(owner=self.user, title="Other")
+        page = Page.objects.create(
+            document=Document.objects.create(project=other, title="Notes"), text="Leiden"
+        )
+        Annotation.objects.create(
+            page=page, entity=Entity.objects.get(), start_offset=0, end_offset=6,
+            annotated_text="Leiden",
+        )
+        url = reverse("projects:delete", args=[self.project.pk])
+        self.assertNotContains(self.client.get(url), 'type="submit"')
+
+        self.assertEqual(self.client.post(url).status_code, 409)
+        self.assertFalse(DeletionJob.objects.exists())
+        self.project.refresh_from_db()
+        self.assertFalse(self.project.pending_delete)
+
+    def test_document_is_taken_off_the_counters(self):
+        job = schedule_document_deletion(self.document, self.user)
+        stats = ProjectStats.objects.get(project=self.project)
+        self.assertEqual(
+            (stats.document_count, stats.page_count, stats.annotation_count), (0, 0, 0)
+        )
+        self.assertEqual(
+            self.client.get(
+                reverse("library:document_detail", args=[self.project.pk, self.document.pk])
+            ).status_code,
+            404,
+        )
+
+        run_deletion_job(job)
+        self.assertFalse(Document.objects.exists())
+        self.assertFalse(Page.objects.exists())
+        # The entities belong to the project, which stays
+        self.assertEqual(Entity.objects.count(), 1)
+
+    def test_scheduling_twice_queues_one_job(self):
+        schedule_document_deletion(self.document)
+        schedule_document_deletion(self.document)
+        self.assertEqual(DeletionJob.objects.filter(kind=DeletionJob.DOCUMENT).count(), 1)
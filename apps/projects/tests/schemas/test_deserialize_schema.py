@@ -0,0 +1,42 @@
+# tests/test_deserialize_schema.py
+import uuid
+
+import pytest
+from django.core.exceptions import ValidationError
+
+from apps.projects.services.schema_service import deserialize_schema
+
+TARGET = str(uuid.uuid4())
+
+
+def schema(**extra):
+    return [
+        {"name": "display_name", "label": "Name", "type": "text", **extra},
+        {"name": "place", "label": "Place", "type": "reference", "target_entity_type_id": TARGET},
+    ]
+
+
+def test_cached_per_entity_type_and_schema():
+    type_id = uuid.uuid4()
+    first = deserialize_schema(schema(), type_id, [TARGET])
+    assert [f.to_dict()["name"] for f in first] == ["display_name", "place"]
+    assert deserialize_schema(schema(), type_id, [TARGET])[0] is first[0]
+
+    changed = deserialize_schema(schema(required=True), type_id, [TARGET])
+    assert changed[0] is not first[0]
+    assert changed[0].required
+
+
+def test_cache_is_not_shared_with_the_callers_schema():
+    type_id = uuid.uuid4()
+    defs = schema()
+    fields = deserialize_schema(defs, type_id, [TARGET])
+    defs[0]["label"] = "Changed"
+    assert fields[0].to_dict()["label"] == "Name"
+
+
+def test_reference_targets_checked_on_every_call():
+    type_id = uuid.uuid4()
+    deserialize_schema(schema(), type_id, [TARGET])
+    with pytest.raises(ValidationError):
+        deserialize_schema(schema(), type_id, [str(uuid.uuid4())])
@@ -0,0 +1,18 @@
+# tests/test_merge_patch.py
+from apps.projects.services.schema_service import merge_patch
+
+
+def test_rfc7386_examples():
+    assert merge_patch({"a": "b"}, {"a": "c"}) == {"a": "c"}
+    assert merge_patch({"a": "b"}, {"b": "c"}) == {"a": "b", "b": "c"}
+    assert merge_patch({"a": "b"}, {"a": None}) == {}
+    assert merge_patch({"a": {"b": "c"}}, {"a": {"b": "d", "c": None}}) == {"a": {"b": "d"}}
+    assert merge_patch({"a": [{"b": "c"}]}, {"a": [1]}) == {"a": [1]}
+    assert merge_patch({"a": "foo"}, None) is None
+    assert merge_patch("bar", {"a": "b"}) == {"a": "b"}
+
+
+def test_target_is_not_modified():
+    target = {"loc": {"lat": 1, "long": 2}}
+    merge_patch(target, {"loc": {"lat": 3}})
+    assert target == {"loc": {"lat": 1, "long": 2}}
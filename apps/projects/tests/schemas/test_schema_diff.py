@@ -0,0 +1,45 @@
+# tests/test_schema_diff.py
+from apps.projects.services.schema_service import diff_schemas
+
+
+def field(name, type="text", **extra):
+    return {"name": name, "label": name.title(), "type": type, **extra}
+
+
+def test_unchanged_schema_has_empty_plan():
+    schema = [field("display_name", required=True), field("age", "number")]
+    assert diff_schemas(schema, schema) == []
+
+
+def test_explicit_rename():
+    old = [field("display_name"), field("born")]
+    new = [field("display_name"), field("birth_date", renamed_from="born")]
+    plan = diff_schemas(old, new)
+    assert plan[0] == {"op": "rename", "fields": {"born": "birth_date"}}
+    assert {"op": "validate", "field": "birth_date"} in plan
+
+
+def test_rename_matched_by_label_and_type():
+    old = [field("display_name"), {"name": "dob", "label": "Born", "type": "date"}]
+    new = [field("display_name"), {"name": "born", "label": "Born", "type": "date"}]
+    assert diff_schemas(old, new)[0] == {"op": "rename", "fields": {"dob": "born"}}
+
+
+def test_drop_cast_and_default():
+    old = [field("display_name"), field("notes"), field("age")]
+    new = [
+        field("display_name"),
+        field("age", "number"),
+        field("region", "dropdown", choices=["N", "S"], required=True, default="N"),
+    ]
+    plan = diff_schemas(old, new)
+    assert {"op": "drop", "fields": ["notes"]} in plan
+    assert {"op": "cast", "field": "age", "from_type": "text", "to_type": "number"} in plan
+    assert {"op": "default", "field": "region", "value": "N"} in plan
+    assert [s["field"] for s in plan if s["op"] == "validate"] == ["age", "region"]
+
+
+def test_label_change_needs_no_validation():
+    old = [field("display_name"), field("age", "number")]
+    new = [field("display_name"), {**field("age", "number"), "label": "Age (years)"}]
+    assert diff_schemas(old, new) == []
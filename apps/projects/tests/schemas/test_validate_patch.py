@@ -0,0 +1,31 @@
+# tests/test_validate_patch.py
+import pytest
+from django.core.exceptions import ValidationError
+
+from apps.projects.services.schema_service import validate_patch
+
+SCHEMA = [
+    {"name": "display_name", "label": "Display Name", "type": "text", "required": True},
+    {"name": "region", "label": "Region", "type": "dropdown", "choices": ["N", "S"]},
+    {"name": "population", "label": "Population", "type": "number"},
+]
+
+
+def test_valid_patch():
+    validate_patch(SCHEMA, {"region": "N", "population": 12})
+
+
+def test_null_removes_optional_field():
+    validate_patch(SCHEMA, {"region": None})
+
+
+def test_null_required_field():
+    with pytest.raises(ValidationError) as e:
+        validate_patch(SCHEMA, {"display_name": None})
+    assert "display_name" in e.value.message_dict
+
+
+def test_only_patched_fields_are_checked():
+    with pytest.raises(ValidationError) as e:
+        validate_patch(SCHEMA, {"region": "West", "unknown": 1})
+    assert set(e.value.message_dict) == {"region", "unknown"}
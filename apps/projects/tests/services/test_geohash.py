@@ -0,0 +1,36 @@
+# tests/test_geohash.py
+import random
+
+from apps.projects.services import geohash
+
+
+def test_encode_known_values():
+    assert geohash.encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geohash.encode(42.6, -5.6, 5) == "ezs42"
+    assert geohash.encode(-90, -180) == "0" * geohash.PRECISION
+    assert geohash.encode(90, 180) == "z" * geohash.PRECISION
+
+
+def test_cover_contains_every_point_of_the_box():
+    rng = random.Random(7)
+    for _ in range(50):
+        south = rng.uniform(-89, 80)
+        west = rng.uniform(-179, 170)
+        north = south + rng.uniform(0, 10)
+        east = west + rng.uniform(0, 10)
+        cells = geohash.cover(south, west, north, east)
+        assert len(cells) <= geohash.MAX_COVER_CELLS
+        for _ in range(20):
+            h = geohash.encode(rng.uniform(south, north), rng.uniform(west, east))
+            assert any(cell <= h < geohash.prefix_upper_bound(cell) for cell in cells)
+
+
+def test_split_box_across_antimeridian():
+    assert geohash.split_box(0, 170, 10, -170) == [(0, 170, 10, 180.0), (0, -180.0, 10, -170)]
+    assert geohash.split_box(0, -10, 10, 10) == [(0, -10, 10, 10)]
+
+
+def test_zoom_precision_grows_with_zoom():
+    precisions = [geohash.zoom_precision(zoom) for zoom in range(23)]
+    assert precisions == sorted(precisions)
+    assert precisions[0] == 1 and precisions[-1] == geohash.PRECISION
@@ -22,6 +22,11 @@ urlpatterns = [
         views.project_details_partial,
         name="details_partial",
     ),
+    path(
+        "<str:pk>/stats-partial/",
+        views.project_stats_partial,
+        name="stats_partial",
+    ),
     path("<str:pk>/edit", ProjectUpdateView.as_view(), name="edit"),
     path("<str:pk>/delete", ProjectDeleteView.as_view(), name="delete"),
     # EntityType CRUD (inline via HTMX)
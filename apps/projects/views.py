@@ -2,7 +2,8 @@ import json
 
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponse
+from django.db.models import ProtectedError
+from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import render, get_object_or_404
 from django.urls import reverse_lazy
 from django.views.generic import (
@@ -15,8 +16,11 @@ from django.views.generic import (
 
 from networkAnnotation.decorators import htmx_only
 from .forms import ProjectForm, EntityTypeForm
-from apps.projects.models import Project, EntityType
+from apps.projects.models import Project, EntityType, ProjectStats
 from .schema_definitions.registry import FIELD_REGISTRY
+from .services.deletion import external_annotations, schedule_project_deletion
+from .services.project_cache import get_project_or_404, project_entity_types
+from .services.schema_migration import migrate_if_small
 
 """
 Project List View
@@ -31,7 +35,7 @@ class ProjectListView(LoginRequiredMixin, TemplateView):
 @htmx_only
 def project_list_partial(request):
     """Returns only the list HTML for htmx swaps. This makes the back button a better experience"""
-    projects = Project.objects.filter(owner=request.user)
+    projects = Project.objects.filter(owner=request.user, pending_delete=False)
     return render(
         request, "partials/project_list_partial.html", {"project_list": projects}
     )
@@ -60,12 +64,17 @@ class ProjectDetailView(LoginRequiredMixin, DetailView):
     model = Project
     template_name = "project_detail.html"
 
+    def get_object(self, queryset=None):
+        return get_project_or_404(self.kwargs["pk"])
+
     def get_context_data(self, **kwargs):
         context = super(ProjectDetailView, self).get_context_data(**kwargs)
-        entity_types = self.object.entity_types.all()
+        entity_types = project_entity_types(self.object.pk)
+        entity_type_ids = [et.pk for et in entity_types]
         context["entity_types"] = entity_types
+        context["documents"] = self.object.documents.filter(pending_delete=False)
         context["schemas"] = {
-            et.id: et.schema_object for et in entity_types
+            et.id: et.deserialized_schema(entity_type_ids) for et in entity_types
         }  # optional: also pass deserialized schema
         context["breadcrumbs"] = [
             {
@@ -80,6 +89,7 @@ class ProjectDetailView(LoginRequiredMixin, DetailView):
 
 class ProjectUpdateView(LoginRequiredMixin, UpdateView):
     model = Project
+    queryset = Project.objects.filter(pending_delete=False)
     form_class = ProjectForm
     # fields = ["title", "description"]
     template_name = "partials/project_edit_partial.html"
@@ -92,25 +102,67 @@ class ProjectUpdateView(LoginRequiredMixin, UpdateView):
 @login_required
 @htmx_only
 def project_details_partial(request, pk):
-    project = get_object_or_404(Project, pk=pk)
+    project = get_project_or_404(pk)
     return render(
         request, "partials/project_details_partial.html", {"project": project}
     )
 
 
+@login_required
+@htmx_only
+def project_stats_partial(request, pk):
+    """Dashboard counters; reads only the materialized stats rows."""
+    project = get_project_or_404(pk)
+    stats = get_object_or_404(ProjectStats, project=project)
+    entity_types = (
+        EntityType.objects.filter(project=project)
+        .select_related("stats")
+        .only("id", "name", "color", "stats__entity_count", "stats__annotation_count")
+        .order_by("name")
+    )
+    max_bin = max((b["count"] for b in stats.density_histogram), default=0)
+    return render(
+        request,
+        "partials/project_stats_partial.html",
+        {
+            "stats": stats,
+            "entity_types": entity_types,
+            "annotated_page_count": stats.page_count - stats.empty_page_count,
+            "max_bin": max_bin,
+        },
+    )
+
+
 class ProjectDeleteView(LoginRequiredMixin, DeleteView):
     model = Project
+    queryset = Project.objects.filter(pending_delete=False)
     template_name = "confirm_modal.html"
     success_url = reverse_lazy("projects:list")
 
+    def form_valid(self, form):
+        # Everything under the project goes in the background, see services/deletion.py
+        try:
+            schedule_project_deletion(self.object, self.request.user)
+        except ProtectedError as e:
+            return HttpResponse(e.args[0], status=409)
+        return HttpResponseRedirect(self.get_success_url())
+
     def get_context_data(self, **kwargs):
         context = super(ProjectDeleteView, self).get_context_data(**kwargs)
-        return context | {
+        context |= {
             "url": reverse_lazy("projects:delete", kwargs={"pk": self.object.pk}),
             "target": "body",
             "prompt": f"Are you sure you want to delete {self.object}?",
             "confirm_text": "Delete",
         }
+        blocking = external_annotations(self.object).count()
+        if blocking:
+            context["prompt"] = (
+                f"{self.object} can't be deleted: {blocking} annotation(s) in "
+                "other projects refer to its entities. Remove them first."
+            )
+            context["confirm_text"] = None
+        return context
 
 
 """
@@ -121,7 +173,7 @@ EntityType CRUD
 @login_required
 @htmx_only
 def add_entitytype(request, pk):
-    project = get_object_or_404(Project, pk=pk)
+    project = get_object_or_404(Project, pk=pk, pending_delete=False)
     form = EntityTypeForm(request.POST or None, project=project)
     if request.method == "POST":
         if form.is_valid():
@@ -131,7 +183,11 @@ def add_entitytype(request, pk):
             return render(
                 request,
                 "partials/entitytype_list_partial.html",
-                {"entity": entity, "new": True},
+                {
+                    "entity": entity,
+                    "new": True,
+                    "entity_types": project.entity_types.all(),
+                },
             )
             # If not valid, re-render form with errors
         print("INVALID!")
@@ -159,18 +215,26 @@ def add_entitytype(request, pk):
 @htmx_only
 def entity_row_partial(request, pk):
     entity = get_object_or_404(EntityType, pk=pk)
-    return render(request, "partials/entitytype_list_partial.html", {"entity": entity})
+    return render(
+        request,
+        "partials/entitytype_list_partial.html",
+        {"entity": entity, "entity_types": entity.project.entity_types.all()},
+    )
 
 
 @login_required
 @htmx_only
 def edit_entitytype(request, pk):
-    entity = get_object_or_404(EntityType, pk=pk)
+    entity = get_object_or_404(EntityType.objects.select_related("project"), pk=pk)
     form = EntityTypeForm(request.POST or None, instance=entity)
-    project_entity_types = entity.project.entity_types.all()
     if request.method == "POST" and form.is_valid():
-        form.save()
-        entity = get_object_or_404(EntityType, pk=pk)
+        # The saved instance is the one to show; no need to load it again
+        entity = form.save()
+        # Read after the save, which drops the cached list
+        entity_types = project_entity_types(entity.project_id)
+        entity.deserialized_schema([t.pk for t in entity_types])
+        # Bring existing metadata in line with the new schema
+        schema_migration = migrate_if_small(entity)
         schema = json.dumps(entity.schema)
         return render(
             request,
@@ -178,7 +242,8 @@ def edit_entitytype(request, pk):
             {
                 "entity": entity,
                 "schema_json": schema,
-                "entity_types": project_entity_types,
+                "entity_types": entity_types,
+                "schema_migration": schema_migration,
             },
         )
 
@@ -191,7 +256,7 @@ def edit_entitytype(request, pk):
             "entity": entity,
             "schema_json": schema,
             "field_types": FIELD_REGISTRY.keys(),
-            "entity_types": project_entity_types,
+            "entity_types": project_entity_types(entity.project_id),
         },
     )
 
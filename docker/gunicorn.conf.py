@@ -0,0 +1,31 @@
+# Gunicorn settings for running with several workers.
+#
+# Metrics are shared between workers through PROMETHEUS_MULTIPROC_DIR (see
+# networkAnnotation/metrics.py): the directory is emptied when the server
+# starts, and the live gauges of a worker are dropped when it exits. The
+# cache must be shared between workers too (CACHE_BACKEND file or redis).
+
+import os
+import shutil
+
+workers = int(os.getenv("GUNICORN_WORKERS", 4))
+
+
+def on_starting(server):
+    # A per-process cache is invalidated only in the worker that wrote
+    if workers > 1 and os.getenv("CACHE_BACKEND") == "locmem":
+        raise RuntimeError(
+            "CACHE_BACKEND=locmem with several workers serves stale data; "
+            "use the file or redis backend."
+        )
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,73 @@
+"""
+networkAnnotation/cache.py
+
+Versioned cache keys and hit/miss accounting on top of Django's cache.
+
+Cached values live under a scope, e.g. "project:<id>". Every key of a scope
+embeds the scope's current version, so invalidating everything cached for a
+project is a single bump_scope() -- old entries are never read again and
+simply expire. Versions start from the clock rather than 1, so a version key
+that was evicted can't come back as a version that was already used.
+
+Reads through cached() are counted per namespace by the
+networkannotation_cache_reads metric, summed over all worker processes; the
+hit ratio of a namespace is hits / (hits + misses).
+"""
+
+import time
+
+from django.core.cache import cache
+from django.conf import settings
+
+from networkAnnotation.metrics import CACHE_READS
+
+_MISSING = object()
+
+
+def _version_key(scope):
+    return f"{scope}:version"
+
+
+def scope_version(scope):
+    version = cache.get(_version_key(scope))
+    if version is None:
+        cache.add(_version_key(scope), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(scope))
+    return version
+
+
+def bump_scope(scope):
+    """Invalidate every key of `scope`."""
+    try:
+        cache.incr(_version_key(scope))
+    except ValueError:
+        # Nothing cached under the scope yet
+        cache.add(_version_key(scope), time.time_ns(), timeout=None)
+
+
+def scoped_key(scope, *parts):
+    return ":".join([scope, f"v{scope_version(scope)}", *(str(p) for p in parts)])
+
+
+def project_scope(project_id):
+    return f"project:{project_id}"
+
+
+def owner_scope(user_id):
+    return f"owner:{user_id}"
+
+
+def cached(namespace, key, compute, timeout=None):
+    """
+    The value cached under `key`, or compute() stored there. Counts the hit
+    or miss under `namespace`.
+    """
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        CACHE_READS.labels(namespace, "hits").inc()
+        return value
+    CACHE_READS.labels(namespace, "misses").inc()
+    value = compute()
+    cache.set(key, value, settings.CACHE_TIMEOUT if timeout is None else timeout)
+    return value
+
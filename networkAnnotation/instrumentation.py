@@ -0,0 +1,179 @@
+"""
+networkAnnotation/instrumentation.py
+
+Per-request database instrumentation: query count, time spent in the
+database, and repeated query shapes -- the signature of an N+1 (the same
+SELECT run once per row of an earlier result).
+
+QueryInstrumentationMiddleware adds a Server-Timing header to every response
+and logs one structured (JSON) line per request on the
+"networkAnnotation.queries" logger: INFO normally, WARNING when a query
+shape repeats QUERY_REPEAT_THRESHOLD times or more.
+
+Queries are recorded by an execute wrapper installed on every database
+connection; it reports to the request found in a context variable, so
+queries that async views run through sync_to_async are counted too. Queries
+run while a streaming response is iterated, after the middleware returned,
+are not.
+"""
+
+import json
+import logging
+import re
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger("networkAnnotation.queries")
+
+# Repeated shapes reported per request, most frequent first
+MAX_REPORTED_SHAPES = 5
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)", re.IGNORECASE)
+_VALUES = re.compile(r"\bVALUES\s*(\([^()]*\))(?:\s*,\s*\([^()]*\))+", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+_current = ContextVar("request_queries", default=None)
+
+
+def normalize_sql(sql):
+    """
+    The shape of a statement: literals become ?, IN lists and multi-row
+    VALUES collapse, so queries differing only in their values compare equal.
+    """
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("IN (...)", sql)
+    sql = _VALUES.sub(r"VALUES \1, ...", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+class RequestQueries:
+    """The queries of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self._shapes = defaultdict(lambda: [0, 0.0])
+
+    def record(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        shape = self._shapes[normalize_sql(sql)]
+        shape[0] += 1
+        shape[1] += duration
+
+    def repeated(self, threshold):
+        """[{"sql", "count", "ms"}, ...] of the shapes run `threshold` times or more."""
+        shapes = [
+            {"sql": sql, "count": count, "ms": round(duration * 1000, 2)}
+            for sql, (count, duration) in self._shapes.items()
+            if count >= threshold
+        ]
+        shapes.sort(key=lambda s: (-s["count"], -s["ms"]))
+        return shapes
+
+
+def current_queries():
+    """The RequestQueries of the request being handled, or None."""
+    return _current.get()
+
+
+def _record(execute, sql, params, many, context):
+    queries = _current.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries.record(sql, time.perf_counter() - start)
+
+
+def install(connection):
+    """Record the queries of `connection`; idempotent."""
+    if _record not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    install(connection)
+
+
+connection_created.connect(_on_connection_created)
+
+
+def server_timing(queries, total):
+    return (
+        f'db;dur={queries.duration * 1000:.1f};desc="{queries.count} queries", '
+        f"total;dur={total * 1000:.1f}"
+    )
+
+
+def _log(request, response, queries, total):
+    match = request.resolver_match
+    threshold = settings.QUERY_REPEAT_THRESHOLD
+    repeated = queries.repeated(threshold)
+    line = {
+        "view": match.view_name if match else None,
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "queries": queries.count,
+        "db_ms": round(queries.duration * 1000, 2),
+        "total_ms": round(total * 1000, 2),
+    }
+    if repeated:
+        line["repeated"] = repeated[:MAX_REPORTED_SHAPES]
+        logger.warning(json.dumps(line))
+    else:
+        logger.info(json.dumps(line))
+
+
+class QueryInstrumentationMiddleware:
+    """First in MIDDLEWARE when settings.QUERY_INSTRUMENTATION is on."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+        queries = RequestQueries()
+        token = _current.set(queries)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, queries, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        queries = RequestQueries()
+        token = _current.set(queries)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, queries, time.perf_counter() - start)
+
+    def _finish(self, request, response, queries, total):
+        response["Server-Timing"] = server_timing(queries, total)
+        _log(request, response, queries, total)
+        return response
@@ -0,0 +1,234 @@
+"""
+networkAnnotation/live.py
+
+Fan-out of change events to the live (server-sent events) streams.
+
+Code that changes data calls publish(channel, event) inside its transaction;
+subscribers receive the event once that transaction commits, never if it
+rolls back. Channels are per document and per project, see document_channel()
+and project_channel().
+
+The broker is chosen by settings.LIVE_EVENTS_BROKER:
+    PostgresBroker  -- NOTIFY on publish, so every server process hears every
+                       event; the default
+    InProcessBroker -- only subscribers in the publishing process; for tests
+                       and single-process development
+
+Subscribers wait on an event loop, so the streams need an ASGI server.
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+from collections import defaultdict
+
+import psycopg2
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Events a subscriber hasn't read yet; past this it gets a "resync" event
+# instead of the ones it missed
+SUBSCRIBER_QUEUE_SIZE = 1000
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD_BYTES = 7900
+LISTEN_RECONNECT_SECONDS = 2
+
+
+def document_channel(document_id):
+    return f"doc_{document_id.hex if hasattr(document_id, 'hex') else document_id}"
+
+
+def project_channel(project_id):
+    return f"proj_{project_id.hex if hasattr(project_id, 'hex') else project_id}"
+
+
+def encode_event(event):
+    return json.dumps(event, cls=DjangoJSONEncoder)
+
+
+class Subscription:
+    def __init__(self, channels):
+        self.channels = list(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, event):
+        """Called on the subscriber's loop."""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout=None):
+        """
+        The next event. Raises TimeoutError after `timeout` seconds without one.
+        """
+        if self.overflowed and self.queue.empty():
+            self.overflowed = False
+            return {"type": "resync"}
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+
+    def publish(self, channel, event):
+        transaction.on_commit(lambda: self.dispatch(channel, event))
+
+    def dispatch(self, channel, event):
+        """Hand `event` to every subscriber of `channel`, from any thread."""
+        for subscription in list(self._subscriptions.get(channel, ())):
+            subscription.loop.call_soon_threadsafe(subscription.put, event)
+
+    def _add(self, subscription):
+        for channel in subscription.channels:
+            self._subscriptions[channel].add(subscription)
+
+    def _remove(self, subscription):
+        """Returns the channels nobody subscribes to anymore."""
+        unused = []
+        for channel in subscription.channels:
+            self._subscriptions[channel].discard(subscription)
+            if not self._subscriptions[channel]:
+                del self._subscriptions[channel]
+                unused.append(channel)
+        return unused
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, channels):
+        subscription = Subscription(channels)
+        self._add(subscription)
+        try:
+            yield subscription
+        finally:
+            self._remove(subscription)
+
+
+class PostgresBroker(InProcessBroker):
+    """
+    Each process keeps a single LISTEN connection, on the event loop of its
+    first subscriber, and fans the notifications out to its subscribers.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._listen_conn = None
+        self._loop = None
+
+    def publish(self, channel, event):
+        payload = encode_event(event)
+        if len(payload.encode()) > MAX_PAYLOAD_BYTES:
+            payload = encode_event({**_summary(event), "truncated": True})
+        # NOTIFY is transactional: Postgres delivers it on commit
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [channel, payload])
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, channels):
+        subscription = Subscription(channels)
+        self._ensure_listener(subscription.loop)
+        new = [c for c in subscription.channels if c not in self._subscriptions]
+        self._add(subscription)
+        self._execute(*(f'LISTEN "{c}"' for c in new))
+        try:
+            yield subscription
+        finally:
+            unused = self._remove(subscription)
+            self._execute(*(f'UNLISTEN "{c}"' for c in unused))
+
+    def _ensure_listener(self, loop):
+        if self._listen_conn is not None and self._loop is loop and not loop.is_closed():
+            return
+        self._close_listener()
+        self._loop = loop
+        try:
+            conn = psycopg2.connect(**connection.get_connection_params())
+        except psycopg2.Error:
+            logger.exception("Live events: can't open the LISTEN connection")
+            loop.call_later(LISTEN_RECONNECT_SECONDS, self._reconnect)
+            return
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        self._listen_conn = conn
+        loop.add_reader(conn.fileno(), self._on_notify)
+
+    def _execute(self, *statements):
+        if self._listen_conn is None or not statements:
+            return
+        try:
+            with self._listen_conn.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+        except psycopg2.Error:
+            logger.exception("Live events: LISTEN connection failed")
+            self._lost_connection()
+
+    def _on_notify(self):
+        try:
+            self._listen_conn.poll()
+        except psycopg2.Error:
+            logger.exception("Live events: LISTEN connection failed")
+            self._lost_connection()
+            return
+        while self._listen_conn.notifies:
+            notify = self._listen_conn.notifies.pop(0)
+            try:
+                event = json.loads(notify.payload)
+            except ValueError:
+                continue
+            self.dispatch(notify.channel, event)
+
+    def _lost_connection(self):
+        self._close_listener()
+        # Whatever was published meanwhile is lost; clients have to reload
+        for channel in list(self._subscriptions):
+            self.dispatch(channel, {"type": "resync"})
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_later(LISTEN_RECONNECT_SECONDS, self._reconnect)
+
+    def _reconnect(self):
+        if self._listen_conn is not None or not self._subscriptions:
+            return
+        self._ensure_listener(self._loop)
+        self._execute(*(f'LISTEN "{c}"' for c in self._subscriptions))
+
+    def _close_listener(self):
+        if self._listen_conn is None:
+            return
+        with contextlib.suppress(Exception):
+            self._loop.remove_reader(self._listen_conn.fileno())
+        with contextlib.suppress(Exception):
+            self._listen_conn.close()
+        self._listen_conn = None
+
+
+def _summary(event):
+    """What is left of an event too large to send: its type and ids."""
+    return {
+        key: value
+        for key, value in event.items()
+        if key == "type" or key == "id" or key.endswith("_id") or key.endswith("_ids")
+    }
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(settings.LIVE_EVENTS_BROKER)()
+    return _broker
+
+
+def publish(channel, event):
+    """Send `event` (a dict with a "type") to `channel` once the transaction commits."""
+    get_broker().publish(channel, event)
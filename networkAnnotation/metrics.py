@@ -0,0 +1,206 @@
+"""
+networkAnnotation/metrics.py
+
+Prometheus metrics, served in the text format at /metrics.
+
+MetricsMiddleware records, per resolved URL name (e.g.
+"annotation:annotations"): request latency, requests in flight, queries per
+request (counted by instrumentation.py), response sizes, and requests by
+status code and exceptions by class, from which error rates follow. Cache
+reads are counted by networkAnnotation/cache.py; the background job queues
+(schema migrations, filter index syncs, deletions) are measured when
+/metrics is scraped.
+
+With several worker processes (gunicorn, uvicorn --workers), set the
+PROMETHEUS_MULTIPROC_DIR environment variable to an empty directory shared
+by the workers: each process then writes its samples to memory-mapped files
+there and /metrics adds them up, whichever worker serves it. The directory
+must be emptied before the server starts; docker/gunicorn.conf.py removes
+the files of workers that exit.
+"""
+
+import hmac
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Count
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from networkAnnotation.instrumentation import current_queries
+
+# Label of requests that didn't resolve to a view
+UNRESOLVED = "<unresolved>"
+
+REQUEST_LATENCY = Histogram(
+    "networkannotation_request_duration_seconds",
+    "Time to produce the response.",
+    ["view", "method"],
+)
+REQUESTS = Counter(
+    "networkannotation_requests",
+    "Responses by status code.",
+    ["view", "method", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "networkannotation_requests_in_flight",
+    "Requests being handled.",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+EXCEPTIONS = Counter(
+    "networkannotation_view_exceptions",
+    "Exceptions raised by views.",
+    ["view", "exception"],
+)
+REQUEST_QUERIES = Histogram(
+    "networkannotation_request_queries",
+    "Database queries per request.",
+    ["view"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+RESPONSE_SIZE = Histogram(
+    "networkannotation_response_size_bytes",
+    "Size of non-streaming response bodies.",
+    ["view"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+CACHE_READS = Counter(
+    "networkannotation_cache_reads",
+    "Reads through networkAnnotation.cache.cached().",
+    ["namespace", "outcome"],
+)
+
+
+# Queue label -> model of the jobs; each has a status with PENDING and RUNNING
+JOB_QUEUES = {
+    "schema_migration": "projects.SchemaMigration",
+    "filter_index_sync": "projects.FilterIndexSync",
+    "deletion": "projects.DeletionJob",
+}
+
+
+class JobQueueCollector:
+    """Background jobs waiting or running, per queue, read from the database."""
+
+    def collect(self):
+        gauge = GaugeMetricFamily(
+            "networkannotation_background_jobs",
+            "Background jobs by queue and status.",
+            labels=["queue", "status"],
+        )
+        for queue, model_name in JOB_QUEUES.items():
+            Job = apps.get_model(model_name)
+            counts = dict.fromkeys([Job.PENDING, Job.RUNNING], 0)
+            try:
+                counts.update(
+                    Job.objects.filter(status__in=list(counts))
+                    .order_by()
+                    .values_list("status")
+                    .annotate(n=Count("pk"))
+                )
+            except DatabaseError:
+                # The request metrics are still worth scraping
+                return
+            for status, n in counts.items():
+                gauge.add_metric([queue, status], n)
+        yield gauge
+
+
+def _view_name(request):
+    match = request.resolver_match
+    return match.view_name if match else UNRESOLVED
+
+
+class MetricsMiddleware:
+    """Place it right after QueryInstrumentationMiddleware."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        in_flight = REQUESTS_IN_FLIGHT.labels(request.method)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            in_flight.dec()
+        self._observe(request, response, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        in_flight = REQUESTS_IN_FLIGHT.labels(request.method)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            in_flight.dec()
+        self._observe(request, response, time.perf_counter() - start)
+        return response
+
+    def process_exception(self, request, exception):
+        EXCEPTIONS.labels(_view_name(request), type(exception).__name__).inc()
+
+    def _observe(self, request, response, duration):
+        view = _view_name(request)
+        REQUEST_LATENCY.labels(view, request.method).observe(duration)
+        REQUESTS.labels(view, request.method, str(response.status_code)).inc()
+        queries = current_queries()
+        if queries is not None:
+            REQUEST_QUERIES.labels(view).observe(queries.count)
+        if not response.streaming:
+            RESPONSE_SIZE.labels(view).observe(len(response.content))
+
+
+def _registry():
+    registry = CollectorRegistry()
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(_ProcessRegistry())
+    registry.register(JobQueueCollector())
+    return registry
+
+
+class _ProcessRegistry:
+    """The metrics of this process alone, when there is no multiprocess directory."""
+
+    def collect(self):
+        return REGISTRY.collect()
+
+
+def metrics_view(request):
+    """
+    Open to anyone who can reach it unless settings.METRICS_TOKEN is set;
+    then scrapers must send it as a bearer token.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        supplied = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            return HttpResponseForbidden()
+    return HttpResponse(generate_latest(_registry()), content_type=CONTENT_TYPE_LATEST)
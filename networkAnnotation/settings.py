@@ -48,6 +48,40 @@ DATABASES = {
     }
 }
 
+# Cache backend: "file" (default; CACHE_LOCATION is a directory shared by the
+# workers of one host), "redis" (CACHE_LOCATION is a redis:// URL; needs the
+# redis package, and is shared between hosts) or "locmem" (per process, so
+# only for a single process: other workers would serve stale entries until
+# they expire). See networkAnnotation/cache.py.
+CACHE_BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+    "redis": "django.core.cache.backends.redis.RedisCache",
+}
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "file")
+CACHE_TIMEOUT = int(os.getenv("CACHE_TIMEOUT", 600))
+
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS[CACHE_BACKEND],
+        "LOCATION": os.getenv(
+            "CACHE_LOCATION",
+            {
+                "locmem": "networkannotation",
+                "file": str(BASE_DIR / ".cache"),
+                "redis": "redis://localhost:6379",
+            }[CACHE_BACKEND],
+        ),
+        "TIMEOUT": CACHE_TIMEOUT,
+        "KEY_PREFIX": "na",
+    }
+}
+
+# Broker of the live canvas updates, see networkAnnotation/live.py
+LIVE_EVENTS_BROKER = os.getenv(
+    "LIVE_EVENTS_BROKER", "networkAnnotation.live.PostgresBroker"
+)
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -55,6 +89,7 @@ INSTALLED_APPS = [
     "apps.users.apps.UsersConfig",
     "apps.library.apps.LibraryConfig",
     "apps.annotation.apps.AnnotationConfig",
+    "apps.diagnostics.apps.DiagnosticsConfig",
     "colorfield",
     "django.contrib.admin",
     "django.contrib.auth",
@@ -62,6 +97,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "tailwind",
     "theme",
     "crispy_forms",
@@ -76,10 +112,34 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # Staff-triggered request profiles, see apps/diagnostics/middleware.py
+    "apps.diagnostics.middleware.ProfilerMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Query counts, DB time and N+1 warnings per request, see
+# networkAnnotation/instrumentation.py
+QUERY_INSTRUMENTATION = os.getenv("QUERY_INSTRUMENTATION", "1") == "1"
+# A query shape run this many times in one request is logged as an N+1
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", 5))
+
+if QUERY_INSTRUMENTATION:
+    MIDDLEWARE.insert(0, "networkAnnotation.instrumentation.QueryInstrumentationMiddleware")
+
+# Prometheus metrics at /metrics, see networkAnnotation/metrics.py. With
+# several worker processes PROMETHEUS_MULTIPROC_DIR must be set too.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Bearer token scrapers must send; /metrics is open when empty, so set it in
+# production
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(
+        1 if QUERY_INSTRUMENTATION else 0,
+        "networkAnnotation.metrics.MetricsMiddleware",
+    )
+
 if DEBUG:
     INSTALLED_APPS += ["django_browser_reload"]
     MIDDLEWARE += ["django_browser_reload.middleware.BrowserReloadMiddleware"]
@@ -152,5 +212,23 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 LOGIN_REDIRECT_URL = "projects:list"
 LOGOUT_REDIRECT_URL = "projects:list"
 
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "plain": {"format": "%(asctime)s %(levelname)s %(name)s %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "plain"},
+    },
+    "loggers": {
+        "networkAnnotation.queries": {
+            "handlers": ["console"],
+            "level": os.getenv("QUERY_LOG_LEVEL", "INFO"),
+            "propagate": False,
+        },
+    },
+}
+
 CRISPY_ALLOWED_TEMPLATE_PACKS = "tailwind"
 CRISPY_TEMPLATE_PACK = "tailwind"
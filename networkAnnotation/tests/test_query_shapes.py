@@ -0,0 +1,33 @@
+# tests/test_query_shapes.py
+from networkAnnotation.instrumentation import RequestQueries, normalize_sql
+
+
+def test_normalize_sql_replaces_literals():
+    assert normalize_sql("SELECT * FROM t WHERE a = 'x''y' AND b = 12.5 LIMIT 21") == (
+        "SELECT * FROM t WHERE a = ? AND b = ? LIMIT ?"
+    )
+    # Digits inside identifiers stay
+    assert normalize_sql('SELECT "t1"."col2" FROM t1') == 'SELECT "t1"."col2" FROM t1'
+
+
+def test_normalize_sql_collapses_lists():
+    assert normalize_sql("SELECT 1 FROM t WHERE id IN (%s, %s, %s)") == normalize_sql(
+        "SELECT 1 FROM t WHERE id IN (%s)"
+    )
+    assert normalize_sql("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)") == (
+        "INSERT INTO t (a, b) VALUES (%s, %s), ..."
+    )
+    assert normalize_sql("SELECT a\n   FROM t") == "SELECT a FROM t"
+
+
+def test_repeated_shapes():
+    queries = RequestQueries()
+    for i in range(6):
+        queries.record(f"SELECT * FROM entitytype WHERE id = {i}", 0.001)
+    queries.record("SELECT * FROM entity", 0.002)
+    assert queries.count == 7
+    repeated = queries.repeated(5)
+    assert [(r["sql"], r["count"]) for r in repeated] == [
+        ("SELECT * FROM entitytype WHERE id = ?", 6)
+    ]
+    assert queries.repeated(7) == []
@@ -21,6 +21,8 @@ from django.contrib import admin
 from django.urls import path, include
 from django.views.generic.base import RedirectView
 
+from networkAnnotation.metrics import metrics_view
+
 urlpatterns = [
     path("", RedirectView.as_view(url="/projects/")),
     path("admin/", admin.site.urls),
@@ -30,6 +32,8 @@ urlpatterns = [
     path("", include("apps.library.urls")),
     path("", include("apps.annotation.urls")),
 ]
+if settings.METRICS_ENABLED:
+    urlpatterns.append(path("metrics", metrics_view, name="metrics"))
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 
 if settings.DEBUG: